@@ -0,0 +1,356 @@
+"""Moves old orders out of the main database into per-period archive files.
+
+    python archive.py run --before 2023-01-01 [--db order_system.db] [--period year] [--vacuum]
+    python archive.py list
+    python archive.py find 000123
+
+Orders dated before the cutoff are copied, period by period, into
+"<db name>_archive_<period>.db" next to the main database (for example
+order_system_archive_2022.db), then deleted from the main database. The
+main file then only holds recent orders, so the pages the UI reads stay in
+cache. Undated orders are never archived. The order with the highest
+order_id is also kept, so SQLite never hands its id out again.
+
+Each period moves in two transactions: the copy commits in the archive file
+first, then the delete commits in the main file, and only deletes orders the
+archive already holds. SQLite does not commit attached WAL databases
+atomically together, so this ordering is what makes the move safe. After a
+crash between the two, an order is in both files until the next run
+finishes the move; the union views below skip such copies.
+
+The numbers of archived orders are recorded in the main database's
+archived_order_numbers table, so they are not used for new orders. An order
+whose number an archive already holds for a different order is not moved;
+such clashes are reported instead.
+
+The sales summary tables are left alone and keep covering archived orders.
+Archived orders drop out of the search index.
+
+archived_view() attaches the archives a date range needs to a pooled
+connection and defines TEMP views all_order_header and all_order_detail,
+the main tables UNION ALL the archived ones. Everything else reads the main
+database only, so archived orders are found with "find" here and exported
+with export.py --include-archives.
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+from database import Database, DEFAULT_DB_PATH
+
+HEADER_COLUMNS = ("order_id", "order_number", "customer_ref", "order_date", "total_cents", "idempotency_key")
+DETAIL_COLUMNS = ("detail_id", "order_id", "product_id", "quantity", "discount", "price_cents", "subtotal_cents")
+
+# Length of the order_date prefix naming each kind of period
+PERIODS = {"year": 4, "month": 7}
+
+# Only well-formed dates are archived
+DATED = "order_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'"
+
+_PERIOD_NAME = re.compile(r"_archive_(\d{4}(?:-\d{2})?)\.db$")
+
+
+def archive_path(db_path, period):
+    root, _ = os.path.splitext(db_path)
+    return f"{root}_archive_{period}.db"
+
+
+def archive_files(db_path):
+    """{period: path} of the archives that exist for db_path, oldest first."""
+    root, _ = os.path.splitext(db_path)
+    found = {}
+    for path in glob.glob(glob.escape(root) + "_archive_*.db"):
+        match = _PERIOD_NAME.search(path)
+        if match:
+            found[match.group(1)] = path
+    return dict(sorted(found.items()))
+
+
+def _create_archive_schema(conn, alias):
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {alias}.order_header
+                    (order_id INTEGER PRIMARY KEY,
+                     order_number TEXT NOT NULL,
+                     customer_ref TEXT,
+                     order_date DATE,
+                     total_cents INTEGER,
+                     idempotency_key TEXT)''')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {alias}.order_detail
+                    (detail_id INTEGER PRIMARY KEY,
+                     order_id INTEGER,
+                     product_id INTEGER,
+                     quantity INTEGER,
+                     discount REAL,
+                     price_cents INTEGER,
+                     subtotal_cents INTEGER)''')
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {alias}.idx_order_header_number ON order_header (order_number)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_order_header_date ON order_header (order_date, order_id)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_order_detail_order ON order_detail (order_id)")
+
+
+def _archivable(length, prefix=""):
+    # Orders of one period that are due, keeping the highest order_id;
+    # parameters (before, period)
+    return (f"{prefix}{DATED} AND {prefix}order_date < ? AND substr({prefix}order_date, 1, {length}) = ?"
+            f" AND {prefix}order_id < (SELECT MAX(order_id) FROM main.order_header)")
+
+
+def due_periods(conn, before, period="year"):
+    """{period: orders} still in the main database and dated before the cutoff."""
+    length = PERIODS[period]
+    return dict(conn.execute(f"""SELECT substr(order_date, 1, {length}), COUNT(*)
+                                 FROM main.order_header
+                                 WHERE {DATED} AND order_date < ?
+                                   AND order_id < (SELECT MAX(order_id) FROM main.order_header)
+                                 GROUP BY 1 ORDER BY 1""", (before,)).fetchall())
+
+
+def _register_numbers(conn, period):
+    # Caller holds the write lock with the archive attached as "archive"
+    conn.execute("""INSERT OR IGNORE INTO main.archived_order_numbers (order_number, period)
+                    SELECT order_number, ? FROM archive.order_header""", (period,))
+
+
+def _move_period(conn, path, before, period, length):
+    """Move one period's orders; returns (orders moved, numbers that clash
+    with a different order already in the archive)."""
+    header = ", ".join(HEADER_COLUMNS)
+    detail = ", ".join(DETAIL_COLUMNS)
+    # Due, and not clashing with another archived order's number
+    where = _archivable(length) + """ AND NOT EXISTS (
+        SELECT 1 FROM archive.order_header a
+        WHERE a.order_number = main.order_header.order_number AND a.order_id != main.order_header.order_id)"""
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        # 1. Copy and commit in the archive file. Re-copying after an
+        #    interrupted run just overwrites the same rows.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _create_archive_schema(conn, "archive")
+            clashes = [row[0] for row in conn.execute(
+                f"""SELECT order_number FROM main.order_header
+                    WHERE {_archivable(length)} AND NOT ({where})
+                    ORDER BY order_id""", (before, period, before, period))]
+            conn.execute(f"""INSERT OR REPLACE INTO archive.order_detail ({detail})
+                             SELECT {", ".join("od." + c for c in DETAIL_COLUMNS)}
+                             FROM main.order_detail od
+                             WHERE od.order_id IN (SELECT order_id FROM main.order_header WHERE {where})""",
+                         (before, period))
+            conn.execute(f"""INSERT INTO archive.order_header ({header})
+                             SELECT {header} FROM main.order_header WHERE {where}
+                             ON CONFLICT (order_id) DO UPDATE SET
+                                 {", ".join(f"{c} = excluded.{c}" for c in HEADER_COLUMNS[1:])}""",
+                         (before, period))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        # 2. Delete from the main file only what the archive now holds
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            moved = f"""SELECT h.order_id FROM main.order_header h
+                        WHERE {_archivable(length, "h.")}
+                          AND EXISTS (SELECT 1 FROM archive.order_header a
+                                      WHERE a.order_id = h.order_id AND a.order_number = h.order_number)"""
+            conn.execute(f"DELETE FROM main.order_detail WHERE order_id IN ({moved})", (before, period))
+            count = conn.execute(f"DELETE FROM main.order_header WHERE order_id IN ({moved})",
+                                 (before, period)).rowcount
+            _register_numbers(conn, period)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+    return count, clashes
+
+
+def _register_archive(conn, path, period):
+    # Records the numbers of an archive written before they were tracked
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _register_numbers(conn, period)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+
+def archive_orders(db, before, period="year", vacuum=False):
+    """Move orders dated before the cutoff into per-period archives.
+
+    Returns ({period: orders moved}, {period: [order numbers not moved
+    because the archive holds another order under them]}).
+    """
+    length = PERIODS[period]
+    moved = {}
+    clashes = {}
+    with db.connection() as conn:
+        registered = {row[0] for row in conn.execute("SELECT DISTINCT period FROM archived_order_numbers")}
+        for key, path in archive_files(db.path).items():
+            if key not in registered:
+                _register_archive(conn, path, key)
+        for key in due_periods(conn, before, period):
+            moved[key], clashed = _move_period(conn, archive_path(db.path, key), before, key, length)
+            if clashed:
+                clashes[key] = clashed
+        if vacuum and moved:
+            # Give the freed pages back to the file system
+            conn.execute("VACUUM")
+        conn.execute("PRAGMA optimize")
+    return moved, clashes
+
+
+def _overlaps(period, date_from, date_to):
+    length = len(period)
+    return ((date_from is None or period >= date_from[:length])
+            and (date_to is None or period <= date_to[:length]))
+
+
+def attach_archives(conn, db_path, date_from=None, date_to=None):
+    """Attach the archives covering [date_from, date_to] and create the TEMP
+    union views over them; returns the attached schema names."""
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    periods = [(key, path) for key, path in archive_files(db_path).items()
+               if _overlaps(key, date_from, date_to)]
+    if len(periods) > limit:
+        raise ValueError(f"{len(periods)} archives cover that range, at most {limit} can be attached; "
+                         "narrow the dates")
+
+    aliases = []
+    try:
+        for key, path in periods:
+            alias = "archive_" + key.replace("-", "_")
+            conn.execute("ATTACH DATABASE ? AS " + alias, (path,))
+            aliases.append(alias)
+    except BaseException:
+        detach_archives(conn, aliases)
+        raise
+
+    for view, table, columns in (("all_order_header", "order_header", HEADER_COLUMNS),
+                                 ("all_order_detail", "order_detail", DETAIL_COLUMNS)):
+        selects = [f"SELECT {', '.join(columns)}, NULL AS archive FROM main.{table}"]
+        for alias in aliases:
+            # Orders still in main after an interrupted move are shown once
+            selects.append(f"""SELECT {', '.join('a.' + c for c in columns)}, '{alias}' FROM {alias}.{table} a
+                               WHERE NOT EXISTS (SELECT 1 FROM main.order_header h
+                                                 WHERE h.order_id = a.order_id)""")
+        conn.execute(f"DROP VIEW IF EXISTS temp.{view}")
+        conn.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(selects))
+    return aliases
+
+
+def detach_archives(conn, aliases):
+    conn.execute("DROP VIEW IF EXISTS temp.all_order_header")
+    conn.execute("DROP VIEW IF EXISTS temp.all_order_detail")
+    for alias in aliases:
+        conn.execute("DETACH DATABASE " + alias)
+
+
+@contextmanager
+def archived_view(db, date_from=None, date_to=None):
+    """A pooled connection with all_order_header / all_order_detail defined
+    over the main database and the archives covering the date range."""
+    with db.connection() as conn:
+        aliases = attach_archives(conn, db.path, date_from, date_to)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            detach_archives(conn, aliases)
+
+
+def _read_order(conn, order_number):
+    row = conn.execute(f"SELECT {', '.join(HEADER_COLUMNS)} FROM order_header WHERE order_number = ?",
+                       (order_number,)).fetchone()
+    if row is None:
+        return None
+    order = dict(zip(HEADER_COLUMNS, row))
+    order["lines"] = [dict(zip(DETAIL_COLUMNS, line)) for line in conn.execute(
+        f"SELECT {', '.join(DETAIL_COLUMNS)} FROM order_detail WHERE order_id = ? ORDER BY detail_id",
+        (order["order_id"],))]
+    return order
+
+
+def find_order(db, order_number):
+    """The order (header dict plus lines) from the main database or, failing
+    that, the newest archive holding it; None if there is none."""
+    with db.connection() as conn:
+        order = _read_order(conn, order_number)
+    if order is not None:
+        order["archive"] = None
+        return order
+    for key, path in reversed(archive_files(db.path).items()):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            order = _read_order(conn, order_number)
+        finally:
+            conn.close()
+        if order is not None:
+            order["archive"] = key
+            return order
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old orders into per-period databases")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="move orders dated before a cutoff")
+    run.add_argument("--before", required=True, help="cutoff date, YYYY-MM-DD (not archived)")
+    run.add_argument("--period", choices=sorted(PERIODS), default="year")
+    run.add_argument("--vacuum", action="store_true", help="shrink the main file afterwards")
+
+    sub.add_parser("list", help="show the archives and their order counts")
+
+    find = sub.add_parser("find", help="look an order up in the main database and the archives")
+    find.add_argument("order_number")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        db.migrate()
+        if args.command == "run":
+            started = time.perf_counter()
+            moved, clashes = archive_orders(db, args.before, args.period, args.vacuum)
+            result = {"moved": moved, "clashes": clashes, "elapsed": round(time.perf_counter() - started, 3)}
+            if clashes:
+                print("Some orders were not archived: their numbers are taken by archived orders. "
+                      "Renumber them and run again.", file=sys.stderr)
+        elif args.command == "list":
+            result = {}
+            for key, path in archive_files(db.path).items():
+                conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+                try:
+                    orders, first, last = conn.execute(
+                        "SELECT COUNT(*), MIN(order_date), MAX(order_date) FROM order_header").fetchone()
+                finally:
+                    conn.close()
+                result[key] = {"path": path, "orders": orders, "first": first, "last": last,
+                               "bytes": os.path.getsize(path)}
+        else:
+            result = find_order(db, args.order_number)
+            if result is None:
+                print(f"Order {args.order_number} not found", file=sys.stderr)
+                return 1
+    finally:
+        db.close()
+
+    print(json.dumps(result, indent=2, default=str))
+    return 1 if args.command == "run" and result["clashes"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,525 @@
+"""Reproducible benchmarks for the order pipeline.
+
+Builds a synthetic catalog and order history in a scratch database, times
+the core paths and prints the results as JSON:
+
+    python benchmark.py                      # small preset
+    python benchmark.py --preset full        # 10k products, 1M orders
+    python benchmark.py --orders 50000 --output bench.json
+
+Pass --db PATH to build the dataset once and reuse it on later runs.
+
+The concurrent_writers section doubles as a stress test of order number
+allocation: --writers processes save orders at once with allocated numbers
+and idempotency keys, replaying some keys, and the run exits non-zero if
+any number is duplicated or skipped or a replay created a second order.
+
+The capture section times save_order in capture mode (order_journal.py),
+with the journal fsynced on a timer and, for comparison, on every submit;
+compare it with save_order, the direct path. It also checks that a
+duplicate captured order is kept as a reject, and crash recovery: orders
+journaled by a committer that never ran, plus a torn last line, must all
+be saved exactly once by the next start().
+
+The cold_start section launches fresh interpreters: one imports the app and
+does its background startup work (migrate, load the catalog), and one runs
+order_system.py --startup-report to time the window itself. The latter is
+reported as skipped when Tk cannot open a display. tests/test_startup.py
+holds the same measurements to fixed budgets.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import migrations
+import order_rules
+from catalog import ProductCatalog
+from database import Database
+from order_journal import OrderCapture
+from order_service import OrderService
+
+PRESETS = {
+    "small": {"products": 1000, "orders": 10000},
+    "medium": {"products": 10000, "orders": 100000},
+    "full": {"products": 10000, "orders": 1000000},
+}
+
+WORDS = ["BATTERY", "CHARGER", "CABLE", "ADAPTER", "CASE", "LAMP", "SWITCH", "FUSE", "PLUG", "SOCKET"]
+
+
+def generate_dataset(db, products, orders, min_lines=5, max_lines=20, seed=1, chunk_orders=5000):
+    """Fill db with products and orders; returns the generated order count."""
+    rng = random.Random(seed)
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO products (name, price_cents) VALUES (?, ?)",
+                         ((f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i:06d}", rng.randint(1, 2000) * 5000)
+                          for i in range(products)))
+    catalog = ProductCatalog(db)
+    catalog.refresh()
+    items_pool = catalog.products()
+
+    start = date(2015, 1, 1)
+    days = (date(2025, 1, 1) - start).days
+    chunk = []
+    for n in range(orders):
+        items = []
+        for _ in range(rng.randint(min_lines, max_lines)):
+            product = rng.choice(items_pool)
+            qty = rng.randint(1, 20)
+            discount = rng.choice((0, 0, 0, 5, 10, 15))
+            items.append({
+                "product_id": product.id,
+                "quantity": qty,
+                "price": product.price,
+                "discount": discount,
+                "subtotal": order_rules.line_subtotal(qty, product.price, discount),
+            })
+        order_date = (start + timedelta(days=rng.randrange(days))).isoformat()
+        chunk.append((f"SYN-{n:08d}", f"CUST-{rng.randrange(orders // 10 + 1):06d}", order_date, items))
+        if len(chunk) >= chunk_orders:
+            db.insert_orders(chunk)
+            chunk = []
+    if chunk:
+        db.insert_orders(chunk)
+    return orders
+
+
+def timed(func, repeat=1):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+    return samples, result
+
+
+def summarize(samples, **extra):
+    summary = {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+    if len(samples) >= 20:
+        summary["p95_ms"] = round(statistics.quantiles(samples, n=20)[-1] * 1000, 3)
+    summary.update(extra)
+    return summary
+
+
+def open_and_migrate(path):
+    # What a freshly started application does before showing its window
+    db = Database(path)
+    db.migrate()
+    db.close()
+
+
+def bench_startup(path, repeat):
+    samples, _ = timed(lambda: open_and_migrate(path), repeat)
+    return summarize(samples)
+
+
+# Run in a fresh interpreter: import the app, then do what its background
+# startup does (migrate, load the catalog)
+COLD_START_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import order_system
+imported = time.perf_counter()
+from catalog import ProductCatalog
+from database import Database
+db = Database(sys.argv[1])
+db.migrate()
+ProductCatalog(db).refresh()
+db.close()
+print(json.dumps({"import": imported - started, "database": time.perf_counter() - imported}))
+"""
+
+
+def bench_cold_start(path, repeat):
+    # Whole-process startup. The window itself is timed with
+    # order_system.py --startup-report when a display is available.
+    here = os.path.dirname(os.path.abspath(__file__))
+    process, imports, database = [], [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT, path], cwd=here,
+                             capture_output=True, text=True, check=True).stdout
+        process.append(time.perf_counter() - started)
+        timings = json.loads(out)
+        imports.append(timings["import"])
+        database.append(timings["database"])
+    result = {"process": summarize(process), "import": summarize(imports), "database": summarize(database)}
+
+    gui_process, window, ready = [], [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run = subprocess.run([sys.executable, "order_system.py", path, "--startup-report"], cwd=here,
+                             capture_output=True, text=True, timeout=120)
+        if run.returncode:
+            lines = run.stderr.strip().splitlines()
+            result["gui"] = {"skipped": lines[-1] if lines else f"exit status {run.returncode}"}
+            break
+        gui_process.append(time.perf_counter() - started)
+        timings = json.loads(run.stdout)
+        window.append(timings["window"] / 1000)
+        ready.append(timings["ready"] / 1000)
+    else:
+        result["gui"] = {"process": summarize(gui_process), "window": summarize(window),
+                         "ready": summarize(ready)}
+    return result
+
+
+def bench_load_products(db, repeat):
+    def full_load():
+        catalog = ProductCatalog(db)
+        catalog.refresh()
+        return catalog
+    samples, catalog = timed(full_load, repeat)
+    noop, _ = timed(catalog.refresh, repeat)
+
+    # A refresh that reloads everything, as after a delete, then the first
+    # type-ahead search on the new indexes
+    searching = ProductCatalog(db, index_search=True)
+    searching.refresh()
+    reloads, first_searches = [], []
+    for _ in range(repeat):
+        searching.deletions = None
+        reloads.append(timed(searching.refresh)[0][0])
+        first_searches.append(timed(lambda: searching.search("lam"))[0][0])
+    return {
+        "full": summarize(samples, rows=len(catalog)),
+        "unchanged_refresh": summarize(noop),
+        "reload_with_search": summarize(reloads),
+        "first_search": summarize(first_searches),
+    }
+
+
+def bench_listing(db, repeat, pages=50, page_size=100):
+    first, rows = timed(lambda: db.fetch_orders_page(None, page_size), repeat)
+
+    def walk():
+        after = None
+        fetched = 0
+        for _ in range(pages):
+            page = db.fetch_orders_page(after, page_size)
+            fetched += len(page)
+            if len(page) < page_size:
+                break
+            after = (page[-1][3], page[-1][0])
+        return fetched
+    deep, fetched = timed(walk, repeat)
+    return {
+        "first_page": summarize(first, rows=len(rows)),
+        "walk_pages": summarize(deep, pages=pages, rows=fetched),
+    }
+
+
+# First page of an order search, as ViewOrders runs it
+SEARCHES = {
+    "number_exact": {"text": "SYN-00001234"},
+    "number_fragment": {"text": "1234"},
+    "customer": {"text": "CUST-000042"},
+    "broad_text": {"text": "SYN-000"},
+    "date_range": {"date_from": "2020-01-01", "date_to": "2020-01-31"},
+    "amount_range": {"min_total": "100000", "max_total": "150000"},
+    "product": {"product": "LAMP SWITCH"},
+    "combined": {"text": "CUST-00", "date_from": "2022-01-01", "min_total": "50000"},
+}
+
+
+def bench_search(db, repeat, page_size=100):
+    service = OrderService(db)
+    results = {}
+    for name, fields in SEARCHES.items():
+        filters = service.order_filters(**fields)
+        samples, rows = timed(lambda: service.list_orders(limit=page_size, filters=filters), repeat)
+        results[name] = summarize(samples, rows=len(rows))
+    return results
+
+
+def bench_details(db, order_count, samples_wanted, seed):
+    rng = random.Random(seed)
+    numbers = [f"SYN-{rng.randrange(order_count):08d}" for _ in range(samples_wanted)]
+    samples = []
+    lines = 0
+    for number in numbers:
+        started = time.perf_counter()
+        lines += len(db.fetch_order_details(number))
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, lines_per_order=round(lines / len(numbers), 2))
+
+
+def bench_save_order(db, count, seed):
+    service = OrderService(db)
+    service.catalog.refresh()
+    names = service.catalog.names()
+    rng = random.Random(seed)
+    run = f"{time.time_ns():x}"
+    samples = []
+    started = time.perf_counter()
+    for n in range(count):
+        lines = [{"product": rng.choice(names), "quantity": rng.randint(1, 10), "discount": 0}
+                 for _ in range(rng.randint(1, 10))]
+        t = time.perf_counter()
+        service.create_order(f"BENCH-{run}-{n}", "BENCH", date.today().isoformat(), lines)
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    return summarize(samples, orders=count, orders_per_second=round(count / elapsed, 1))
+
+
+def bench_pricing(db, lookups, seed):
+    # Point-in-time lookups against the catalog's interval index, and one
+    # transaction repricing every product (far in the future, so the
+    # dataset's own prices are untouched and reruns just overwrite it)
+    service = OrderService(db)
+    service.catalog.refresh()
+    products = service.catalog.products()
+    rng = random.Random(seed)
+    days = [(date(2015, 1, 1) + timedelta(days=rng.randrange(4000))).isoformat() for _ in range(lookups)]
+    ids = [rng.choice(products).id for _ in range(lookups)]
+    started = time.perf_counter()
+    for product_id, day in zip(ids, days):
+        service.catalog.price_on(product_id, day)
+    lookup_elapsed = time.perf_counter() - started
+
+    samples, count = timed(lambda: service.reprice_products([(p.id, service.catalog.price_on(p.id) * 2) for p in products], "2999-01-01"))
+    return summarize(samples, products=count, lookups=lookups,
+                     lookup_us=round(lookup_elapsed / lookups * 1e6, 3))
+
+
+def bench_capture(db, count, seed):
+    journal = os.path.join(os.path.dirname(os.path.abspath(db.path)), f"capture-{time.time_ns():x}.journal")
+    service = OrderService(db)
+    service.catalog.refresh()
+    names = service.catalog.names()
+    rng = random.Random(seed)
+
+    def items():
+        return [service.build_item(rng.choice(names), rng.randint(1, 10), 0) for _ in range(rng.randint(1, 10))]
+
+    def run(sync_interval):
+        capture = OrderCapture(db, journal, sync_interval=sync_interval)
+        capture.start()
+        samples = []
+        try:
+            for _ in range(count):
+                order_items = items()
+                t = time.perf_counter()
+                capture.submit("CAPTURE", date.today().isoformat(), order_items)
+                samples.append(time.perf_counter() - t)
+            capture.flush()
+            stats = capture.stats()
+        finally:
+            capture.close()
+        return summarize(samples, orders=count, committed=stats["committed"], batches=stats["batches"],
+                         average_batch=stats["average_batch"], journal_fsyncs=stats["journal_fsyncs"],
+                         orders_per_second=stats["orders_per_second"])
+
+    # Default, fsync on a timer; then an fsync per submit for comparison
+    result = run(OrderCapture.SYNC_INTERVAL)
+    result["fsync_each_submit"] = run(None)
+
+    # Two orders captured under one number: the second is rejected at commit
+    # and must be on record under its key
+    capture = OrderCapture(db, journal)
+    capture.start()
+    number = f"CAPDUP-{time.time_ns():x}"
+    duplicate_keys = [capture.submit("DUP", date.today().isoformat(), items(), number) for _ in range(2)]
+    capture.flush()
+    capture.close()
+    statuses = [OrderService(db).capture_status(key)["status"] for key in duplicate_keys]
+
+    # Recovery: journal orders without committing them, tear the last line,
+    # then let a fresh capture replay the file
+    crashed = OrderCapture(db, journal)
+    keys = [crashed.submit("RECOVER", date.today().isoformat(), items()) for _ in range(50)]
+    crashed.journal._file.write(b"0badc0de {\"key\": \"torn")
+    crashed.journal.close()
+    recovered = OrderCapture(db, journal)
+    replayed = recovered.start()
+    recovered.close()
+    again = OrderCapture(db, journal)
+    replayed_again = again.start()
+    again.close()
+    os.remove(journal)
+
+    with db.connection() as conn:
+        placeholders = ",".join("?" * len(keys))
+        stored = conn.execute(f"SELECT COUNT(*) FROM order_header WHERE idempotency_key IN ({placeholders})",
+                              keys).fetchone()[0]
+    result.update(replayed=replayed, recovered=stored, duplicate_statuses=statuses,
+                  ok=result["committed"] == count and result["fsync_each_submit"]["committed"] == count
+                  and replayed == len(keys) and stored == len(keys) and replayed_again == 0
+                  and statuses == ["committed", "rejected"])
+    return result
+
+
+def stress_writer(path, writer, count, run, seed):
+    # Runs in its own process: save count orders, replaying every fifth key
+    db = Database(path)
+    service = OrderService(db)
+    service.catalog.refresh()
+    names = service.catalog.names()
+    rng = random.Random(seed + writer)
+    saved = []
+    replays_ok = True
+    samples = []
+    try:
+        for n in range(count):
+            key = f"{run}-{writer}-{n}"
+            lines = [{"product": rng.choice(names), "quantity": rng.randint(1, 10), "discount": 0}
+                     for _ in range(rng.randint(1, 5))]
+            t = time.perf_counter()
+            order = service.create_order("", f"STRESS-{run}", date.today().isoformat(), lines, key)
+            samples.append(time.perf_counter() - t)
+            saved.append(order["order_number"])
+            if n % 5 == 0:
+                again = service.create_order("", f"STRESS-{run}", date.today().isoformat(), lines, key)
+                replays_ok = replays_ok and not again["created"] and again["order_number"] == order["order_number"]
+    finally:
+        db.close()
+    return saved, replays_ok, samples
+
+
+def bench_concurrent_writers(path, writers, count, seed):
+    run = f"{time.time_ns():x}"
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(writers) as pool:
+        results = pool.starmap(stress_writer, [(path, w, count, run, seed) for w in range(writers)])
+    elapsed = time.perf_counter() - started
+
+    numbers = [int(number) for saved, _, _ in results for number in saved]
+    db = Database(path)
+    try:
+        with db.connection() as conn:
+            stored = conn.execute("SELECT COUNT(*) FROM order_header WHERE customer_ref = ?",
+                                  (f"STRESS-{run}",)).fetchone()[0]
+    finally:
+        db.close()
+
+    expected = writers * count
+    duplicates = len(numbers) - len(set(numbers))
+    gaps = (max(numbers) - min(numbers) + 1 - len(set(numbers))) if numbers else 0
+    replays_ok = all(ok for _, ok, _ in results)
+    samples = [sample for _, _, writer_samples in results for sample in writer_samples]
+    return summarize(samples, writers=writers, orders=expected, stored=stored,
+                     duplicates=duplicates, gaps=gaps, replays_ok=replays_ok,
+                     ok=stored == expected and not duplicates and not gaps and replays_ok,
+                     orders_per_second=round(expected / elapsed, 1))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    params = dict(PRESETS[args.preset])
+    if args.products is not None:
+        params["products"] = args.products
+    if args.orders is not None:
+        params["orders"] = args.orders
+    params.update(min_lines=args.min_lines, max_lines=args.max_lines, seed=args.seed)
+
+    workdir = None
+    path = args.db
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix="order-bench-")
+        path = os.path.join(workdir, "bench.db")
+        if args.keep:
+            params["db"] = path
+
+    results = {}
+    try:
+        # First open: migrates the file if it is new
+        samples, _ = timed(lambda: open_and_migrate(path))
+        results["startup_first_open"] = summarize(samples)
+
+        db = Database(path)
+        with db.connection() as conn:
+            existing = conn.execute("SELECT COUNT(*) FROM order_header WHERE order_number LIKE 'SYN-%'").fetchone()[0]
+        if existing:
+            params["orders"] = existing
+        else:
+            samples, _ = timed(lambda: generate_dataset(db, params["products"], params["orders"],
+                                                        args.min_lines, args.max_lines, args.seed))
+            results["generate"] = summarize(samples, orders_per_second=round(params["orders"] / samples[0], 1))
+        with db.connection() as conn:
+            conn.execute("ANALYZE")
+
+        results["startup_migrated"] = bench_startup(path, args.repeat)
+        results["cold_start"] = bench_cold_start(path, args.repeat)
+        results["load_products"] = bench_load_products(db, args.repeat)
+        results["list_orders"] = bench_listing(db, args.repeat)
+        results["search_orders"] = bench_search(db, args.repeat)
+        results["order_details"] = bench_details(db, params["orders"], args.detail_samples, args.seed)
+        results["save_order"] = bench_save_order(db, args.save_orders, args.seed)
+        results["capture"] = bench_capture(db, args.save_orders, args.seed)
+        results["pricing"] = bench_pricing(db, 100000, args.seed)
+        db.close()
+        if args.writers:
+            results["concurrent_writers"] = bench_concurrent_writers(path, args.writers, args.writer_orders,
+                                                                     args.seed)
+    finally:
+        if workdir is not None and not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "order_pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "schema_version": migrations.SCHEMA_VERSION,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "params": params,
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the order pipeline")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    parser.add_argument("--products", type=int)
+    parser.add_argument("--orders", type=int)
+    parser.add_argument("--min-lines", type=int, default=5)
+    parser.add_argument("--max-lines", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--detail-samples", type=int, default=200)
+    parser.add_argument("--save-orders", type=int, default=500)
+    parser.add_argument("--writers", type=int, default=4, help="concurrent writer processes (0 skips)")
+    parser.add_argument("--writer-orders", type=int, default=200, help="orders saved by each writer")
+    parser.add_argument("--db", help="benchmark database (default: a temporary file)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary database")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    writers = report["results"].get("concurrent_writers")
+    failed = (writers is not None and not writers["ok"]) or not report["results"]["capture"]["ok"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Headless bulk import of orders from CSV or JSONL files.
+
+Each input record is one order line:
+
+    order_number, customer_ref, order_date, product, quantity, discount
+
+Lines of the same order must be consecutive. A JSONL record may instead be a
+whole order with its lines under "items". Lines are validated with the same
+rules as the order form. An order with any invalid line is rejected whole:
+all of its lines go to an error file as JSONL, each with the reason, so the
+file can be corrected and imported again.
+
+    python bulk_import.py orders.csv [--db order_system.db] [--chunk-size 5000]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from database import Database, DEFAULT_DB_PATH
+from order_service import OrderService, ValidationError, parse_date
+
+FIELDS = ("order_number", "customer_ref", "order_date", "product", "quantity", "discount")
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.imported_rows = 0
+        self.imported_orders = 0
+        self.rejected_rows = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "imported_rows": self.imported_rows,
+            "imported_orders": self.imported_orders,
+            "rejected_rows": self.rejected_rows,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+        }
+
+
+def read_csv(f):
+    for line_no, record in enumerate(csv.DictReader(f), start=2):
+        yield line_no, record
+
+
+def read_jsonl(f):
+    for line_no, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, {"_error": f"Invalid JSON: {e}", "_raw": line}
+            continue
+        if not isinstance(record, dict):
+            yield line_no, {"_error": "Expected a JSON object", "_raw": line}
+        elif "items" in record:
+            items = record["items"]
+            if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                yield line_no, {"_error": '"items" must be a list of objects', "_raw": line}
+            elif not items:
+                yield line_no, {"_error": "Order has no items", "_raw": line}
+            else:
+                # Whole order per line, flatten into order lines
+                header = {k: record.get(k) for k in ("order_number", "customer_ref", "order_date")}
+                for item in items:
+                    yield line_no, dict(header, **item)
+        else:
+            yield line_no, record
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+class RejectWriter:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, line_no, error, record):
+        if self.file is None:
+            self.file = open(self.path, "w", encoding="utf-8")
+        self.file.write(json.dumps({"line": line_no, "error": error, "record": record}) + "\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class OrderImporter:
+    def __init__(self, db, chunk_size=5000):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.service = OrderService(db)
+        # Loaded once for the whole import
+        self.service.catalog.refresh()
+
+    def build_item(self, record):
+        if record.get("_error"):
+            raise ValidationError(record["_error"])
+        order_number = record.get("order_number")
+        if not order_number:
+            raise ValidationError("Order number is required")
+        # JSONL may give the number as a JSON number
+        self.service.parse_order_header(str(order_number) if isinstance(order_number, int) else order_number,
+                                        record.get("customer_ref"), record.get("order_date"))
+
+        discount = record.get("discount")
+        # Priced as of the order's own date
+        return self.service.build_item(record.get("product"), record.get("quantity"),
+                                       0 if discount in (None, "") else discount, record.get("order_date"))
+
+    def run(self, records, rejects):
+        stats = ImportStats()
+        chunk = []          # (order_number, customer_ref, order_date, items)
+        chunk_sources = []  # [(line_no, record, error), ...] per order in chunk
+        chunk_rows = 0
+        current = None
+        current_sources = []
+
+        def flush():
+            nonlocal chunk, chunk_sources, chunk_rows
+            if not chunk:
+                return
+            skipped = set(self.db.insert_orders(chunk))
+            for index, order in enumerate(chunk):
+                if index in skipped:
+                    reject_order(chunk_sources[index], f"Duplicate order number: {order[0]}")
+                else:
+                    stats.imported_orders += 1
+                    stats.imported_rows += len(order[3])
+            chunk, chunk_sources, chunk_rows = [], [], 0
+
+        def reject_order(sources, reason):
+            for line_no, record, error in sources:
+                rejects.write(line_no, error or reason, record)
+                stats.rejected_rows += 1
+
+        def finish_order():
+            nonlocal current, current_sources, chunk_rows
+            failed = sum(1 for _, _, error in current_sources if error)
+            if failed:
+                reject_order(current_sources, f"Order {current[0]} rejected: {failed} of its lines failed")
+            elif current is not None and current[3]:
+                chunk.append(current)
+                chunk_sources.append(current_sources)
+                chunk_rows += len(current[3])
+            current, current_sources = None, []
+            if chunk_rows >= self.chunk_size:
+                flush()
+
+        for line_no, record in records:
+            stats.rows += 1
+            try:
+                item, error = self.build_item(record), None
+            except ValidationError as e:
+                item, error = None, str(e)
+            if error and (record.get("_error") or not record.get("order_number")):
+                # Belongs to no order, rejected on its own
+                rejects.write(line_no, error, record)
+                stats.rejected_rows += 1
+                continue
+
+            order_number = str(record["order_number"])
+            if current is None or current[0] != order_number:
+                finish_order()
+                try:
+                    order_date = parse_date(record.get("order_date"))
+                except ValidationError:
+                    order_date = None  # the line has failed on it already
+                current = (order_number, record.get("customer_ref"), order_date, [])
+            if item is not None:
+                current[3].append(item)
+            current_sources.append((line_no, record, error))
+
+        finish_order()
+        flush()
+        stats.elapsed = time.perf_counter() - stats.started
+        return stats
+
+
+def import_file(db, path, fmt=None, chunk_size=5000, errors_path=None):
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    rejects = RejectWriter(errors_path or path + ".rejects.jsonl")
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            return OrderImporter(db, chunk_size).run(READERS[fmt](f), rejects)
+    finally:
+        rejects.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import orders from CSV or JSONL")
+    parser.add_argument("path")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--format", choices=sorted(READERS))
+    parser.add_argument("--chunk-size", type=int, default=5000, help="order lines per transaction")
+    parser.add_argument("--errors", help="reject file (default: <path>.rejects.jsonl)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"no such file: {args.path}")
+
+    db = Database(args.db)
+    try:
+        db.migrate()
+        stats = import_file(db, args.path, args.format, args.chunk_size, args.errors)
+    finally:
+        db.close()
+
+    print(json.dumps(stats.as_dict()))
+    return 1 if stats.rejected_rows else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
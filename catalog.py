@@ -0,0 +1,239 @@
+import bisect
+import re
+import threading
+from datetime import date
+from operator import itemgetter
+
+from money import Money
+
+# Name words are split on whitespace and common separators for prefix search
+WORD_SPLIT = re.compile(r"[\s\-_/.,]+")
+
+
+class Product:
+    # price is products.price_cents as last saved; the price in effect on a
+    # given day comes from ProductCatalog.price_on
+    __slots__ = ("id", "name", "price")
+
+    def __init__(self, id, name, price):
+        self.id = id
+        self.name = name
+        self.price = price
+
+    def __repr__(self):
+        return f"Product({self.id!r}, {self.name!r}, {self.price!r})"
+
+
+class ProductCatalog:
+    """In-memory product cache indexed by id and by name.
+
+    refresh() only reads the products changed since the last refresh, using
+    the change counters kept by the products triggers. A delete forces a
+    full reload.
+
+    Price history is held as an interval index, per product the sorted
+    effective_from dates and the price from each, so price_on() answers
+    point-in-time lookups with a bisect. It is reloaded whenever the
+    history changes.
+
+    The search indexes are built on first use. From then on (or from the
+    start, with index_search=True) refresh() rebuilds them along with the
+    other indexes, so a search never pays for a rebuild on the calling thread.
+    """
+
+    def __init__(self, db, index_search=False):
+        self.db = db
+        self.index_search = index_search
+        self.by_id = {}
+        self.by_name = {}
+        self.version = -1
+        self.deletions = None
+        self.price_version = None
+        self.prices = {}    # product id -> ([effective_from, ...], [Money, ...])
+        self._names = None
+        # (name index, word index, substring index), replaced as a whole
+        self._search = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def __iter__(self):
+        return iter(self.products())
+
+    def get(self, product_id):
+        return self.by_id.get(product_id)
+
+    def find(self, name):
+        return self.by_name.get(name)
+
+    def price_on(self, product_id, day=None):
+        """Price of the product on day (YYYY-MM-DD, default today), or None
+        for an unknown product."""
+        history = self.prices.get(product_id)
+        if history is None:
+            product = self.by_id.get(product_id)
+            return product.price if product is not None else None
+        dates, prices = history
+        i = bisect.bisect_right(dates, day or date.today().isoformat()) - 1
+        # Before the first entry the earliest price applies
+        return prices[max(i, 0)]
+
+    def price_history(self, product_id):
+        dates, prices = self.prices.get(product_id, ((), ()))
+        return list(zip(dates, prices))
+
+    def products(self):
+        return sorted(self.by_id.values(), key=lambda p: p.id)
+
+    def names(self):
+        names = self._names
+        if names is None:
+            names = self._names = [p.name for p in self.products()]
+        return names
+
+    def search(self, text, limit=20):
+        """Product names matching text, best first.
+
+        Ranking: exact name, name prefix, word prefix, then (for queries of
+        three or more characters) plain substring matches.
+        """
+        query = text.strip().lower()
+        if not query:
+            return self.names()[:limit]
+
+        name_index, word_index, substring_index = self._search_indexes()
+        results = []
+        seen = set()
+        # Exact names sort first within their prefix range, so one scan covers both
+        for keys, products in (name_index, word_index):
+            i = bisect.bisect_left(keys, query)
+            while i < len(keys) and len(results) < limit and keys[i].startswith(query):
+                product = products[i]
+                if product.id not in seen:
+                    seen.add(product.id)
+                    results.append(product.name)
+                i += 1
+
+        if len(results) < limit and len(query) >= 3:
+            haystack, starts, products = substring_index
+            pos = haystack.find(query)
+            while pos != -1 and len(results) < limit:
+                i = bisect.bisect_right(starts, pos) - 1
+                product = products[i]
+                if product.id not in seen:
+                    seen.add(product.id)
+                    results.append(product.name)
+                # Continue from the start of the next name
+                pos = haystack.find(query, starts[i + 1]) if i + 1 < len(starts) else -1
+        return results
+
+    def _search_indexes(self):
+        indexes = self._search
+        if indexes is None:
+            # Not built yet; refresh() keeps them up to date from now on
+            self.index_search = True
+            by_id = self.by_id
+            indexes = self._build_search_indexes(by_id)
+            if self.by_id is by_id:
+                self._search = indexes
+        return indexes
+
+    def _build_search_indexes(self, by_id):
+        # Two sorted (keys, products) lists: whole names and the later words of
+        # each name; plus every name joined into one string for substring scans
+        names = []
+        words = []
+        for product in by_id.values():
+            name = product.name.lower()
+            names.append((name, product.id, product))
+            if " " in name or not name.isalnum():
+                for word in WORD_SPLIT.split(name)[1:]:
+                    if word:
+                        words.append((word, product.id, product))
+        indexes = []
+        for entries in (names, words):
+            # Stable sort, so equal keys stay in id order
+            entries.sort(key=itemgetter(0))
+            indexes.append(([entry[0] for entry in entries], [entry[2] for entry in entries]))
+
+        starts = []
+        offset = 0
+        for name, _, _ in names:
+            starts.append(offset)
+            offset += len(name) + 1
+        indexes.append(("\n".join(name for name, _, _ in names), starts, indexes[0][1]))
+        return tuple(indexes)
+
+    def refresh(self):
+        """Pull changes from the database; returns True if anything changed.
+
+        Safe to call from a worker thread: changes are applied to copies of
+        the indexes, which then replace the live ones in one assignment.
+        """
+        with self._lock:
+            version, deletions, price_version = self.db.fetch_product_counters()
+            if price_version != self.price_version:
+                self.prices = self._build_price_index(self.db.fetch_price_history())
+                self.price_version = price_version
+                prices_changed = True
+            else:
+                prices_changed = False
+            if version == self.version and deletions == self.deletions:
+                return prices_changed
+
+            if deletions != self.deletions:
+                by_id = {}
+                by_name = {}
+                since = -1
+            else:
+                by_id = dict(self.by_id)
+                by_name = dict(self.by_name)
+                since = self.version
+
+            renamed = False
+            for product_id, name, price_cents, _ in self.db.fetch_products_changed_since(since):
+                previous = by_id.get(product_id)
+                product = by_id[product_id] = Product(product_id, name, Money(price_cents))
+                if previous is not None:
+                    if previous.name != name:
+                        renamed = True
+                    elif by_name.get(name) is previous:
+                        by_name[name] = product
+                        continue
+                # Duplicate names resolve to the lowest id, like the old linear search
+                current = by_name.get(name)
+                if current is None or current.id > product_id:
+                    by_name[name] = product
+
+            if renamed:
+                by_name = self._build_name_index(by_id)
+
+            names = search = None
+            if self.index_search:
+                names = [p.name for p in sorted(by_id.values(), key=lambda p: p.id)]
+                search = self._build_search_indexes(by_id)
+
+            self.by_id, self.by_name = by_id, by_name
+            self.version = version
+            self.deletions = deletions
+            self._names = names
+            self._search = search
+            return True
+
+    def _build_price_index(self, rows):
+        # rows come ordered by product and date
+        prices = {}
+        for product_id, effective_from, price_cents in rows:
+            history = prices.get(product_id)
+            if history is None:
+                history = prices[product_id] = ([], [])
+            history[0].append(effective_from)
+            history[1].append(Money(price_cents))
+        return prices
+
+    def _build_name_index(self, by_id):
+        by_name = {}
+        for product in sorted(by_id.values(), key=lambda p: p.id):
+            by_name.setdefault(product.name, product)
+        return by_name
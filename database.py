@@ -0,0 +1,720 @@
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import migrations
+from instrumentation import ProfiledConnection
+from money import Money
+import sales_summary
+
+# Money binds to SQLite as its integer cents
+sqlite3.register_adapter(Money, int)
+
+# Database location, overridable with the ORDER_SYSTEM_DB environment variable
+DEFAULT_DB_PATH = os.environ.get("ORDER_SYSTEM_DB", "order_system.db")
+
+# PRAGMAs applied to every pooled connection
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "busy_timeout": 5000,
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+}
+
+# Largest INTEGER PRIMARY KEY SQLite can hand out
+MAX_ROWID = 2 ** 63 - 1
+
+# Longer all-digit order numbers leave the order_number counter alone, so it
+# stays well inside a 64-bit integer
+MAX_SEQUENCE_DIGITS = 18
+
+# Write transactions that still find the database locked once busy_timeout
+# has run out are retried this many times, backing off from BUSY_RETRY_DELAY
+BUSY_RETRIES = 5
+BUSY_RETRY_DELAY = 0.05
+
+SQLITE_BUSY = 5
+SQLITE_LOCKED = 6
+
+
+def is_busy_error(error):
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        # Extended codes carry the primary code in the low byte
+        return code & 0xFF in (SQLITE_BUSY, SQLITE_LOCKED)
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+def retry_busy(func, *args, attempts=BUSY_RETRIES, delay=BUSY_RETRY_DELAY):
+    """Call func(*args), retrying with jittered backoff while SQLite reports busy.
+
+    func must run its own transaction, so a failed attempt has rolled back.
+    """
+    for attempt in range(attempts + 1):
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            if attempt == attempts or not is_busy_error(e):
+                raise
+        time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def _fts_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class ConnectionPool:
+    """Long-lived SQLite connections shared between threads.
+
+    A thread checks out one connection at a time; nested checkouts on the
+    same thread reuse it, so repository methods can call each other freely.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, size=4, pragmas=None, statement_cache_size=256):
+        self.path = path
+        self.size = size
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.statement_cache_size = statement_cache_size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas.get("busy_timeout", 5000) / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            factory=ProfiledConnection,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        # Pool exhausted, wait for another thread to give one back
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.depth = 1
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self._local.depth = 0
+            # Never hand out a connection with a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+class Database:
+    """Repository for all order system tables, backed by a ConnectionPool."""
+
+    def __init__(self, path=DEFAULT_DB_PATH, pool_size=4, pragmas=None):
+        self.path = path
+        self.pool = ConnectionPool(path, size=pool_size, pragmas=pragmas)
+        self._tx = threading.local()
+
+    def connection(self):
+        return self.pool.connection()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        # immediate=True takes the write lock up front, for read-then-write work
+        with self.pool.connection() as conn:
+            depth = getattr(self._tx, "depth", 0)
+            if depth:
+                # Already inside an outer transaction on this thread
+                self._tx.depth = depth + 1
+                try:
+                    yield conn
+                finally:
+                    self._tx.depth = depth
+                return
+            self._tx.depth = 1
+            try:
+                if immediate:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._tx.depth = 0
+
+    def close(self):
+        self.pool.close()
+
+    def migrate(self):
+        # Brings the schema up to date; a no-op on an already-migrated database
+        with self.connection() as conn:
+            return migrations.migrate(conn)
+
+    def rebuild_sales_summaries(self):
+        with self.transaction(immediate=True) as conn:
+            sales_summary.rebuild(conn)
+
+    # Products
+
+    def fetch_products(self):
+        with self.connection() as conn:
+            return conn.execute("SELECT id, name, price_cents FROM products").fetchall()
+
+    def fetch_product_counters(self):
+        # (change counter, delete counter, price history counter) maintained by triggers
+        with self.connection() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM change_counters"))
+            return counters["products"], counters["products_deleted"], counters["prices"]
+
+    def fetch_price_history(self):
+        with self.connection() as conn:
+            return conn.execute("SELECT product_id, effective_from, price_cents FROM product_price_history "
+                                "ORDER BY product_id, effective_from").fetchall()
+
+    def fetch_products_changed_since(self, version):
+        with self.connection() as conn:
+            return conn.execute(
+                "SELECT id, name, price_cents, row_version FROM products WHERE row_version > ? ORDER BY id",
+                (version,)).fetchall()
+
+    def add_product(self, name, price):
+        with self.transaction() as conn:
+            c = conn.execute("INSERT INTO products (name, price_cents) VALUES (?, ?)", (name, price))
+            return c.lastrowid
+
+    def update_product(self, product_id, name, price, effective_from):
+        # A new price (None keeps the current one) applies from effective_from,
+        # which may be in the past or the future
+        with self.transaction() as conn:
+            c = conn.execute("UPDATE products SET name = ? WHERE id = ?", (name, product_id))
+            if c.rowcount and price is not None:
+                self._set_prices(conn, [(product_id, price)], effective_from)
+            return c.rowcount
+
+    def reprice_products(self, prices, effective_from):
+        """Price every (product_id, price) from effective_from on, in one transaction."""
+        with self.transaction(immediate=True) as conn:
+            self._set_prices(conn, prices, effective_from)
+            return len(prices)
+
+    def _set_prices(self, conn, prices, effective_from):
+        conn.executemany("INSERT OR REPLACE INTO product_price_history (product_id, effective_from, price_cents) "
+                         "VALUES (?, ?, ?)", [(product_id, effective_from, price) for product_id, price in prices])
+        # products.price_cents is the price in effect when last repriced; it goes
+        # stale once a future-dated price starts, so readers use the history
+        current = """SELECT h.price_cents FROM product_price_history h
+                     WHERE h.product_id = products.id AND h.effective_from <= date('now', 'localtime')
+                     ORDER BY h.effective_from DESC LIMIT 1"""
+        conn.executemany(f"""UPDATE products SET price_cents = ({current})
+                             WHERE id = ? AND price_cents != COALESCE(({current}), price_cents)""",
+                         [(product_id,) for product_id, _ in prices])
+
+    def delete_product(self, product_id):
+        with self.transaction() as conn:
+            c = conn.execute("DELETE FROM products WHERE id = ?", (product_id,))
+            return c.rowcount
+
+    # Orders
+
+    # Orders are listed newest first, keyed on (order_date, order_id). Rows with
+    # no order_date sort after every dated row and are paged by order_id alone.
+
+    _ORDER_COLUMNS = "SELECT order_id, order_number, customer_ref, order_date, total_cents FROM order_header"
+
+    # Searches that narrow the list to at most this many orders fetch them by id;
+    # broader ones walk the date index and test each row instead
+    SEARCH_CANDIDATES = 5000
+
+    def _text_candidates(self, conn, text):
+        """Ids of the orders whose number or customer ref may contain text.
+
+        Returns None when there are too many for a candidate list to help.
+        Each trigram is first counted up to SEARCH_CANDIDATES, which is cheap,
+        so the final query is driven by the rarest ones instead of loading the
+        huge doclists a phrase query over shared prefixes like "SYN-" needs.
+        """
+        limit = self.SEARCH_CANDIDATES
+        if text.isascii():
+            grams = {text[i:i + 3].lower() for i in range(len(text) - 2)}
+            counts = {}
+            for gram in grams:
+                counts[gram] = conn.execute(
+                    "SELECT COUNT(*) FROM (SELECT 1 FROM order_search WHERE order_search MATCH ? LIMIT ?)",
+                    (_fts_phrase(gram), limit + 1)).fetchone()[0]
+                if not counts[gram]:
+                    return []
+            terms = sorted(grams, key=counts.get)
+            if counts[terms[0]] <= limit:
+                terms = terms[:2]
+            query = " AND ".join(_fts_phrase(term) for term in terms)
+        else:
+            # The tokenizer's case folding may differ from str.lower() here
+            query = _fts_phrase(text)
+        ids = [row[0] for row in conn.execute(
+            "SELECT rowid FROM order_search WHERE order_search MATCH ? LIMIT ?", (query, limit + 1))]
+        return ids if len(ids) <= limit else None
+
+    def _product_candidates(self, conn, product_ids):
+        ids = [row[0] for row in conn.execute(
+            "SELECT DISTINCT order_id FROM order_detail WHERE product_id IN (SELECT value FROM json_each(?)) LIMIT ?",
+            (json.dumps(product_ids), self.SEARCH_CANDIDATES + 1))]
+        return ids if len(ids) <= self.SEARCH_CANDIDATES else None
+
+    def _order_filters(self, conn, filters):
+        """SQL (" AND ..." or "") and params for an order search.
+
+        filters may hold text (a fragment of the order number or customer
+        ref), date_from and date_to (inclusive YYYY-MM-DD), min_total and
+        max_total (cents) and product (a fragment of a product name).
+        """
+        if not filters:
+            return "", []
+        clauses = []
+        params = []
+        text = filters.get("text")
+        if text:
+            candidates = self._text_candidates(conn, text) if len(text) >= 3 else None
+            if candidates is not None:
+                clauses.append("order_id IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps(candidates))
+            # Trigram candidates are a superset, so the fragment is always checked
+            pattern = "%" + _escape_like(text) + "%"
+            clauses.append("(order_number LIKE ? ESCAPE '\\' OR customer_ref LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if filters.get("date_from"):
+            clauses.append("order_date >= ?")
+            params.append(filters["date_from"])
+        if filters.get("date_to"):
+            clauses.append("order_date <= ?")
+            params.append(filters["date_to"])
+        if filters.get("min_total") is not None:
+            clauses.append("total_cents >= ?")
+            params.append(filters["min_total"])
+        if filters.get("max_total") is not None:
+            clauses.append("total_cents <= ?")
+            params.append(filters["max_total"])
+        if filters.get("product"):
+            product_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM products WHERE name LIKE ? ESCAPE '\\'",
+                ("%" + _escape_like(filters["product"]) + "%",))]
+            candidates = self._product_candidates(conn, product_ids) if product_ids else []
+            if candidates is not None:
+                clauses.append("order_id IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps(candidates))
+            else:
+                # The unary + keeps SQLite on idx_order_detail_order for this probe
+                clauses.append("""EXISTS (SELECT 1 FROM order_detail od
+                                          WHERE od.order_id = order_header.order_id
+                                            AND +od.product_id IN (SELECT value FROM json_each(?)))""")
+                params.append(json.dumps(product_ids))
+        return "".join(" AND " + clause for clause in clauses), params
+
+    def fetch_orders_page(self, after=None, limit=100, filters=None):
+        """Return up to limit orders that come after the (order_date, order_id) cursor."""
+        with self.connection() as conn:
+            where, params = self._order_filters(conn, filters)
+            if after is None:
+                rows = conn.execute(f"""
+                    {self._ORDER_COLUMNS}
+                    WHERE order_date IS NOT NULL{where}
+                    ORDER BY order_date DESC, order_id DESC
+                    LIMIT ?
+                """, params + [limit]).fetchall()
+                null_after = None
+            elif after[0] is not None:
+                rows = conn.execute(f"""
+                    {self._ORDER_COLUMNS}
+                    WHERE (order_date, order_id) < (?, ?){where}
+                    ORDER BY order_date DESC, order_id DESC
+                    LIMIT ?
+                """, [after[0], after[1]] + params + [limit]).fetchall()
+                null_after = None
+            else:
+                rows = []
+                null_after = after[1]
+
+            if len(rows) < limit:
+                # Dated rows are exhausted, continue with the undated tail
+                rows += conn.execute(f"""
+                    {self._ORDER_COLUMNS}
+                    WHERE order_date IS NULL AND order_id < ?{where}
+                    ORDER BY order_id DESC
+                    LIMIT ?
+                """, [null_after if null_after is not None else MAX_ROWID] + params
+                     + [limit - len(rows)]).fetchall()
+            return rows
+
+    def fetch_orders_page_before(self, before, limit=100, filters=None):
+        """Return up to limit orders that come just before the cursor, in list order."""
+        with self.connection() as conn:
+            where, params = self._order_filters(conn, filters)
+            rows = []
+            if before[0] is None:
+                rows = conn.execute(f"""
+                    {self._ORDER_COLUMNS}
+                    WHERE order_date IS NULL AND order_id > ?{where}
+                    ORDER BY order_id ASC
+                    LIMIT ?
+                """, [before[1]] + params + [limit]).fetchall()
+                if len(rows) < limit:
+                    rows += conn.execute(f"""
+                        {self._ORDER_COLUMNS}
+                        WHERE order_date IS NOT NULL{where}
+                        ORDER BY order_date ASC, order_id ASC
+                        LIMIT ?
+                    """, params + [limit - len(rows)]).fetchall()
+            else:
+                rows = conn.execute(f"""
+                    {self._ORDER_COLUMNS}
+                    WHERE (order_date, order_id) > (?, ?){where}
+                    ORDER BY order_date ASC, order_id ASC
+                    LIMIT ?
+                """, [before[0], before[1]] + params + [limit]).fetchall()
+            rows.reverse()
+            return rows
+
+    def fetch_orders_stamp(self):
+        # Changes whenever orders are added or removed
+        with self.connection() as conn:
+            return tuple(conn.execute("SELECT MAX(order_id), COUNT(*) FROM order_header").fetchone())
+
+    def fetch_order(self, order_number):
+        with self.connection() as conn:
+            return conn.execute(f"{self._ORDER_COLUMNS} WHERE order_number = ?", (order_number,)).fetchone()
+
+    def fetch_order_by_key(self, idempotency_key):
+        with self.connection() as conn:
+            return conn.execute(f"{self._ORDER_COLUMNS} WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+
+    def fetch_order_details(self, order_number):
+        with self.connection() as conn:
+            return conn.execute("""
+                SELECT products.name, od.quantity, od.price_cents, od.discount, od.subtotal_cents
+                FROM order_detail od
+                JOIN products ON od.product_id = products.id
+                JOIN order_header oh ON od.order_id = oh.order_id
+                WHERE oh.order_number = ?
+            """, (order_number,)).fetchall()
+
+    def fetch_order_details_for(self, order_ids):
+        """Detail rows for many orders at once, each prefixed with its order_id."""
+        rows = []
+        with self.connection() as conn:
+            for start in range(0, len(order_ids), 500):
+                batch = list(order_ids[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows += conn.execute(f"""
+                    SELECT od.order_id, products.name, od.quantity, od.price_cents, od.discount,
+                           od.subtotal_cents
+                    FROM order_detail od
+                    JOIN products ON od.product_id = products.id
+                    WHERE od.order_id IN ({placeholders})
+                    ORDER BY od.order_id, od.detail_id
+                """, batch).fetchall()
+        return rows
+
+    EXPORT_COLUMNS = ("order_id", "order_number", "customer_ref", "order_date", "product_id",
+                      "product", "quantity", "price_cents", "discount", "subtotal_cents")
+
+    def iter_order_lines(self, start=None, end=None, customer_ref=None, batch_size=5000, conn=None):
+        """Yield batches of joined order lines (EXPORT_COLUMNS), oldest order first.
+
+        The query walks idx_order_header_date and idx_order_detail_order, so
+        rows stream off the cursor without a sort; only one batch is held at
+        a time. The connection stays checked out until the generator ends.
+
+        Archived orders are only included given conn from
+        archive.archived_view(), read through its union views; those have
+        no index to walk, so SQLite sorts the rows first.
+        """
+        if conn is not None:
+            yield from self._iter_order_lines(conn, "all_order_header", "all_order_detail",
+                                              start, end, customer_ref, batch_size)
+            return
+        with self.connection() as conn:
+            yield from self._iter_order_lines(conn, "order_header", "order_detail",
+                                              start, end, customer_ref, batch_size)
+
+    def _iter_order_lines(self, conn, header_table, detail_table, start, end, customer_ref, batch_size):
+        clauses = []
+        params = []
+        if start:
+            clauses.append("oh.order_date >= ?")
+            params.append(start)
+        if end:
+            clauses.append("oh.order_date <= ?")
+            params.append(end)
+        if customer_ref is not None:
+            clauses.append("oh.customer_ref = ?")
+            params.append(customer_ref)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+
+        cursor = conn.execute(f"""
+            SELECT oh.order_id, oh.order_number, oh.customer_ref, oh.order_date, od.product_id,
+                   p.name, od.quantity, od.price_cents, od.discount, od.subtotal_cents
+            FROM {header_table} oh
+            JOIN {detail_table} od ON od.order_id = oh.order_id
+            LEFT JOIN products p ON p.id = od.product_id{where}
+            ORDER BY oh.order_date, oh.order_id, od.detail_id
+        """, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    # Captured orders that failed to commit
+
+    _REJECT_COLUMNS = "SELECT idempotency_key, order_number, customer_ref, order_date, error, rejected_at " \
+                      "FROM capture_rejects"
+
+    def record_capture_rejects(self, rejects):
+        """Store (idempotency_key, order_number, customer_ref, order_date, entry JSON, error) rows."""
+        with self.transaction() as conn:
+            conn.executemany("""INSERT OR REPLACE INTO capture_rejects
+                                (idempotency_key, order_number, customer_ref, order_date, entry, error)
+                                VALUES (?, ?, ?, ?, ?, ?)""", rejects)
+
+    def fetch_capture_reject(self, idempotency_key):
+        with self.connection() as conn:
+            return conn.execute(f"{self._REJECT_COLUMNS} WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+
+    def fetch_capture_rejects(self, limit=100):
+        # Newest first
+        with self.connection() as conn:
+            return conn.execute(f"{self._REJECT_COLUMNS} ORDER BY rejected_at DESC LIMIT ?", (limit,)).fetchall()
+
+    def place_order(self, customer_ref, order_date, items, order_number=None, idempotency_key=None):
+        """Save an order and return (order_id, order_number, created).
+
+        With no order_number the next number is taken from the order_number
+        sequence in the same transaction, so numbers are only used up by
+        orders that commit. If an order with idempotency_key already exists
+        it is returned instead, with created False. Busy errors are retried.
+        """
+        return retry_busy(self._place_order, customer_ref, order_date, items, order_number, idempotency_key)
+
+    def _place_order(self, customer_ref, order_date, items, order_number, idempotency_key):
+        with self.transaction(immediate=True) as conn:
+            result = self._insert_order(conn.cursor(), customer_ref, order_date, items, order_number,
+                                        idempotency_key)
+            if result[2]:
+                sales_summary.apply_orders(conn, [(customer_ref, order_date, items)])
+            return result
+
+    def place_orders(self, orders):
+        """Save many (customer_ref, order_date, items, order_number, idempotency_key)
+        orders with one commit for the lot.
+
+        Returns, per order, (order_id, order_number, created) as place_order
+        does, or the sqlite3.IntegrityError it raised; a failing order is
+        rolled back on its own and the rest are still saved.
+        """
+        return retry_busy(self._place_orders, orders)
+
+    def _place_orders(self, orders):
+        results = []
+        saved = []
+        with self.transaction(immediate=True) as conn:
+            c = conn.cursor()
+            for customer_ref, order_date, items, order_number, idempotency_key in orders:
+                c.execute("SAVEPOINT place_order")
+                try:
+                    result = self._insert_order(c, customer_ref, order_date, items, order_number,
+                                                idempotency_key)
+                except sqlite3.IntegrityError as e:
+                    c.execute("ROLLBACK TO place_order")
+                    result = e
+                c.execute("RELEASE place_order")
+                results.append(result)
+                if not isinstance(result, Exception) and result[2]:
+                    saved.append((customer_ref, order_date, items))
+            sales_summary.apply_orders(conn, saved)
+        return results
+
+    def _insert_order(self, c, customer_ref, order_date, items, order_number, idempotency_key):
+        # Caller holds the write lock and applies the sales summaries
+        if idempotency_key is not None:
+            row = c.execute("SELECT order_id, order_number FROM order_header WHERE idempotency_key = ?",
+                            (idempotency_key,)).fetchone()
+            if row is not None:
+                return row[0], row[1], False
+
+        if not order_number:
+            order_number = self._next_order_number(c)
+        elif self._number_archived(c, order_number):
+            raise sqlite3.IntegrityError(f"Order number {order_number} is taken by an archived order")
+        else:
+            self._advance_sequence(c, [order_number])
+
+        total = sum(item["subtotal"] for item in items)
+        c.execute('''INSERT INTO order_header
+                    (order_number, customer_ref, order_date, total_cents, idempotency_key)
+                    VALUES (?, ?, ?, ?, ?)''',
+                  (order_number, customer_ref, order_date, total, idempotency_key))
+        order_id = c.lastrowid
+
+        c.executemany('''INSERT INTO order_detail
+                        (order_id, product_id, quantity, price_cents, discount, subtotal_cents)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                      [(order_id,
+                        item["product_id"],
+                        item["quantity"],
+                        item["price"],
+                        item["discount"],
+                        item["subtotal"]) for item in items])
+        return order_id, order_number, True
+
+    def _next_order_number(self, c):
+        # Caller holds the write lock. Numbers someone typed in by hand are skipped.
+        while True:
+            value = c.execute("UPDATE sequences SET value = value + 1 WHERE name = 'order_number' "
+                              "RETURNING value").fetchone()[0]
+            order_number = str(value)
+            if c.execute("SELECT 1 FROM order_header WHERE order_number = ?", (order_number,)).fetchone() is None \
+                    and not self._number_archived(c, order_number):
+                return order_number
+
+    def _advance_sequence(self, c, order_numbers):
+        # Move the counter past numeric numbers saved by hand or imported, so
+        # _next_order_number never has to walk over them under the write lock
+        highest = max((int(number) for number in order_numbers
+                       if isinstance(number, str) and number.isascii() and number.isdigit()
+                       and len(number) <= MAX_SEQUENCE_DIGITS), default=None)
+        if highest is not None:
+            c.execute("UPDATE sequences SET value = MAX(value, ?) WHERE name = 'order_number'", (highest,))
+
+    def _number_archived(self, c, order_number):
+        return c.execute("SELECT 1 FROM archived_order_numbers WHERE order_number = ?",
+                         (order_number,)).fetchone() is not None
+
+    def order_number_archived(self, order_number):
+        with self.connection() as conn:
+            return self._number_archived(conn, order_number)
+
+    def insert_orders(self, orders):
+        """Insert many (order_number, customer_ref, order_date, items) orders in one transaction.
+
+        Orders whose number already exists, in the database, the archives or
+        earlier in the batch, are skipped; their positions in orders are returned.
+        """
+        with self.transaction(immediate=True) as conn:
+            numbers = [order[0] for order in orders]
+            existing = set()
+            for start in range(0, len(numbers), 500):
+                batch = numbers[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT order_number FROM order_header WHERE order_number IN ({placeholders})", batch))
+                existing.update(row[0] for row in conn.execute(
+                    f"SELECT order_number FROM archived_order_numbers WHERE order_number IN ({placeholders})",
+                    batch))
+
+            # We hold the write lock, so ids can be assigned up front
+            order_id = conn.execute("SELECT COALESCE(MAX(order_id), 0) FROM order_header").fetchone()[0]
+            headers = []
+            details = []
+            saved = []
+            skipped = []
+            for index, (order_number, customer_ref, order_date, items) in enumerate(orders):
+                if order_number in existing:
+                    skipped.append(index)
+                    continue
+                existing.add(order_number)
+                saved.append((customer_ref, order_date, items))
+                order_id += 1
+                headers.append((order_id, order_number, customer_ref, order_date,
+                                sum(item["subtotal"] for item in items)))
+                details.extend((order_id,
+                                item["product_id"],
+                                item["quantity"],
+                                item["price"],
+                                item["discount"],
+                                item["subtotal"]) for item in items)
+
+            conn.executemany('''INSERT INTO order_header
+                                (order_id, order_number, customer_ref, order_date, total_cents)
+                                VALUES (?, ?, ?, ?, ?)''', headers)
+            conn.executemany('''INSERT INTO order_detail
+                                (order_id, product_id, quantity, price_cents, discount, subtotal_cents)
+                                VALUES (?, ?, ?, ?, ?, ?)''', details)
+
+            self._advance_sequence(conn, [header[1] for header in headers])
+            sales_summary.apply_orders(conn, saved)
+            return skipped
+
+
+_default_db = None
+_default_lock = threading.Lock()
+
+
+def get_database(path=None):
+    # Process-wide repository; the first caller decides the path
+    global _default_db
+    with _default_lock:
+        if _default_db is None:
+            _default_db = Database(path or DEFAULT_DB_PATH)
+        return _default_db
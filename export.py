@@ -0,0 +1,304 @@
+"""Streaming export of order lines (order_header x order_detail x products).
+
+    python export.py orders.csv [--db order_system.db] [--from 2024-01-01] [--to 2024-12-31]
+    python export.py orders.jsonl.gz --customer-ref C042
+    python export.py orders.ocol --format columnar
+    python export.py 2020.csv --from 2020-01-01 --to 2020-12-31 --include-archives
+
+One row per order line, oldest order first. Only orders still in the main
+database are exported unless --include-archives is given: orders moved out
+by archive.py are then read from the archives covering --from/--to too. Rows are read off the cursor in
+batches of --batch-size and written straight out, so memory use does not
+grow with the size of the export. A ".gz" suffix or --gzip compresses.
+
+The columnar format is a simple binary layout for bulk loads:
+
+    magic b"ORDCOL1\\n"
+    uint32 header length, JSON header {"columns": [{"name", "type"}, ...]}
+    row groups: uint32 row count, then per column uint32 length + block
+    uint32 0 ends the file
+
+A column block is one null flag byte (followed by a null bitmap when set),
+then the values: for "int" an array typecode byte and the narrowest signed
+integers that fit the block, float64 for "float", and for "str" a JSON
+dictionary of the distinct values plus an array typecode byte and unsigned
+indexes into it. All numbers are little-endian. read_columnar() reads it back.
+"""
+import argparse
+import csv
+import gzip
+import json
+import struct
+import sys
+import time
+from array import array
+from contextlib import nullcontext
+
+from archive import archived_view
+from database import Database, DEFAULT_DB_PATH
+from money import Money
+
+COLUMNAR_MAGIC = b"ORDCOL1\n"
+
+COLUMN_TYPES = {
+    "order_id": "int",
+    "order_number": "str",
+    "customer_ref": "str",
+    "order_date": "str",
+    "product_id": "int",
+    "product": "str",
+    "quantity": "int",
+    "price_cents": "int",
+    "discount": "float",
+    "subtotal_cents": "int",
+}
+
+# Text formats carry amounts as decimal strings under these names
+TEXT_COLUMNS = tuple(name[:-len("_cents")] if name.endswith("_cents") else name
+                     for name in Database.EXPORT_COLUMNS)
+MONEY_INDEXES = [i for i, name in enumerate(Database.EXPORT_COLUMNS) if name.endswith("_cents")]
+
+
+def _text_row(row):
+    row = list(row)
+    for i in MONEY_INDEXES:
+        if row[i] is not None:
+            row[i] = str(Money(row[i]))
+    return row
+
+
+class CsvExporter:
+    binary = False
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(TEXT_COLUMNS)
+
+    def write_batch(self, rows):
+        self.writer.writerows(_text_row(row) for row in rows)
+
+    def close(self):
+        pass
+
+
+class JsonlExporter:
+    binary = False
+
+    def __init__(self, f):
+        self.f = f
+
+    def write_batch(self, rows):
+        self.f.writelines(json.dumps(dict(zip(TEXT_COLUMNS, _text_row(row)))) + "\n" for row in rows)
+
+    def close(self):
+        pass
+
+
+# Narrowest array typecodes first
+SIGNED_TYPECODES = "bhiq"
+UNSIGNED_TYPECODES = "BHI"
+
+
+def _packed(typecodes, values):
+    # Typecode byte plus the values in the narrowest array type that holds them
+    low = min(values, default=0)
+    high = max(values, default=0)
+    for typecode in typecodes:
+        bits = array(typecode).itemsize * 8
+        if typecode.isupper():
+            fits = high < 1 << bits
+        else:
+            fits = -(1 << bits - 1) <= low and high < 1 << bits - 1
+        if fits:
+            break
+    return typecode.encode("ascii") + _little_endian(array(typecode, values))
+
+
+def _little_endian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _encode_column(kind, values):
+    nulls = [value is None for value in values]
+    if any(nulls):
+        bitmap = bytearray((len(values) + 7) // 8)
+        for i, is_null in enumerate(nulls):
+            if is_null:
+                bitmap[i >> 3] |= 1 << (i & 7)
+        parts = [b"\x01", bytes(bitmap)]
+    else:
+        parts = [b"\x00"]
+
+    if kind == "int":
+        parts.append(_packed(SIGNED_TYPECODES, [0 if v is None else v for v in values]))
+    elif kind == "float":
+        parts.append(_little_endian(array("d", (0.0 if v is None else v for v in values))))
+    else:
+        dictionary = {}
+        indexes = [0 if v is None else dictionary.setdefault(v, len(dictionary)) for v in values]
+        encoded = json.dumps(list(dictionary)).encode("utf-8")
+        parts += [struct.pack("<I", len(encoded)), encoded, _packed(UNSIGNED_TYPECODES, indexes)]
+    return b"".join(parts)
+
+
+class ColumnarExporter:
+    binary = True
+
+    def __init__(self, f):
+        self.f = f
+        self.columns = [(name, COLUMN_TYPES[name]) for name in Database.EXPORT_COLUMNS]
+        header = json.dumps({"columns": [{"name": n, "type": t} for n, t in self.columns]}).encode("utf-8")
+        f.write(COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header)
+
+    def write_batch(self, rows):
+        # One row group per batch
+        self.f.write(struct.pack("<I", len(rows)))
+        for index, (name, kind) in enumerate(self.columns):
+            block = _encode_column(kind, [row[index] for row in rows])
+            self.f.write(struct.pack("<I", len(block)))
+            self.f.write(block)
+
+    def close(self):
+        self.f.write(struct.pack("<I", 0))
+
+
+EXPORTERS = {"csv": CsvExporter, "jsonl": JsonlExporter, "columnar": ColumnarExporter}
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated columnar file")
+    return data
+
+
+def _decode_column(kind, block, count):
+    offset = 1
+    nulls = None
+    if block[0]:
+        size = (count + 7) // 8
+        bitmap = block[1:1 + size]
+        nulls = [bool(bitmap[i >> 3] & (1 << (i & 7))) for i in range(count)]
+        offset += size
+
+    if kind == "str":
+        (size,) = struct.unpack_from("<I", block, offset)
+        offset += 4
+        dictionary = json.loads(block[offset:offset + size].decode("utf-8"))
+        offset += size
+    if kind == "float":
+        packed = array("d", block[offset:])
+    else:
+        packed = array(chr(block[offset]), block[offset + 1:])
+    if sys.byteorder == "big":
+        packed.byteswap()
+    values = [dictionary[i] for i in packed] if kind == "str" else list(packed)
+
+    if nulls is not None:
+        values = [None if is_null else value for value, is_null in zip(values, nulls)]
+    return values
+
+
+def read_columnar(f):
+    """Yield rows as dicts from a columnar export opened in binary mode."""
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar order export")
+    (size,) = struct.unpack("<I", _read_exact(f, 4))
+    columns = [(c["name"], c["type"]) for c in json.loads(_read_exact(f, size))["columns"]]
+
+    while True:
+        (count,) = struct.unpack("<I", _read_exact(f, 4))
+        if not count:
+            return
+        data = []
+        for name, kind in columns:
+            (size,) = struct.unpack("<I", _read_exact(f, 4))
+            data.append(_decode_column(kind, _read_exact(f, size), count))
+        names = [name for name, _ in columns]
+        for values in zip(*data):
+            yield dict(zip(names, values))
+
+
+def open_output(path, binary, compress):
+    if compress:
+        # Level 6 compresses nearly as well as 9 at a fraction of the time
+        return gzip.open(path, "wb" if binary else "wt", compresslevel=6,
+                         encoding=None if binary else "utf-8", newline=None if binary else "")
+    if binary:
+        return open(path, "wb")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def guess_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    if name.endswith(".ocol"):
+        return "columnar"
+    return "csv"
+
+
+def export_orders(db, path, fmt=None, start=None, end=None, customer_ref=None, batch_size=5000,
+                  compress=None, include_archives=False):
+    """Write the filtered order lines to path; returns a stats dict.
+
+    With include_archives, archived orders in the date range are written too.
+    """
+    fmt = fmt or guess_format(path)
+    if compress is None:
+        compress = path.endswith(".gz")
+    exporter_class = EXPORTERS[fmt]
+
+    started = time.perf_counter()
+    rows = 0
+    view = archived_view(db, start, end) if include_archives else nullcontext()
+    with view as conn, open_output(path, exporter_class.binary, compress) as f:
+        exporter = exporter_class(f)
+        for batch in db.iter_order_lines(start, end, customer_ref, batch_size, conn):
+            exporter.write_batch(batch)
+            rows += len(batch)
+        exporter.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "format": fmt,
+        "gzip": compress,
+        "elapsed": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export order lines to CSV, JSONL or columnar files")
+    parser.add_argument("path")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--format", choices=sorted(EXPORTERS))
+    parser.add_argument("--from", dest="start", help="first order date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", help="last order date, YYYY-MM-DD")
+    parser.add_argument("--customer-ref")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows fetched per round trip")
+    parser.add_argument("--gzip", action="store_true", default=None, help="compress (default: by .gz suffix)")
+    parser.add_argument("--include-archives", action="store_true",
+                        help="also export archived orders in the date range")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        db.migrate()
+        stats = export_orders(db, args.path, args.format, args.start, args.end, args.customer_ref,
+                              args.batch_size, args.gzip, args.include_archives)
+    except ValueError as e:
+        # More archives in the range than SQLite can attach at once
+        parser.error(str(e))
+    finally:
+        db.close()
+
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""Local HTTP/JSON front-end for OrderService.
+
+    python http_server.py [--db order_system.db] [--host 127.0.0.1] [--port 8080] [--journal orders.journal]
+
+    GET    /products                 list products
+    POST   /products                 {"name", "price"}
+    GET    /products/<id>
+    PUT    /products/<id>            {"name"?, "price"?, "effective_from"?}
+    DELETE /products/<id>
+    GET    /products/<id>/prices     price history
+    POST   /prices                   {"effective_from"?, "prices": [{"product": id or name, "price"}, ...]}
+    GET    /orders?after_date=&after_id=&limit=&q=&from=&to=&min_total=&max_total=&product=
+    POST   /orders                   {"order_number"?, "customer_ref", "order_date", "items": [...]}
+    GET    /orders/<order_number>    header and detail lines
+    GET    /capture                  capture mode counters, orders per second and recent rejects
+    GET    /capture/<key>            pending, committed or rejected, by idempotency key
+
+Each request runs on its own thread against the shared connection pool.
+POST /orders allocates the order number when none is given. Send an
+Idempotency-Key header to make retries safe: a repeated key returns the
+order saved the first time, with status 200 instead of 201.
+
+With --journal, POST /orders runs in capture mode (see order_journal.py):
+the order is journaled and answered with 202 at once, and committed in
+batches in the background. The response carries the idempotency key to
+follow the order up with under /capture/<key>, since it can still be
+rejected at commit (a duplicate order number, say).
+"""
+import argparse
+import json
+import os
+import sqlite3
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from database import Database, DEFAULT_DB_PATH
+from money import Money
+from order_journal import OrderCapture
+from order_service import DuplicateOrderError, NotFoundError, OrderService, ValidationError, product_to_dict
+
+MAX_PAGE_SIZE = 1000
+
+
+def json_default(value):
+    # Money goes out as an exact decimal string, e.g. "1234.50"
+    if isinstance(value, Money):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class OrderRequestHandler(BaseHTTPRequestHandler):
+    server_version = "OrderSystem/1.0"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, default=json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            raise ValidationError("Invalid Content-Length")
+        if length < 0:
+            raise ValidationError("Invalid Content-Length")
+        if not length:
+            return {}
+        try:
+            payload = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ValidationError("Request body must be JSON")
+        if not isinstance(payload, dict):
+            raise ValidationError("Request body must be a JSON object")
+        return payload
+
+    def product_json(self, product):
+        # Priced as of today from the price history
+        return product_to_dict(product, self.service.current_price(product))
+
+    def list_field(self, body, name):
+        # A list of JSON objects, or empty when absent
+        value = body.get(name) or []
+        if not isinstance(value, list) or not all(isinstance(entry, dict) for entry in value):
+            raise ValidationError(f'"{name}" must be a list of objects')
+        return value
+
+    def dispatch(self, method):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, payload = self.route(method, parts, query)
+        except DuplicateOrderError as e:
+            status, payload = 409, {"error": str(e)}
+        except ValidationError as e:
+            status, payload = 400, {"error": str(e)}
+        except NotFoundError as e:
+            status, payload = 404, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            status, payload = 409, {"error": str(e)}
+        except sqlite3.Error as e:
+            status, payload = 503, {"error": str(e)}
+        except Exception:
+            self.log_error("Unhandled error for %s %s:\n%s", method, self.path, traceback.format_exc())
+            status, payload = 500, {"error": "Internal server error"}
+        self.send_json(status, payload)
+
+    def route(self, method, parts, query):
+        if parts[:1] == ["products"]:
+            if len(parts) == 1:
+                if method == "GET":
+                    return 200, [self.product_json(p) for p in self.service.list_products()]
+                if method == "POST":
+                    body = self.read_json()
+                    return 201, self.product_json(self.service.add_product(body.get("name"), body.get("price")))
+            elif len(parts) == 2:
+                product_id = self.int_param(parts[1], "product id")
+                if method == "GET":
+                    return 200, self.product_json(self.service.get_product(product_id))
+                if method == "PUT":
+                    body = self.read_json()
+                    product = self.service.update_product(product_id, body.get("name"), body.get("price"),
+                                                          body.get("effective_from"))
+                    return 200, self.product_json(product)
+                if method == "DELETE":
+                    self.service.delete_product(product_id)
+                    return 200, {"deleted": product_id}
+            elif len(parts) == 3 and parts[2] == "prices" and method == "GET":
+                return 200, self.service.price_history(self.int_param(parts[1], "product id"))
+
+        elif parts == ["prices"] and method == "POST":
+            body = self.read_json()
+            prices = [(change.get("product"), change.get("price")) for change in self.list_field(body, "prices")]
+            count = self.service.reprice_products(prices, body.get("effective_from"))
+            return 200, {"repriced": count}
+
+        elif parts[:1] == ["orders"]:
+            if len(parts) == 1:
+                if method == "GET":
+                    return 200, self.list_orders(query)
+                if method == "POST":
+                    body = self.read_json()
+                    order = self.service.create_order(body.get("order_number"), body.get("customer_ref"),
+                                                      body.get("order_date"), self.list_field(body, "items"),
+                                                      self.headers.get("Idempotency-Key"))
+                    if order.get("queued"):
+                        return 202, order
+                    return (201 if order["created"] else 200), order
+            elif len(parts) == 2 and method == "GET":
+                order = self.service.get_order(parts[1])
+                order["items"] = self.service.get_order_details(parts[1])
+                return 200, order
+
+        elif parts[:1] == ["capture"] and len(parts) <= 2 and method == "GET":
+            if self.service.capture is None:
+                raise NotFoundError("Capture mode is off")
+            if len(parts) == 2:
+                return 200, self.service.capture_status(parts[1])
+            return 200, dict(self.service.capture.stats(), recent_rejects=self.service.capture_rejects(20))
+
+        raise NotFoundError(f"No route for {method} /{'/'.join(parts)}")
+
+    def list_orders(self, query):
+        limit = self.int_param(query.get("limit", "100"), "limit")
+        if limit < 1:
+            raise ValidationError("limit must be at least 1")
+        limit = min(limit, MAX_PAGE_SIZE)
+        after = None
+        if "after_id" in query:
+            after = (query.get("after_date"), self.int_param(query["after_id"], "after_id"))
+        filters = self.service.order_filters(query.get("q"), query.get("from"), query.get("to"),
+                                             query.get("min_total"), query.get("max_total"),
+                                             query.get("product"))
+        orders = self.service.list_orders(after=after, limit=limit, filters=filters)
+        # Cursor for the following page, if there may be one
+        next_page = None
+        if len(orders) == limit:
+            last = orders[-1]
+            next_page = {"after_date": last["order_date"], "after_id": last["order_id"]}
+        return {"orders": orders, "next": next_page}
+
+    def int_param(self, value, name):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValidationError(f"Invalid {name}: {value}")
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+
+class OrderHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, quiet=False):
+        super().__init__(address, OrderRequestHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the order system over HTTP/JSON")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--journal", default=os.environ.get("ORDER_SYSTEM_JOURNAL"),
+                        help="capture orders through this journal file")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db, pool_size=args.pool_size)
+    db.migrate()
+    capture = None
+    if args.journal:
+        capture = OrderCapture(db, args.journal)
+        replayed = capture.start()
+        if replayed:
+            print(f"Replayed {replayed} journaled orders")
+    server = OrderHTTPServer((args.host, args.port), OrderService(db, capture=capture))
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if capture is not None:
+            capture.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
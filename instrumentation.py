@@ -0,0 +1,224 @@
+"""Opt-in timing of database calls, SQL statements and widget updates.
+
+Off unless the ORDER_SYSTEM_PROFILE environment variable is set or
+metrics.enable() is called. While on:
+
+- DbWorker times every background job and the Tk callback that consumes it
+- profiled() times decorated functions, such as the Treeview fill loops
+- ConnectionPool connections time each statement, and capture EXPLAIN
+  QUERY PLAN for any slower than metrics.slow_query_ms
+
+Each measurement is kept in a rolling buffer and folded into per-name
+totals. snapshot() returns everything as a dict; dump() writes it as JSON,
+or as Prometheus text when the path ends in .prom or .txt.
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Upper bounds, in seconds, of the Prometheus histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Stat:
+    __slots__ = ("count", "total", "max", "rows", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, elapsed, rows):
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if rows:
+            self.rows += rows
+        for i, bound in enumerate(BUCKETS):
+            if elapsed <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "avg_ms": round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "rows": self.rows,
+        }
+
+
+class Metrics:
+    def __init__(self, capacity=1000, slow_query_ms=50.0):
+        self.enabled = False
+        self.slow_query_ms = slow_query_ms
+        self.recent = deque(maxlen=capacity)
+        self.slow_queries = deque(maxlen=50)
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self.recent.clear()
+            self.slow_queries.clear()
+            self.stats.clear()
+
+    def record(self, kind, name, elapsed, rows=None):
+        with self._lock:
+            self.recent.append({"at": time.time(), "kind": kind, "name": name,
+                                "ms": round(elapsed * 1000, 3), "rows": rows,
+                                "thread": threading.current_thread().name})
+            stat = self.stats.get((kind, name))
+            if stat is None:
+                stat = self.stats[(kind, name)] = Stat()
+            stat.add(elapsed, rows)
+
+    def record_slow_query(self, sql, params, elapsed, plan):
+        with self._lock:
+            self.slow_queries.append({"at": time.time(), "ms": round(elapsed * 1000, 3),
+                                      "sql": " ".join(sql.split()), "params": repr(params)[:200],
+                                      "plan": plan})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slow_query_ms": self.slow_query_ms,
+                "stats": [dict(kind=kind, name=name, **stat.as_dict())
+                          for (kind, name), stat in sorted(self.stats.items())],
+                "slow_queries": list(self.slow_queries),
+                "recent": list(self.recent),
+            }
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP order_system_operation_seconds Time spent per instrumented operation.",
+            "# TYPE order_system_operation_seconds histogram",
+        ]
+        rows = [
+            "# HELP order_system_operation_rows_total Rows returned or drawn per operation.",
+            "# TYPE order_system_operation_rows_total counter",
+        ]
+        with self._lock:
+            for (kind, name), stat in sorted(self.stats.items()):
+                labels = f'kind="{kind}",name="{_escape_label(name)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stat.buckets):
+                    cumulative += count
+                    lines.append(f'order_system_operation_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'order_system_operation_seconds_bucket{{{labels},le="+Inf"}} {stat.count}')
+                lines.append(f"order_system_operation_seconds_sum{{{labels}}} {stat.total:.6f}")
+                lines.append(f"order_system_operation_seconds_count{{{labels}}} {stat.count}")
+                rows.append(f"order_system_operation_rows_total{{{labels}}} {stat.rows}")
+        return "\n".join(lines + rows) + "\n"
+
+    def dump(self, path):
+        if path.endswith((".prom", ".txt")):
+            text = self.prometheus_text()
+        else:
+            text = json.dumps(self.snapshot(), indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def row_count(result):
+    # Rows for the stats when a call returns a sized result
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+metrics = Metrics()
+if os.environ.get("ORDER_SYSTEM_PROFILE"):
+    metrics.enable()
+
+
+def profiled(kind, name=None, rows=None):
+    """Decorator timing each call while metrics are enabled.
+
+    The row count is rows(*args) when given, else the length of the result.
+    """
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            count = rows(*args) if rows is not None else row_count(result)
+            metrics.record(kind, label, time.perf_counter() - started, count)
+            return result
+        return wrapper
+    return decorate
+
+
+# Statements EXPLAIN QUERY PLAN is captured for
+EXPLAINABLE = {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE"}
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not metrics.enabled:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self.connection.statement_done(sql, parameters, time.perf_counter() - started)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        if not metrics.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self.connection.statement_done(sql, None, time.perf_counter() - started)
+        return result
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection factory that, while metrics are enabled, times
+    statements (to first row) and records the query plan of slow ones."""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def statement_done(self, sql, parameters, elapsed):
+        if not metrics.enabled:
+            return
+        metrics.record("sql", _statement_name(sql), elapsed)
+        if elapsed * 1000 >= metrics.slow_query_ms and parameters is not None \
+                and sql.split(None, 1)[0].upper() in EXPLAINABLE:
+            try:
+                plan = [row[3] for row in
+                        sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, parameters)]
+            except sqlite3.Error as e:
+                plan = [f"unavailable: {e}"]
+            metrics.record_slow_query(sql, parameters, elapsed, plan)
+
+
+def _statement_name(sql):
+    # Statements are grouped by their whitespace-normalised text, cut short
+    text = " ".join(sql.split())
+    return text if len(text) <= 120 else text[:117] + "..."
@@ -0,0 +1,371 @@
+"""Versioned schema migrations keyed on PRAGMA user_version.
+
+Each step runs once, in order, inside its own transaction. Steps must only
+ever add to the schema or reshape data in place; existing rows are kept.
+Steps are frozen once shipped and never call code outside this module,
+which may change after them.
+"""
+# effective_from of prices that have applied for as long as anyone knows
+EARLIEST_DATE = "0001-01-01"
+
+
+def _create_base_schema(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS products
+                (id INTEGER PRIMARY KEY,
+                 name TEXT NOT NULL,
+                 price REAL NOT NULL)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS order_header
+                (order_id INTEGER PRIMARY KEY,
+                 order_number TEXT NOT NULL,
+                 customer_ref TEXT,
+                 order_date DATE,
+                 total_amount REAL)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS order_detail
+                (detail_id INTEGER PRIMARY KEY,
+                 order_id INTEGER,
+                 product_id INTEGER,
+                 quantity INTEGER,
+                 price REAL,
+                 discount REAL,
+                 subtotal REAL,
+                 FOREIGN KEY (order_id) REFERENCES order_header (order_id),
+                 FOREIGN KEY (product_id) REFERENCES products (id))''')
+
+    # Insert sample products if none exist
+    c.execute("SELECT COUNT(*) FROM products")
+    if c.fetchone()[0] == 0:
+        sample_products = [
+            (1, "BATTERY", 50000),
+            (2, "CHARGER", 100000),
+        ]
+        c.executemany("INSERT INTO products (id, name, price) VALUES (?,?,?)", sample_products)
+
+
+def _add_hot_query_indexes(c):
+    # Older databases never enforced unique order numbers; keep the first
+    # order under its number and suffix later duplicates with their order_id
+    c.execute("""
+        UPDATE order_header
+        SET order_number = order_number || '-' || order_id
+        WHERE order_id NOT IN (
+            SELECT MIN(order_id) FROM order_header GROUP BY order_number
+        )
+    """)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_order_header_number ON order_header (order_number)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_header_date ON order_header (order_date, order_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_detail_order ON order_detail (order_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)")
+
+
+def _track_product_changes(c):
+    # Every insert or update stamps the product with a new counter value so
+    # caches can fetch just the rows changed since they last looked
+    c.execute("ALTER TABLE products ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_products_row_version ON products (row_version)")
+    c.execute('''CREATE TABLE IF NOT EXISTS change_counters
+                (name TEXT PRIMARY KEY,
+                 value INTEGER NOT NULL)''')
+    c.execute("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('products', 0), ('products_deleted', 0)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_after_insert AFTER INSERT ON products
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = 'products';
+                    UPDATE products SET row_version = (SELECT value FROM change_counters WHERE name = 'products')
+                    WHERE id = NEW.id;
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_after_update AFTER UPDATE OF id, name, price ON products
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = 'products';
+                    UPDATE products SET row_version = (SELECT value FROM change_counters WHERE name = 'products')
+                    WHERE id = NEW.id;
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_after_delete AFTER DELETE ON products
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = 'products_deleted';
+                END''')
+
+
+def _add_sales_summaries(c):
+    # Summaries as first shipped, with REAL amounts; step 5 replaces them
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily
+                (day TEXT PRIMARY KEY,
+                 orders INTEGER NOT NULL,
+                 lines INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 gross REAL NOT NULL,
+                 discount_amount REAL NOT NULL,
+                 revenue REAL NOT NULL)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_daily_product
+                (day TEXT NOT NULL,
+                 product_id INTEGER NOT NULL,
+                 lines INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 gross REAL NOT NULL,
+                 discount_amount REAL NOT NULL,
+                 revenue REAL NOT NULL,
+                 PRIMARY KEY (day, product_id))''')
+    c.execute('''CREATE TABLE IF NOT EXISTS sales_customer
+                (customer_ref TEXT PRIMARY KEY,
+                 orders INTEGER NOT NULL,
+                 revenue REAL NOT NULL,
+                 first_order TEXT,
+                 last_order TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_daily_product_product ON sales_daily_product (product_id, day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer_revenue ON sales_customer (revenue)")
+
+    c.execute('''INSERT INTO sales_daily_product
+                (day, product_id, lines, quantity, gross, discount_amount, revenue)
+                SELECT COALESCE(oh.order_date, ''), od.product_id, COUNT(*), SUM(od.quantity),
+                       SUM(od.quantity * od.price), SUM(od.quantity * od.price - od.subtotal),
+                       SUM(od.subtotal)
+                FROM order_detail od
+                JOIN order_header oh ON od.order_id = oh.order_id
+                GROUP BY 1, 2''')
+    c.execute('''INSERT INTO sales_daily
+                (day, orders, lines, quantity, gross, discount_amount, revenue)
+                SELECT d.day, COALESCE(o.orders, 0), d.lines, d.quantity, d.gross,
+                       d.discount_amount, d.revenue
+                FROM (SELECT day, SUM(lines) AS lines, SUM(quantity) AS quantity, SUM(gross) AS gross,
+                             SUM(discount_amount) AS discount_amount, SUM(revenue) AS revenue
+                      FROM sales_daily_product GROUP BY day) d
+                LEFT JOIN (SELECT COALESCE(order_date, '') AS day, COUNT(*) AS orders
+                           FROM order_header GROUP BY 1) o ON o.day = d.day''')
+    c.execute('''INSERT INTO sales_customer
+                (customer_ref, orders, revenue, first_order, last_order)
+                SELECT COALESCE(oh.customer_ref, ''), COUNT(*), SUM(COALESCE(t.revenue, 0)),
+                       MIN(COALESCE(oh.order_date, '')), MAX(COALESCE(oh.order_date, ''))
+                FROM order_header oh
+                JOIN (SELECT order_id, SUM(subtotal) AS revenue FROM order_detail GROUP BY order_id) t
+                  ON t.order_id = oh.order_id
+                GROUP BY 1''')
+
+
+def _store_money_as_cents(c):
+    # REAL money columns become INTEGER cents. Existing line subtotals are
+    # rounded to the cent, and order totals are re-summed from those lines
+    # so that a total always equals the sum of its lines.
+    c.execute("DROP TRIGGER IF EXISTS products_after_update")
+    c.execute("ALTER TABLE products ADD COLUMN price_cents INTEGER NOT NULL DEFAULT 0")
+    c.execute("UPDATE products SET price_cents = CAST(ROUND(price * 100) AS INTEGER)")
+    c.execute("ALTER TABLE products DROP COLUMN price")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS products_after_update AFTER UPDATE OF id, name, price_cents ON products
+                BEGIN
+                    UPDATE change_counters SET value = value + 1 WHERE name = 'products';
+                    UPDATE products SET row_version = (SELECT value FROM change_counters WHERE name = 'products')
+                    WHERE id = NEW.id;
+                END''')
+    # Every cached catalog has to reload its prices
+    c.execute("UPDATE change_counters SET value = value + 1 WHERE name = 'products_deleted'")
+
+    c.execute("ALTER TABLE order_detail ADD COLUMN price_cents INTEGER")
+    c.execute("ALTER TABLE order_detail ADD COLUMN subtotal_cents INTEGER")
+    c.execute("""UPDATE order_detail SET price_cents = CAST(ROUND(price * 100) AS INTEGER),
+                                         subtotal_cents = CAST(ROUND(subtotal * 100) AS INTEGER)""")
+    c.execute("ALTER TABLE order_detail DROP COLUMN price")
+    c.execute("ALTER TABLE order_detail DROP COLUMN subtotal")
+
+    c.execute("ALTER TABLE order_header ADD COLUMN total_cents INTEGER")
+    c.execute("""UPDATE order_header SET total_cents = COALESCE(
+                     (SELECT SUM(subtotal_cents) FROM order_detail WHERE order_id = order_header.order_id),
+                     CAST(ROUND(total_amount * 100) AS INTEGER))""")
+    c.execute("ALTER TABLE order_header DROP COLUMN total_amount")
+
+    # The summaries are derived data, so rebuild them in the new units
+    for table in ("sales_daily", "sales_daily_product", "sales_customer"):
+        c.execute(f"DROP TABLE IF EXISTS {table}")
+    c.execute('''CREATE TABLE sales_daily
+                (day TEXT PRIMARY KEY,
+                 orders INTEGER NOT NULL,
+                 lines INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 gross_cents INTEGER NOT NULL,
+                 discount_cents INTEGER NOT NULL,
+                 revenue_cents INTEGER NOT NULL)''')
+    c.execute('''CREATE TABLE sales_daily_product
+                (day TEXT NOT NULL,
+                 product_id INTEGER NOT NULL,
+                 lines INTEGER NOT NULL,
+                 quantity INTEGER NOT NULL,
+                 gross_cents INTEGER NOT NULL,
+                 discount_cents INTEGER NOT NULL,
+                 revenue_cents INTEGER NOT NULL,
+                 PRIMARY KEY (day, product_id))''')
+    c.execute('''CREATE TABLE sales_customer
+                (customer_ref TEXT PRIMARY KEY,
+                 orders INTEGER NOT NULL,
+                 revenue_cents INTEGER NOT NULL,
+                 first_order TEXT,
+                 last_order TEXT)''')
+    c.execute("CREATE INDEX idx_sales_daily_product_product ON sales_daily_product (product_id, day)")
+    c.execute("CREATE INDEX idx_sales_customer_revenue ON sales_customer (revenue_cents)")
+
+    c.execute('''INSERT INTO sales_daily_product
+                (day, product_id, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                SELECT COALESCE(oh.order_date, ''), od.product_id, COUNT(*), SUM(od.quantity),
+                       SUM(od.quantity * od.price_cents), SUM(od.quantity * od.price_cents - od.subtotal_cents),
+                       SUM(od.subtotal_cents)
+                FROM order_detail od
+                JOIN order_header oh ON od.order_id = oh.order_id
+                GROUP BY 1, 2''')
+    c.execute('''INSERT INTO sales_daily
+                (day, orders, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                SELECT d.day, COALESCE(o.orders, 0), d.lines, d.quantity, d.gross_cents,
+                       d.discount_cents, d.revenue_cents
+                FROM (SELECT day, SUM(lines) AS lines, SUM(quantity) AS quantity, SUM(gross_cents) AS gross_cents,
+                             SUM(discount_cents) AS discount_cents, SUM(revenue_cents) AS revenue_cents
+                      FROM sales_daily_product GROUP BY day) d
+                LEFT JOIN (SELECT COALESCE(order_date, '') AS day, COUNT(*) AS orders
+                           FROM order_header GROUP BY 1) o ON o.day = d.day''')
+    c.execute('''INSERT INTO sales_customer
+                (customer_ref, orders, revenue_cents, first_order, last_order)
+                SELECT COALESCE(oh.customer_ref, ''), COUNT(*), SUM(COALESCE(t.revenue_cents, 0)),
+                       MIN(COALESCE(oh.order_date, '')), MAX(COALESCE(oh.order_date, ''))
+                FROM order_header oh
+                JOIN (SELECT order_id, SUM(subtotal_cents) AS revenue_cents FROM order_detail GROUP BY order_id) t
+                  ON t.order_id = oh.order_id
+                GROUP BY 1''')
+
+
+def _add_order_number_sequence(c):
+    # Named counters handed out under the write lock; order numbers continue
+    # after the highest all-digit number already on file
+    c.execute('''CREATE TABLE IF NOT EXISTS sequences
+                (name TEXT PRIMARY KEY,
+                 value INTEGER NOT NULL)''')
+    c.execute("""INSERT OR IGNORE INTO sequences (name, value)
+                 SELECT 'order_number', COALESCE(MAX(CAST(order_number AS INTEGER)), 0)
+                 FROM order_header
+                 WHERE order_number != '' AND order_number NOT GLOB '*[^0-9]*'""")
+
+    # Client-chosen key that makes a retried save return the first order
+    c.execute("ALTER TABLE order_header ADD COLUMN idempotency_key TEXT")
+    c.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_order_header_idempotency
+                 ON order_header (idempotency_key) WHERE idempotency_key IS NOT NULL""")
+
+
+def _add_order_search(c):
+    # Trigram full-text index over order numbers and customer refs, kept in
+    # step with order_header by triggers; matches any 3+ character fragment
+    c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS order_search USING fts5
+                 (order_number, customer_ref, content='order_header', content_rowid='order_id',
+                  tokenize='trigram')""")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS order_header_search_insert AFTER INSERT ON order_header
+                BEGIN
+                    INSERT INTO order_search (rowid, order_number, customer_ref)
+                    VALUES (NEW.order_id, NEW.order_number, NEW.customer_ref);
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS order_header_search_delete AFTER DELETE ON order_header
+                BEGIN
+                    INSERT INTO order_search (order_search, rowid, order_number, customer_ref)
+                    VALUES ('delete', OLD.order_id, OLD.order_number, OLD.customer_ref);
+                END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS order_header_search_update
+                AFTER UPDATE OF order_id, order_number, customer_ref ON order_header
+                BEGIN
+                    INSERT INTO order_search (order_search, rowid, order_number, customer_ref)
+                    VALUES ('delete', OLD.order_id, OLD.order_number, OLD.customer_ref);
+                    INSERT INTO order_search (rowid, order_number, customer_ref)
+                    VALUES (NEW.order_id, NEW.order_number, NEW.customer_ref);
+                END''')
+    c.execute("INSERT INTO order_search (order_search) VALUES ('rebuild')")
+
+    # Range and containment filters
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_header_total ON order_header (total_cents)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_order_detail_product ON order_detail (product_id, order_id)")
+
+
+def _add_price_history(c):
+    # Each row prices a product from effective_from until the product's next
+    # row; before its first row a product costs its earliest price. Existing
+    # prices are taken to have always applied.
+    c.execute('''CREATE TABLE IF NOT EXISTS product_price_history
+                (product_id INTEGER NOT NULL,
+                 effective_from TEXT NOT NULL,
+                 price_cents INTEGER NOT NULL,
+                 PRIMARY KEY (product_id, effective_from),
+                 FOREIGN KEY (product_id) REFERENCES products (id) ON DELETE CASCADE)
+                WITHOUT ROWID''')
+    c.execute(f"""INSERT OR IGNORE INTO product_price_history (product_id, effective_from, price_cents)
+                  SELECT id, '{EARLIEST_DATE}', price_cents FROM products""")
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS products_price_history_insert AFTER INSERT ON products
+                BEGIN
+                    INSERT OR IGNORE INTO product_price_history (product_id, effective_from, price_cents)
+                    VALUES (NEW.id, '{EARLIEST_DATE}', NEW.price_cents);
+                END''')
+
+    # Bumped on every history change, so catalogs know to reload their prices
+    c.execute("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('prices', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS price_history_after_{event.lower()}
+                    AFTER {event} ON product_price_history
+                    BEGIN
+                        UPDATE change_counters SET value = value + 1 WHERE name = 'prices';
+                    END''')
+
+
+def _add_archived_order_numbers(c):
+    # Numbers of the orders moved out to archive files (see archive.py), so
+    # they are not handed out or typed in again
+    c.execute('''CREATE TABLE IF NOT EXISTS archived_order_numbers
+                (order_number TEXT PRIMARY KEY,
+                 period TEXT NOT NULL)
+                WITHOUT ROWID''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_archived_order_numbers_period ON archived_order_numbers (period)")
+
+
+def _add_capture_rejects(c):
+    # Captured orders (order_journal.py) that failed to commit, kept so the
+    # clerk or client who was told they were captured can find out
+    c.execute('''CREATE TABLE IF NOT EXISTS capture_rejects
+                (idempotency_key TEXT PRIMARY KEY,
+                 order_number TEXT,
+                 customer_ref TEXT,
+                 order_date TEXT,
+                 entry TEXT NOT NULL,
+                 error TEXT NOT NULL,
+                 rejected_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime')))''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_capture_rejects_time ON capture_rejects (rejected_at)")
+
+
+# Position in this list + 1 is the user_version the step brings the database to
+MIGRATIONS = [
+    _create_base_schema,
+    _add_hot_query_indexes,
+    _track_product_changes,
+    _add_sales_summaries,
+    _store_money_as_cents,
+    _add_order_number_sequence,
+    _add_order_search,
+    _add_price_history,
+    _add_archived_order_numbers,
+    _add_capture_rejects,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=SCHEMA_VERSION):
+    """Apply every missing step up to target and return the resulting version."""
+    version = current_version(conn)
+    if version >= target:
+        return version
+
+    for step in range(version, target):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the lock
+            if current_version(conn) > step:
+                conn.commit()
+                continue
+            MIGRATIONS[step](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {step + 1}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return current_version(conn)
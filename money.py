@@ -0,0 +1,103 @@
+"""Exact money arithmetic in integer cents.
+
+Rounding policy: amounts are rounded to the cent, half up (away from zero),
+once per order line, after the discount is applied. Order totals are the
+exact sum of their rounded line subtotals.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+CENT = Decimal("0.01")
+
+
+@total_ordering
+class Money:
+    __slots__ = ("cents",)
+
+    def __init__(self, cents=0):
+        if not isinstance(cents, int):
+            raise TypeError(f"Money needs integer cents, got {cents!r}")
+        self.cents = cents
+
+    @classmethod
+    def parse(cls, value):
+        """Money from user input: a string, int, Decimal or float in major units."""
+        if isinstance(value, Money):
+            return value
+        try:
+            amount = Decimal(str(value).strip().replace(",", ""))
+        except (InvalidOperation, AttributeError):
+            raise ValueError(f"Invalid amount: {value!r}")
+        if not amount.is_finite():
+            raise ValueError(f"Invalid amount: {value!r}")
+        return cls(int((amount / CENT).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+    @classmethod
+    def from_cents(cls, cents):
+        return None if cents is None else cls(cents)
+
+    def to_decimal(self):
+        return Decimal(self.cents) * CENT
+
+    def apply_discount(self, percent):
+        """This amount less percent %, rounded to the cent."""
+        factor = (Decimal(100) - Decimal(str(percent))) / 100
+        return Money(int((Decimal(self.cents) * factor).quantize(Decimal(1), rounding=ROUND_HALF_UP)))
+
+    def format(self):
+        # Display form used throughout the UI, e.g. 1,234,567.89
+        return f"{self.to_decimal():,.2f}"
+
+    def __str__(self):
+        return f"{self.to_decimal():.2f}"
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+    def __int__(self):
+        return self.cents
+
+    def __float__(self):
+        return self.cents / 100
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    # Lets sum() start from its default 0
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __mul__(self, other):
+        # Only whole quantities; use apply_discount for percentages
+        if isinstance(other, int):
+            return Money(self.cents * other)
+        return NotImplemented
+
+    __rmul__ = __mul__
@@ -0,0 +1,109 @@
+"""The order being entered, line by line, before it is saved.
+
+Lines are keyed by an id that doubles as the Treeview iid, so the form never
+maps row positions back to list indexes. The total is kept up to date on
+every change instead of being re-summed.
+"""
+import itertools
+
+import order_rules
+from money import Money
+
+
+class OrderDraft:
+    def __init__(self):
+        self.lines = {}     # iid -> item dict, in entry order
+        self.by_key = {}    # (product_id, discount) -> iid
+        self.total = Money(0)
+        self._ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, iid):
+        return iid in self.lines
+
+    def __getitem__(self, iid):
+        return self.lines[iid]
+
+    def order_lines(self):
+        # Lines in the form OrderService.create_order takes
+        return [{"product": item["product_name"],
+                 "quantity": item["quantity"],
+                 "discount": item["discount"]} for item in self.lines.values()]
+
+    def _key(self, item):
+        return (item["product_id"], item["discount"])
+
+    def _reprice(self, item, quantity, discount):
+        old = item["subtotal"]
+        item["quantity"] = quantity
+        item["discount"] = discount
+        item["subtotal"] = order_rules.line_subtotal(quantity, item["price"], discount)
+        self.total += item["subtotal"] - old
+
+    def add(self, item):
+        """Add a priced item (OrderService.build_item); returns (iid, merged).
+
+        A line for the same product at the same discount absorbs the new
+        quantity instead of adding a second row.
+        """
+        key = self._key(item)
+        iid = self.by_key.get(key)
+        if iid is not None:
+            line = self.lines[iid]
+            self._reprice(line, line["quantity"] + item["quantity"], line["discount"])
+            return iid, True
+
+        iid = f"line{next(self._ids)}"
+        item = dict(item)
+        self.lines[iid] = item
+        self.by_key[key] = iid
+        self.total += item["subtotal"]
+        return iid, False
+
+    def update(self, iid, quantity, discount):
+        """Change a line's quantity and discount in place; returns the line's iid.
+
+        If the new discount matches another line of the same product the two
+        are merged, and the surviving line's iid is returned instead.
+        """
+        item = self.lines[iid]
+        quantity, discount = order_rules.parse_line(item["product_name"], quantity, discount)
+
+        del self.by_key[self._key(item)]
+        other = self.by_key.get((item["product_id"], discount))
+        if other is not None:
+            self.remove([iid])
+            line = self.lines[other]
+            self._reprice(line, line["quantity"] + quantity, discount)
+            return other
+
+        self._reprice(item, quantity, discount)
+        self.by_key[self._key(item)] = iid
+        return iid
+
+    def reprice(self, price_of):
+        """Re-price every line at price_of(item); returns the iids whose price changed."""
+        changed = []
+        for iid, item in self.lines.items():
+            price = price_of(item)
+            if price is not None and price != item["price"]:
+                item["price"] = price
+                self._reprice(item, item["quantity"], item["discount"])
+                changed.append(iid)
+        return changed
+
+    def remove(self, iids):
+        for iid in iids:
+            item = self.lines.pop(iid, None)
+            if item is None:
+                continue
+            if self.by_key.get(self._key(item)) == iid:
+                del self.by_key[self._key(item)]
+            self.total -= item["subtotal"]
+
+    def clear(self):
+        self.lines.clear()
+        self.by_key.clear()
+        self.total = Money(0)
@@ -0,0 +1,328 @@
+"""Durable order capture: journal first, group commit into SQLite later.
+
+An optional save path for peak intake. OrderCapture.submit() appends the
+validated order to a local journal file and returns at once; a background
+committer then saves whatever has queued up with Database.place_orders, so
+many orders share one SQLite commit.
+
+By default the journal is fsynced every sync_interval seconds rather than
+per order. A submitted order then survives a crash of the process at once,
+and power loss once the next fsync has run, which matches direct saves:
+those commit to a WAL database with synchronous=NORMAL, which does not
+fsync on commit either. With sync_interval=None every submit waits for an
+fsync of its own (shared with concurrent submits); that is slower than a
+direct save and only worth it where power-loss durability matters.
+
+Each journal line is the CRC-32 of the entry as 8 hex digits, a space, and
+the entry as JSON. Every entry carries an idempotency key, so replaying an
+entry that did reach the database is a no-op. start() replays the journal
+before accepting new orders, which recovers anything captured before a
+crash; a torn last line is dropped. The journal is emptied whenever the
+committer has caught up with it.
+
+Orders are only numbered when they commit, so a captured order without a
+number of its own gets it later, in the on_commit callback. An order that
+fails to commit (a duplicate number, say) is recorded in the capture_rejects
+table before the journal lets go of it; OrderService.capture_status() looks
+an order up by its idempotency key.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+
+from money import Money
+
+
+def _encode(entry):
+    data = json.dumps(entry, separators=(",", ":")).encode("utf-8")
+    return b"%08x %s\n" % (zlib.crc32(data), data)
+
+
+def _decode(line):
+    # None for a torn or corrupted line
+    if not line.endswith(b"\n"):
+        return None
+    crc, _, data = line[:-1].partition(b" ")
+    try:
+        if len(crc) != 8 or int(crc, 16) != zlib.crc32(data):
+            return None
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+class OrderJournal:
+    """Append-only file of captured orders.
+
+    With sync_interval None each append waits for an fsync, and concurrent
+    appends share them: an append whose line an fsync already covered
+    returns without issuing its own. Otherwise appends only write, and a
+    background thread fsyncs what was appended every sync_interval seconds.
+    """
+
+    def __init__(self, path, fsync=True, sync_interval=None):
+        self.path = path
+        self.fsync = fsync
+        self.sync_interval = sync_interval
+        self.entries = 0        # lines appended since the last truncate
+        self.syncs = 0
+        self._file = open(path, "ab+")
+        self._written = self._synced = self._file.tell()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._syncer = None
+        self._stop = threading.Event()
+
+    def read(self):
+        """Entries in the journal, oldest first. A damaged tail is cut off."""
+        with self._lock:
+            self._file.seek(0)
+            entries = []
+            good = 0
+            for line in self._file:
+                entry = _decode(line)
+                if entry is None:
+                    break
+                entries.append(entry)
+                good += len(line)
+            self._file.seek(0, os.SEEK_END)
+            if good < self._file.tell():
+                self._file.truncate(good)
+            self._written = self._synced = good
+            self.entries = len(entries)
+            return entries
+
+    def append(self, entry):
+        line = _encode(entry)
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.entries += 1
+            end = self._written = self._file.tell()
+            if self.fsync and self.sync_interval is not None and self._syncer is None:
+                self._syncer = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+                self._syncer.start()
+        if self.fsync and self.sync_interval is None:
+            self._sync(end)
+
+    def _sync_loop(self):
+        while not self._stop.wait(self.sync_interval):
+            self._sync(self._written)
+
+    def _sync(self, end):
+        with self._sync_lock:
+            if self._synced >= end:
+                return
+            target = self._written
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+            self._synced = target
+
+    def truncate(self, committed):
+        """Empty the journal if all of its entries have committed; returns
+        whether it did."""
+        with self._lock:
+            if committed != self.entries:
+                return False
+            with self._sync_lock:
+                self._file.truncate(0)
+                self._file.seek(0)
+                self._written = self._synced = 0
+                self.entries = 0
+            return True
+
+    def close(self):
+        if self._syncer is not None:
+            self._stop.set()
+            self._syncer.join()
+            self._syncer = None
+            self._sync(self._written)
+        with self._lock:
+            self._file.close()
+
+
+def _item_to_entry(item):
+    return {"product_id": item["product_id"], "product_name": item["product_name"],
+            "quantity": item["quantity"], "price": item["price"].cents,
+            "discount": item["discount"], "subtotal": item["subtotal"].cents}
+
+
+def _item_from_entry(item):
+    return dict(item, price=Money(item["price"]), subtotal=Money(item["subtotal"]))
+
+
+class OrderCapture:
+    """Journaled, group-committed order saving on top of a Database."""
+
+    # Most orders saved in one transaction
+    BATCH_SIZE = 500
+    # Back-off between attempts while the database keeps failing
+    RETRY_DELAY = 1.0
+    # Seconds between journal fsyncs; None fsyncs on every submit
+    SYNC_INTERVAL = 0.02
+
+    def __init__(self, db, path, batch_size=BATCH_SIZE, fsync=True, on_commit=None, sync_interval=SYNC_INTERVAL):
+        self.db = db
+        self.journal = OrderJournal(path, fsync, sync_interval)
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self.failed = deque(maxlen=100)
+        self.last_error = None
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._pending = set()   # keys submitted but not yet committed or rejected
+        self._captured = 0
+        self._committed = 0
+        self._rejected = 0
+        self._since_truncate = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._started = None
+        self._last_commit = None
+        self._thread = None
+        self._closing = False
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def is_pending(self, key):
+        with self._cond:
+            return key in self._pending
+
+    def start(self):
+        """Replay what an earlier run left in the journal, then start the
+        committer; returns the number of entries replayed."""
+        entries = self.journal.read()
+        for start in range(0, len(entries), self.batch_size):
+            self._commit(entries[start:start + self.batch_size], replay=True)
+        self.journal.truncate(self.journal.entries)
+        self._since_truncate = 0
+        self._thread = threading.Thread(target=self._run, name="order-committer", daemon=True)
+        self._thread.start()
+        return len(entries)
+
+    def submit(self, customer_ref, order_date, items, order_number=None, idempotency_key=None):
+        """Journal a priced order (items as from OrderService.build_item) and
+        queue it for the committer; returns its idempotency key."""
+        entry = {"key": idempotency_key or uuid.uuid4().hex, "order_number": order_number or None,
+                 "customer_ref": customer_ref, "order_date": order_date,
+                 "items": [_item_to_entry(item) for item in items]}
+        self.journal.append(entry)
+        with self._cond:
+            self._captured += 1
+            self._pending.add(entry["key"])
+            if self._started is None:
+                self._started = time.perf_counter()
+        self._queue.put(entry)
+        return entry["key"]
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                return
+            batch = [entry]
+            stop = False
+            # Everything that queued up during the last commit goes in this one
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            while True:
+                try:
+                    self._commit(batch)
+                    break
+                except Exception as e:
+                    # Still in the journal; keep trying, or replay on next start
+                    self.last_error = repr(e)
+                    if stop or self._closing:
+                        return
+                    time.sleep(self.RETRY_DELAY)
+            if stop:
+                return
+
+    def _commit(self, batch, replay=False):
+        results = self.db.place_orders([(entry["customer_ref"], entry["order_date"],
+                                         [_item_from_entry(item) for item in entry["items"]],
+                                         entry["order_number"], entry["key"]) for entry in batch])
+        outcomes = []
+        rejects = []
+        for entry, result in zip(batch, results):
+            if isinstance(result, Exception):
+                outcome = {"key": entry["key"], "order_number": entry["order_number"], "error": str(result)}
+                rejects.append((entry["key"], entry["order_number"], entry["customer_ref"], entry["order_date"],
+                                json.dumps(entry, separators=(",", ":")), str(result)))
+                self.failed.append(outcome)
+            else:
+                outcome = {"key": entry["key"], "order_id": result[0], "order_number": result[1],
+                           "created": result[2]}
+            outcomes.append(outcome)
+        if rejects:
+            # Stored before the journal is truncated; if this fails the batch
+            # is retried, and its saved orders come back as already created
+            self.db.record_capture_rejects(rejects)
+
+        with self._cond:
+            self._pending.difference_update(entry["key"] for entry in batch)
+            if not replay:
+                self._committed += len(batch) - len(rejects)
+                self._rejected += len(rejects)
+                self._batches += 1
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._last_commit = time.perf_counter()
+                self._cond.notify_all()
+        if not replay:
+            self._since_truncate += len(batch)
+            if self.journal.truncate(self._since_truncate):
+                self._since_truncate = 0
+        self.last_error = None
+        if self.on_commit is not None:
+            self.on_commit(outcomes)
+
+    def flush(self, timeout=None):
+        """Wait until every captured order has been committed or rejected."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._committed + self._rejected < self._captured:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        with self._cond:
+            elapsed = (self._last_commit - self._started) if self._last_commit and self._started else 0.0
+            return {
+                "captured": self._captured,
+                "committed": self._committed,
+                "rejected": self._rejected,
+                "pending": self._captured - self._committed - self._rejected,
+                "batches": self._batches,
+                "average_batch": round((self._committed + self._rejected) / self._batches, 1)
+                if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "journal_fsyncs": self.journal.syncs,
+                "orders_per_second": round(self._committed / elapsed, 1) if elapsed else 0.0,
+                "last_error": self.last_error,
+            }
+
+    def close(self, timeout=None):
+        """Commit what is queued, stop the committer and close the journal."""
+        if self._thread is not None:
+            self._closing = True
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        self.journal.close()
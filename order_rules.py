@@ -0,0 +1,28 @@
+class ValidationError(ValueError):
+    pass
+
+
+def parse_line(product_name, qty_text, discount_text):
+    """Validate an order line the way the order form does; returns (qty, discount)."""
+    try:
+        # str() first so a JSON 2.5 is rejected instead of truncated to 2
+        qty = int(str(qty_text))
+        discount = float(discount_text)
+    except (TypeError, ValueError):
+        raise ValidationError("Please enter valid numbers for quantity and discount")
+
+    if not product_name:
+        raise ValidationError("Please select a product")
+
+    if qty <= 0:
+        raise ValidationError("Quantity must be greater than 0")
+
+    if discount < 0 or discount > 100:
+        raise ValidationError("Discount must be between 0 and 100")
+
+    return qty, discount
+
+
+def line_subtotal(qty, price, discount):
+    # price is Money; rounded to the cent once, after the discount
+    return (price * qty).apply_discount(discount)
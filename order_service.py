@@ -0,0 +1,398 @@
+"""Order and product operations with no GUI dependencies.
+
+The Tk windows, the HTTP server and scripts all go through OrderService, so
+validation, pricing and persistence live in one place.
+"""
+import sqlite3
+from datetime import date
+
+import order_rules
+from catalog import ProductCatalog
+from lru import LRUCache
+from money import Money
+from order_rules import ValidationError
+
+
+class NotFoundError(LookupError):
+    pass
+
+
+class DuplicateOrderError(ValidationError):
+    pass
+
+
+class PriceChangedError(ValidationError):
+    pass
+
+
+def order_to_dict(row):
+    return {
+        "order_id": row[0],
+        "order_number": row[1],
+        "customer_ref": row[2],
+        "order_date": row[3],
+        "total_amount": Money.from_cents(row[4]),
+    }
+
+
+def detail_to_dict(row):
+    return {
+        "product": row[0],
+        "quantity": row[1],
+        "price": Money.from_cents(row[2]),
+        "discount": row[3],
+        "subtotal": Money.from_cents(row[4]),
+    }
+
+
+def reject_to_dict(row):
+    return {
+        "idempotency_key": row[0],
+        "order_number": row[1],
+        "customer_ref": row[2],
+        "order_date": row[3],
+        "error": row[4],
+        "rejected_at": row[5],
+    }
+
+
+def product_to_dict(product, price):
+    # price: the price in effect, from ProductCatalog.price_on
+    return {"id": product.id, "name": product.name, "price": price}
+
+
+def parse_date(value):
+    # A YYYY-MM-DD date string, or None when blank
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValidationError("Dates must be YYYY-MM-DD")
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValidationError("Dates must be YYYY-MM-DD")
+
+
+def price_day(order_date):
+    # The day a draft is priced on: its own date, or today while it has none
+    # or is still being typed; saving checks the date with parse_date
+    try:
+        return parse_date(order_date) or date.today().isoformat()
+    except ValidationError:
+        return date.today().isoformat()
+
+
+class OrderService:
+    # Orders whose detail lines are kept in memory
+    DETAILS_CACHE_SIZE = 256
+
+    def __init__(self, db, catalog=None, capture=None):
+        self.db = db
+        self.catalog = catalog or ProductCatalog(db)
+        # order_journal.OrderCapture; when set, new orders are journaled and
+        # committed in the background
+        self.capture = capture
+        self.details_cache = LRUCache(self.DETAILS_CACHE_SIZE)
+        self._details_stamp = None
+
+    # Products
+
+    def list_products(self):
+        self.catalog.refresh()
+        return self.catalog.products()
+
+    def current_price(self, product):
+        return self.catalog.price_on(product.id)
+
+    def get_product(self, product_id):
+        self.catalog.refresh()
+        product = self.catalog.get(product_id)
+        if product is None:
+            raise NotFoundError(f"Product {product_id} not found")
+        return product
+
+    def parse_product(self, name, price):
+        try:
+            price = Money.parse(price)
+        except ValueError:
+            raise ValidationError("Please enter a valid price")
+
+        if not name:
+            raise ValidationError("Product name is required")
+
+        if price <= Money(0):
+            raise ValidationError("Price must be greater than 0")
+
+        return name, price
+
+    def add_product(self, name, price):
+        name, price = self.parse_product(name, price)
+        product_id = self.db.add_product(name, price)
+        self.catalog.refresh()
+        return self.catalog.get(product_id)
+
+    def update_product(self, product_id, name=None, price=None, effective_from=None):
+        """Rename and/or reprice a product; a new price applies from
+        effective_from (default today)."""
+        current = self.get_product(product_id)
+        name, new_price = self.parse_product(current.name if name is None else name,
+                                             self.catalog.price_on(product_id) if price is None else price)
+        effective_from = self.parse_effective_date(effective_from)
+        if price is not None and new_price == self.catalog.price_on(product_id, effective_from):
+            price = None
+        if not self.db.update_product(product_id, name, None if price is None else new_price, effective_from):
+            raise NotFoundError(f"Product {product_id} not found")
+        self.catalog.refresh()
+        return self.catalog.get(product_id)
+
+    def parse_effective_date(self, value):
+        # Blank means today
+        return parse_date(value) or date.today().isoformat()
+
+    def reprice_products(self, prices, effective_from=None):
+        """Reprice many products at once from (product id or name, price)
+        pairs, all from effective_from (default today), in one transaction.
+
+        Every pair is checked before anything is written; returns the number
+        of products repriced.
+        """
+        effective_from = self.parse_effective_date(effective_from)
+        self.catalog.refresh()
+        changes = {}
+        for ref, price in prices:
+            if isinstance(ref, int):
+                product = self.catalog.get(ref)
+            else:
+                product = self.catalog.find(ref) if isinstance(ref, str) else None
+            if product is None:
+                raise ValidationError(f"Unknown product: {ref}")
+            _, price = self.parse_product(product.name, price)
+            changes[product.id] = price
+        if not changes:
+            raise ValidationError("No prices given")
+        count = self.db.reprice_products(list(changes.items()), effective_from)
+        self.catalog.refresh()
+        return count
+
+    def price_history(self, product_id):
+        self.get_product(product_id)
+        return [{"effective_from": day, "price": price} for day, price in self.catalog.price_history(product_id)]
+
+    def delete_product(self, product_id):
+        # Fails with sqlite3.IntegrityError while order lines still reference it
+        if not self.db.delete_product(product_id):
+            raise NotFoundError(f"Product {product_id} not found")
+        self.catalog.refresh()
+
+    # Orders
+
+    def build_item(self, product_name, qty, discount, order_date=None):
+        """Validate one order line and price it from the catalog, at the
+        price in effect on order_date (blank for today)."""
+        order_date = parse_date(order_date)
+        qty, discount = order_rules.parse_line(product_name, qty, discount)
+
+        product = self.catalog.find(product_name) if isinstance(product_name, str) else None
+        if product is None:
+            raise ValidationError(f"Unknown product: {product_name}")
+
+        price = self.catalog.price_on(product.id, price_day(order_date))
+        return {
+            "product_id": product.id,
+            "product_name": product.name,
+            "quantity": qty,
+            "price": price,
+            "discount": discount,
+            "subtotal": order_rules.line_subtotal(qty, price, discount),
+        }
+
+    def parse_order_header(self, order_number, customer_ref, order_date):
+        # Number and customer reference are text (or None), the date YYYY-MM-DD or blank
+        for label, value in (("Order number", order_number), ("Customer reference", customer_ref)):
+            if value is not None and not isinstance(value, str):
+                raise ValidationError(f"{label} must be text")
+        return order_number, customer_ref, parse_date(order_date)
+
+    def create_order(self, order_number, customer_ref, order_date, lines, idempotency_key=None,
+                     expected_total=None):
+        """Save an order from lines of {"product", "quantity", "discount"}.
+
+        Lines are priced as of order_date, which must be YYYY-MM-DD or
+        blank. With expected_total (the total
+        the caller showed), PriceChangedError is raised if they now come to
+        a different total.
+
+        A blank order_number is allocated from the order number sequence. If
+        an order was already saved under idempotency_key, that order is
+        returned unchanged with "created" False.
+
+        In capture mode the order is only journaled here: the result has
+        "queued" True, and no order_id or allocated number yet.
+        """
+        if not lines:
+            raise ValidationError("Cannot save empty order")
+        order_number, customer_ref, order_date = self.parse_order_header(order_number, customer_ref, order_date)
+
+        self.catalog.refresh()
+        items = [self.build_item(line.get("product"), line.get("quantity"), line.get("discount", 0), order_date)
+                 for line in lines]
+        if expected_total is not None and sum(item["subtotal"] for item in items) != expected_total:
+            raise PriceChangedError("Prices have changed since the order was entered; "
+                                    "check the total and save again")
+        if self.capture is not None:
+            return self.capture_order(order_number, customer_ref, order_date, items, idempotency_key)
+        try:
+            order_id, order_number, created = self.db.place_order(customer_ref, order_date, items,
+                                                                  order_number or None, idempotency_key)
+        except sqlite3.IntegrityError:
+            if self.db.fetch_order(order_number) is not None or self.db.order_number_archived(order_number):
+                raise DuplicateOrderError(f"Order number {order_number} already exists")
+            raise
+
+        if not created:
+            order = self.get_order(order_number)
+            order["created"] = False
+            return order
+
+        self.details_cache.pop(order_id)
+        return {
+            "order_id": order_id,
+            "order_number": order_number,
+            "customer_ref": customer_ref,
+            "order_date": order_date,
+            "total_amount": sum(item["subtotal"] for item in items),
+            "created": True,
+        }
+
+    def capture_order(self, order_number, customer_ref, order_date, items, idempotency_key=None):
+        # A clash with a number already on file can still be reported now;
+        # one with an order queued alongside is only found at commit
+        if order_number and (self.db.fetch_order(order_number) is not None
+                             or self.db.order_number_archived(order_number)):
+            raise DuplicateOrderError(f"Order number {order_number} already exists")
+        key = self.capture.submit(customer_ref, order_date, items, order_number or None, idempotency_key)
+        return {
+            "order_id": None,
+            "order_number": order_number or None,
+            "customer_ref": customer_ref,
+            "order_date": order_date,
+            "total_amount": sum(item["subtotal"] for item in items),
+            "created": True,
+            "queued": True,
+            "idempotency_key": key,
+        }
+
+    def capture_status(self, idempotency_key):
+        """What became of a captured order: "pending", "committed" (with the
+        order) or "rejected" (with the error)."""
+        if self.capture is not None and self.capture.is_pending(idempotency_key):
+            return {"idempotency_key": idempotency_key, "status": "pending"}
+        row = self.db.fetch_order_by_key(idempotency_key)
+        if row is not None:
+            return dict(order_to_dict(row), idempotency_key=idempotency_key, status="committed")
+        row = self.db.fetch_capture_reject(idempotency_key)
+        if row is not None:
+            return dict(reject_to_dict(row), status="rejected")
+        raise NotFoundError(f"No captured order with key {idempotency_key}")
+
+    def capture_rejects(self, limit=100):
+        """Captured orders that failed to commit, newest first."""
+        return [reject_to_dict(row) for row in self.db.fetch_capture_rejects(limit)]
+
+    def order_filters(self, text=None, date_from=None, date_to=None, min_total=None, max_total=None,
+                      product=None):
+        """Validate search inputs as typed (blank means unset) into list_orders filters."""
+        filters = {}
+        text = (text or "").strip()
+        if text:
+            filters["text"] = text
+        for name, value in (("date_from", date_from), ("date_to", date_to)):
+            value = parse_date(value)
+            if value:
+                filters[name] = value
+        for name, value in (("min_total", min_total), ("max_total", max_total)):
+            if value not in (None, ""):
+                try:
+                    filters[name] = Money.parse(value).cents
+                except ValueError:
+                    raise ValidationError("Please enter a valid amount")
+        product = (product or "").strip()
+        if product:
+            filters["product"] = product
+        return filters
+
+    def list_orders(self, after=None, before=None, limit=100, filters=None):
+        """One page of orders, newest first, after or before an (order_date, order_id) cursor.
+
+        filters (see order_filters) narrows the list; paging works the same.
+        """
+        if before is not None:
+            rows = self.db.fetch_orders_page_before(before, limit, filters)
+        else:
+            rows = self.db.fetch_orders_page(after, limit, filters)
+        return [order_to_dict(row) for row in rows]
+
+    def orders_stamp(self):
+        """A value that changes whenever orders are added or removed."""
+        return self.db.fetch_orders_stamp()
+
+    def get_order(self, order_number):
+        row = self.db.fetch_order(order_number)
+        if row is None:
+            raise NotFoundError(f"Order {order_number} not found")
+        return order_to_dict(row)
+
+    def get_order_details(self, order_number):
+        return [detail_to_dict(row) for row in self.db.fetch_order_details(order_number)]
+
+    # Detail lines by order_id, through details_cache. Lines show product
+    # names, so the cache is dropped whenever the catalog has seen a change.
+
+    def _check_details_stamp(self):
+        stamp = (self.catalog.version, self.catalog.deletions)
+        if stamp != self._details_stamp:
+            self.details_cache.clear()
+            self._details_stamp = stamp
+
+    def cached_order_details(self, order_id):
+        """Cached detail lines for order_id, or None without touching the database."""
+        self._check_details_stamp()
+        return self.details_cache.get(order_id)
+
+    def order_details(self, order_id):
+        details = self.cached_order_details(order_id)
+        if details is None:
+            details = self.prefetch_order_details([order_id])[order_id]
+        return details
+
+    def prefetch_order_details(self, order_ids):
+        """Load and cache the details of every order in order_ids not cached yet."""
+        self._check_details_stamp()
+        stamp = self._details_stamp
+        found = {}
+        missing = []
+        for order_id in order_ids:
+            if order_id in self.details_cache:
+                found[order_id] = self.details_cache.get(order_id)
+            else:
+                missing.append(order_id)
+        if missing:
+            loaded = {order_id: [] for order_id in missing}
+            for row in self.db.fetch_order_details_for(missing):
+                loaded[row[0]].append(detail_to_dict(row[1:]))
+            # Rows read before a catalog change must not outlive it
+            if stamp == self._details_stamp:
+                for order_id, details in loaded.items():
+                    self.details_cache.put(order_id, details)
+            found.update(loaded)
+        return found
+
+    def invalidate_order_details(self, order_ids=None):
+        if order_ids is None:
+            self.details_cache.clear()
+        else:
+            for order_id in order_ids:
+                self.details_cache.pop(order_id)
@@ -1,19 +1,50 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import sqlite3
+from tkinter import filedialog
+import argparse
+import json
+import os
+import queue
+import time
+import uuid
+from collections import deque
 from datetime import datetime
 
+from catalog import ProductCatalog
+from database import get_database
+from instrumentation import metrics, profiled
+from order_draft import OrderDraft
+from order_journal import OrderCapture
+from order_service import OrderService, PriceChangedError, ValidationError, price_day
+from tree_rows import TreeRows
+from worker import DbWorker
+
 class ProductManagement:
-    def __init__(self):
+    def __init__(self, service=None, worker=None):
+        self.service = service or OrderService(get_database())
+        self.catalog = self.service.catalog
         self.window = tk.Toplevel()
         self.window.title("Product Management")
         self.window.geometry("600x400")
+        self.worker = worker or DbWorker(self.window)
+        # Catalog counters and day last drawn, and each product's row as
+        # last formatted, reused while the product and its price are unchanged
+        self.drawn = None
+        self.product_rows = {}
+        # Closing only hides the window, so reopening it is instant
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
         
         # Create frames
         self.create_widgets()
         self.load_products()
         
+    def show(self):
+        # Reopened: redraws only if the catalog changed meanwhile
+        self.window.deiconify()
+        self.window.lift()
+        self.load_products()
+        
     def create_widgets(self):
         # Product List Frame
         list_frame = ttk.LabelFrame(self.window, text="Product List", padding=10)
@@ -34,6 +65,8 @@ class ProductManagement:
         self.tree.column('price', width=100)
         
         self.tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.rows = TreeRows(self.tree)
+        self.tree.bind('<<TreeviewSelect>>', self.on_product_select)
         
         # Add Product Frame
         add_frame = ttk.LabelFrame(self.window, text="Add New Product", padding=10)
@@ -58,64 +91,156 @@ class ProductManagement:
         # Refresh Button
         self.refresh_button = ttk.Button(add_frame, text="Refresh List", command=self.load_products)
         self.refresh_button.grid(row=0, column=5, padx=5, pady=5)
+        
+        # Edit the selected product; a new price applies from the given date
+        ttk.Label(add_frame, text="Effective From:").grid(row=1, column=2, padx=5, pady=5)
+        self.effective_var = tk.StringVar(value=datetime.now().strftime('%Y-%m-%d'))
+        ttk.Entry(add_frame, textvariable=self.effective_var).grid(row=1, column=3, padx=5, pady=5)
+        self.update_button = ttk.Button(add_frame, text="Update Product", command=self.update_product)
+        self.update_button.grid(row=1, column=4, padx=5, pady=5)
     
     def load_products(self):
-        # Clear existing items
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Load products from database
-        conn = sqlite3.connect('order_system.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM products")
-        for row in c.fetchall():
-            self.tree.insert('', 'end', values=row)
-        conn.close()
+        # Refresh the shared catalog in the background, then redraw
+        self.worker.submit(self.catalog.refresh, on_done=self.populate_products,
+                           on_error=self.show_db_error, key=(self, 'products'), owner=self.window,
+                           name="load_products")
+    
+    @profiled("ui", rows=lambda self, changed=True: len(self.catalog))
+    def populate_products(self, changed=True):
+        # Prices shown are today's, so a new day redraws too
+        today = datetime.now().strftime('%Y-%m-%d')
+        stamp = (self.catalog.version, self.catalog.deletions, self.catalog.price_version, today)
+        if stamp == self.drawn:
+            return
+        
+        rows = []
+        product_rows = {}
+        for product in self.catalog.products():
+            price = self.catalog.price_on(product.id, today)
+            entry = self.product_rows.get(product.id)
+            if entry is None or entry[0] is not product or entry[1] is not price:
+                entry = (product, price, (str(product.id), (product.id, product.name, price.format())))
+            product_rows[product.id] = entry
+            rows.append(entry[2])
+        self.product_rows = product_rows
+        self.rows.sync(rows)
+        self.drawn = stamp
+    
+    def show_db_error(self, error):
+        if isinstance(error, ValidationError):
+            messagebox.showerror("Error", str(error), parent=self.window)
+        else:
+            messagebox.showerror("Database Error", str(error), parent=self.window)
     
     def add_product(self):
-        try:
-            name = self.name_var.get()
-            price = float(self.price_var.get())
-            
-            if not name:
-                messagebox.showerror("Error", "Product name is required")
-                return
-            
-            if price <= 0:
-                messagebox.showerror("Error", "Price must be greater than 0")
-                return
-            
-            # Add to database
-            conn = sqlite3.connect('order_system.db')
-            c = conn.cursor()
-            c.execute("INSERT INTO products (name, price) VALUES (?, ?)", (name, price))
-            conn.commit()
-            conn.close()
-            
-            # Clear entries
-            self.name_var.set('')
-            self.price_var.set('')
-            
-            # Refresh product list
-            self.load_products()
-            messagebox.showinfo("Success", "Product added successfully")
-            
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid price")
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", str(e))
+        # Validated and saved by the service, off the Tk thread
+        self.add_button.state(['disabled'])
+        self.worker.submit(self.service.add_product, self.name_var.get(), self.price_var.get(),
+                           on_done=self.product_added, on_error=self.add_failed, owner=self.window)
+    
+    def product_added(self, product):
+        self.add_button.state(['!disabled'])
+        
+        # Clear entries
+        self.name_var.set('')
+        self.price_var.set('')
+        
+        # Refresh product list
+        self.populate_products()
+        messagebox.showinfo("Success", "Product added successfully", parent=self.window)
+    
+    def add_failed(self, error):
+        self.add_button.state(['!disabled'])
+        self.show_db_error(error)
+    
+    def on_product_select(self, event):
+        selected = self.tree.selection()
+        if selected:
+            product = self.catalog.get(int(selected[0]))
+            if product is not None:
+                self.name_var.set(product.name)
+                self.price_var.set(self.catalog.price_on(product.id).format().replace(',', ''))
+    
+    def update_product(self):
+        selected = self.tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a product to update", parent=self.window)
+            return
+        self.update_button.state(['disabled'])
+        self.worker.submit(self.service.update_product, int(selected[0]), self.name_var.get(),
+                           self.price_var.get(), self.effective_var.get(),
+                           on_done=self.product_updated, on_error=self.update_failed, owner=self.window,
+                           name="update_product")
+    
+    def product_updated(self, product):
+        self.update_button.state(['!disabled'])
+        self.populate_products()
+        messagebox.showinfo("Success", "Product updated successfully", parent=self.window)
+    
+    def update_failed(self, error):
+        self.update_button.state(['!disabled'])
+        self.show_db_error(error)
 
 
 class ViewOrders:
-    def __init__(self):
+    # Orders are fetched in pages as the list scrolls; only MAX_PAGES pages
+    # are kept in the Treeview at any time.
+    PAGE_SIZE = 100
+    MAX_PAGES = 3
+    # Orders either side of the selection whose details are loaded ahead
+    PREFETCH_AROUND = 10
+
+    def __init__(self, service=None, worker=None):
+        self.service = service or OrderService(get_database())
+        self.pages = deque()
+        self.at_start = True
+        self.at_end = True
+        self.paging = False
+        # Set by load_orders: the next page replaces the rows on show
+        self.replace_rows = False
+        self.filters = {}
+        # (max order_id, order count) when the list was last loaded
+        self.orders_stamp = None
         self.window = tk.Toplevel()
         self.window.title("View Orders")
-        self.window.geometry("800x600")
+        self.window.geometry("900x650")
+        self.worker = worker or DbWorker(self.window)
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
         
         self.create_widgets()
         self.load_orders()
         
+    def show(self):
+        # Reopened: reload only if orders were added or removed meanwhile
+        self.window.deiconify()
+        self.window.lift()
+        self.worker.submit(self.service.orders_stamp, on_done=self.check_stamp, on_error=self.show_db_error,
+                           key=(self, 'stamp'), owner=self.window, name="orders_stamp")
+    
+    def check_stamp(self, stamp):
+        if stamp != self.orders_stamp:
+            self.refresh_orders()
+        
     def create_widgets(self):
+        # Search Frame
+        search_frame = ttk.LabelFrame(self.window, text="Search", padding=10)
+        search_frame.pack(fill="x", padx=10, pady=5)
+        
+        self.search_vars = {}
+        fields = (('text', "Order No. / Customer:", 20), ('product', "Product:", 15),
+                  ('date_from', "From:", 11), ('date_to', "To:", 11),
+                  ('min_total', "Min Total:", 11), ('max_total', "Max Total:", 11))
+        for index, (name, label, width) in enumerate(fields):
+            row, column = divmod(index, 2)
+            ttk.Label(search_frame, text=label).grid(row=row, column=column * 2, padx=5, pady=2, sticky="e")
+            var = self.search_vars[name] = tk.StringVar()
+            entry = ttk.Entry(search_frame, textvariable=var, width=width)
+            entry.grid(row=row, column=column * 2 + 1, padx=5, pady=2, sticky="w")
+            entry.bind('<Return>', self.search_orders)
+        
+        ttk.Button(search_frame, text="Search", command=self.search_orders).grid(row=0, column=4, padx=5)
+        ttk.Button(search_frame, text="Clear", command=self.clear_search).grid(row=1, column=4, padx=5)
+        
         # Orders List Frame
         list_frame = ttk.LabelFrame(self.window, text="Orders List", padding=10)
         list_frame.pack(fill="both", expand=True, padx=10, pady=5)
@@ -137,12 +262,13 @@ class ViewOrders:
         self.orders_tree.column('total_amount', width=150)
         
         # Add scrollbar
-        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.orders_tree.yview)
-        self.orders_tree.configure(yscrollcommand=scrollbar.set)
+        self.orders_scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.orders_tree.yview)
+        self.orders_tree.configure(yscrollcommand=self.on_orders_scroll)
         
         # Pack the treeview and scrollbar
         self.orders_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
-        scrollbar.pack(side="right", fill="y", pady=5)
+        self.orders_scrollbar.pack(side="right", fill="y", pady=5)
+        self.order_rows = TreeRows(self.orders_tree)
         
         # Order Details Frame
         details_frame = ttk.LabelFrame(self.window, text="Order Details", padding=10)
@@ -170,155 +296,368 @@ class ViewOrders:
         # Pack the details treeview and scrollbar
         self.details_tree.pack(side="left", fill="both", expand=True, padx=5, pady=5)
         details_scrollbar.pack(side="right", fill="y", pady=5)
+        self.detail_rows = TreeRows(self.details_tree)
         
         # Bind select event
         self.orders_tree.bind('<<TreeviewSelect>>', self.show_order_details)
         
         # Refresh button
-        refresh_button = ttk.Button(self.window, text="Refresh", command=self.load_orders)
+        refresh_button = ttk.Button(self.window, text="Refresh", command=self.refresh_orders)
         refresh_button.pack(pady=5)
     
+    def search_orders(self, event=None):
+        values = {name: var.get() for name, var in self.search_vars.items()}
+        try:
+            self.filters = self.service.order_filters(**values)
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e), parent=self.window)
+            return
+        self.detail_rows.clear()
+        self.load_orders()
+    
+    def clear_search(self):
+        for var in self.search_vars.values():
+            var.set('')
+        self.search_orders()
+    
+    def refresh_orders(self):
+        self.service.invalidate_order_details()
+        self.load_orders()
+    
     def load_orders(self):
-        # Clear existing items
-        for item in self.orders_tree.get_children():
-            self.orders_tree.delete(item)
+        # Start again from the newest page; the rows on show stay until it
+        # arrives and are then diffed against it
+        self.replace_rows = True
+        self.pages.clear()
+        self.worker.submit(self.service.orders_stamp, on_done=self.set_stamp,
+                           key=(self, 'stamp'), owner=self.window, name="orders_stamp")
+        self.at_start = True
+        self.at_end = False
+        self.paging = True
+        self.load_next_page()
+    
+    def set_stamp(self, stamp):
+        self.orders_stamp = stamp
+    
+    def on_orders_scroll(self, first, last):
+        self.orders_scrollbar.set(first, last)
+        if self.paging:
+            return
+        # Fetch more rows once the view gets close to either edge
+        if float(last) > 0.9 and not self.at_end:
+            self.paging = True
+            self.window.after_idle(self.load_next_page)
+        elif float(first) < 0.1 and not self.at_start:
+            self.paging = True
+            self.window.after_idle(self.load_previous_page)
+    
+    def order_key(self, order):
+        # Keyset cursor for paging
+        return (order["order_date"], order["order_id"])
+    
+    def order_rows_for(self, orders):
+        rows = []
+        for order in orders:
+            total = order["total_amount"]
+            rows.append((str(order["order_id"]),
+                         (order["order_number"], order["customer_ref"] or "", order["order_date"] or "",
+                          total.format() if total is not None else "")))
+        return rows
+    
+    @profiled("ui")
+    def insert_order_rows(self, orders, index):
+        return self.order_rows.insert(self.order_rows_for(orders), index)
+    
+    @profiled("ui")
+    def replace_order_rows(self, orders):
+        self.order_rows.sync(self.order_rows_for(orders))
+        return self.order_rows.order
+    
+    def top_index(self):
+        count = len(self.order_rows)
+        return round(self.orders_tree.yview()[0] * count) if count else 0
+    
+    def load_next_page(self):
+        after = self.pages[-1][1] if self.pages else None
+        self.worker.submit(self.service.list_orders, after, None, self.PAGE_SIZE, self.filters,
+                           on_done=self.append_page, on_error=self.page_failed,
+                           key=(self, 'page'), owner=self.window, name="load_orders")
+    
+    def append_page(self, rows):
+        self.paging = False
+        self.at_end = len(rows) < self.PAGE_SIZE
+        if self.replace_rows:
+            self.replace_rows = False
+            iids = list(self.replace_order_rows(rows))
+            self.orders_tree.yview_moveto(0)
+            if rows:
+                self.pages.append((self.order_key(rows[0]), self.order_key(rows[-1]), iids))
+                self.prefetch_details(iids[:self.PREFETCH_AROUND])
+            return
+        if not rows:
+            return
         
-        try:
-            conn = sqlite3.connect('order_system.db')
-            c = conn.cursor()
-            c.execute("""
-                SELECT order_number, customer_ref, order_date, total_amount 
-                FROM order_header 
-                ORDER BY order_date DESC
-            """)
-            
-            for row in c.fetchall():
-                formatted_total = f"{row[3]:,.2f}"
-                self.orders_tree.insert('', 'end', values=(row[0], row[1], row[2], formatted_total))
-            
-            conn.close()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", str(e))
+        top = self.top_index()
+        iids = self.insert_order_rows(rows, 'end')
+        self.pages.append((self.order_key(rows[0]), self.order_key(rows[-1]), iids))
+        if len(self.pages) == 1:
+            self.prefetch_details(iids[:self.PREFETCH_AROUND])
+        
+        # Drop the oldest page and keep the same rows in view
+        if len(self.pages) > self.MAX_PAGES:
+            dropped = self.pages.popleft()[2]
+            self.order_rows.delete(dropped)
+            self.at_start = False
+            count = len(self.order_rows)
+            self.orders_tree.yview_moveto(max(top - len(dropped), 0) / count)
     
-    def show_order_details(self, event):
-        # Clear existing details
-        for item in self.details_tree.get_children():
-            self.details_tree.delete(item)
+    def load_previous_page(self):
+        if not self.pages:
+            self.paging = False
+            self.at_start = True
+            return
+        self.worker.submit(self.service.list_orders, None, self.pages[0][0], self.PAGE_SIZE, self.filters,
+                           on_done=self.prepend_page, on_error=self.page_failed,
+                           key=(self, 'page'), owner=self.window, name="load_orders")
+    
+    def prepend_page(self, rows):
+        self.paging = False
+        self.at_start = len(rows) < self.PAGE_SIZE
+        if not rows:
+            return
         
+        top = self.top_index()
+        iids = self.insert_order_rows(rows, 0)
+        self.pages.appendleft((self.order_key(rows[0]), self.order_key(rows[-1]), iids))
+        
+        if len(self.pages) > self.MAX_PAGES:
+            self.order_rows.delete(self.pages.pop()[2])
+            self.at_end = False
+        count = len(self.order_rows)
+        self.orders_tree.yview_moveto((top + len(iids)) / count)
+    
+    def page_failed(self, error):
+        self.paging = False
+        self.show_db_error(error)
+    
+    def show_db_error(self, error):
+        messagebox.showerror("Database Error", str(error), parent=self.window)
+    
+    def show_order_details(self, event):
         # Get selected order
         selected_item = self.orders_tree.selection()
         if not selected_item:
+            self.detail_rows.clear()
+            self.worker.cancel((self, 'details'))
             return
         
-        order_number = self.orders_tree.item(selected_item)['values'][0]
-        
-        try:
-            conn = sqlite3.connect('order_system.db')
-            c = conn.cursor()
-            
-            # Updated query to use correct column names
-            c.execute("""
-                SELECT products.name, od.quantity, od.price, od.discount, od.subtotal
-                FROM order_detail od
-                JOIN products ON od.product_id = products.id
-                JOIN order_header oh ON od.order_id = oh.order_id
-                WHERE oh.order_number = ?
-            """, (order_number,))
-            
-            for row in c.fetchall():
-                formatted_price = f"{row[2]:,.2f}"
-                formatted_subtotal = f"{row[4]:,.2f}"
-                self.details_tree.insert('', 'end', values=(
-                    row[0],          # Product name
-                    row[1],          # Quantity
-                    formatted_price, # Price
-                    row[3],          # Discount
-                    formatted_subtotal # Subtotal
-                ))
-            
-            conn.close()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", str(e))
+        iid = selected_item[0]
+        order_id = int(iid)
+        
+        # Orders already seen or prefetched render at once
+        details = self.service.cached_order_details(order_id)
+        if details is not None:
+            self.worker.cancel((self, 'details'))
+            self.populate_details(details)
+        else:
+            self.detail_rows.clear()
+            # A newer selection supersedes any lookup still in flight
+            self.worker.submit(self.service.order_details, order_id,
+                               on_done=self.populate_details, on_error=self.show_db_error,
+                               key=(self, 'details'), owner=self.window, name="show_order_details")
+        
+        children = self.order_rows.order
+        index = children.index(iid)
+        self.prefetch_details(children[max(index - self.PREFETCH_AROUND, 0):index + self.PREFETCH_AROUND + 1])
+    
+    def prefetch_details(self, iids):
+        order_ids = [int(iid) for iid in iids if int(iid) not in self.service.details_cache]
+        if order_ids:
+            self.worker.submit(self.service.prefetch_order_details, order_ids,
+                               key=(self, 'prefetch'), owner=self.window, name="prefetch_order_details")
+    
+    @profiled("ui", rows=lambda self, details: len(details))
+    def populate_details(self, details):
+        # Lines have no key of their own, so rows are matched by position
+        # and switching orders rewrites values rather than items
+        self.detail_rows.sync([(str(index), (detail["product"], detail["quantity"], detail["price"].format(),
+                                             detail["discount"], detail["subtotal"].format()))
+                               for index, detail in enumerate(details)])
+
+class Diagnostics:
+    # Timings from instrumentation.metrics, redrawn while the window is open
+    REFRESH_MS = 2000
+
+    def __init__(self):
+        self.window = tk.Toplevel()
+        self.window.title("Diagnostics")
+        self.window.geometry("900x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.window.withdraw)
+        self.create_widgets()
+        self.refresh()
+    
+    def show(self):
+        self.window.deiconify()
+        self.window.lift()
+        self.refresh(reschedule=False)
+    
+    def create_widgets(self):
+        controls = ttk.Frame(self.window)
+        controls.pack(fill="x", padx=10, pady=5)
+        
+        self.enabled_var = tk.BooleanVar(value=metrics.enabled)
+        ttk.Checkbutton(controls, text="Collect metrics", variable=self.enabled_var,
+                        command=self.toggle).pack(side="left", padx=5)
+        ttk.Button(controls, text="Reset", command=self.reset).pack(side="left", padx=5)
+        ttk.Button(controls, text="Export JSON...", command=lambda: self.export(".json")).pack(side="left", padx=5)
+        ttk.Button(controls, text="Export Prometheus...", command=lambda: self.export(".prom")).pack(side="left", padx=5)
+        
+        # Totals per operation
+        stats_frame = ttk.LabelFrame(self.window, text="Operations", padding=10)
+        stats_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        columns = ('kind', 'name', 'count', 'avg_ms', 'max_ms', 'rows')
+        self.stats_tree = ttk.Treeview(stats_frame, columns=columns, show='headings')
+        for col, text, width in (('kind', 'Kind', 50), ('name', 'Operation', 420), ('count', 'Calls', 60),
+                                 ('avg_ms', 'Avg (ms)', 80), ('max_ms', 'Max (ms)', 80), ('rows', 'Rows', 80)):
+            self.stats_tree.heading(col, text=text)
+            self.stats_tree.column(col, width=width)
+        self.stats_tree.pack(fill="both", expand=True)
+        self.stats_rows = TreeRows(self.stats_tree)
+        
+        # Slow statements with their query plans
+        slow_frame = ttk.LabelFrame(self.window, text="Slow queries", padding=10)
+        slow_frame.pack(fill="both", expand=True, padx=10, pady=5)
+        self.slow_text = tk.Text(slow_frame, height=10, wrap="word")
+        self.slow_text.pack(fill="both", expand=True)
+    
+    def toggle(self):
+        metrics.enable(self.enabled_var.get())
+    
+    def reset(self):
+        metrics.reset()
+        self.refresh(reschedule=False)
+    
+    def export(self, extension):
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=extension,
+                                            initialfile="order_system_metrics" + extension)
+        if path:
+            metrics.dump(path)
+    
+    def refresh(self, reschedule=True):
+        if not self.window.winfo_exists():
+            return
+        if self.window.state() == 'withdrawn':
+            # Hidden: keep the poll going but skip the redraw
+            if reschedule:
+                self.window.after(self.REFRESH_MS, self.refresh)
+            return
+        snapshot = metrics.snapshot()
+        self.stats_rows.sync([(f'{stat["kind"]}:{stat["name"]}',
+                               (stat["kind"], stat["name"], stat["count"],
+                                stat["avg_ms"], stat["max_ms"], stat["rows"]))
+                              for stat in sorted(snapshot["stats"], key=lambda s: s["total_ms"], reverse=True)])
+        
+        self.slow_text.delete("1.0", tk.END)
+        for query in reversed(snapshot["slow_queries"]):
+            self.slow_text.insert(tk.END, f"{query['ms']} ms  {query['sql']}\n")
+            for step in query["plan"]:
+                self.slow_text.insert(tk.END, f"    {step}\n")
+        
+        if reschedule:
+            self.window.after(self.REFRESH_MS, self.refresh)
+
 
 class OrderProcessingSystem:
-    def __init__(self, root):
+    # Product type-ahead: wait this long after the last keystroke, then offer
+    # at most SUGGESTION_LIMIT matches
+    SEARCH_DELAY_MS = 150
+    SUGGESTION_LIMIT = 20
+    # How often capture mode checks for orders that failed to commit
+    CAPTURE_POLL_MS = 1000
+
+    def __init__(self, root, db=None, capture=None):
+        self.created = time.perf_counter()
         self.root = root
+        self.db = db or get_database()
+        self.capture = capture
+        # Type-ahead indexes are rebuilt by refresh() on the worker thread
+        self.catalog = ProductCatalog(self.db, index_search=True)
+        self.service = OrderService(self.db, self.catalog, capture=capture)
+        self.worker = DbWorker(self.root)
         self.root.title("Order Processing System")
         self.root.geometry("1000x600")
         
-        # Initialize database
-        self.init_database()
-        
-        # Load products
-        self.products = self.load_products()
-        
-        # Initialize order items
-        self.order_items = []
-        
+        # The order being entered, and the key that makes saving it idempotent
+        self.draft = OrderDraft()
+        self.save_key = uuid.uuid4().hex
+        self.search_job = None
+        # Secondary windows, created on first use and reused after that
+        self.windows = {}
+        # Seconds from construction to the window drawn and to the catalog loaded
+        self.startup_times = {}
+        self.on_ready = []
+        self.ready = False
+        # Capture mode: orders the committer rejected, queued from its thread
+        self.capture_rejects = queue.SimpleQueue()
+        if capture is not None:
+            capture.on_commit = self.capture_committed
+            self.root.after(self.CAPTURE_POLL_MS, self.check_capture_rejects)
+        
+        # The window comes up at once; the database is opened behind it
         self.create_widgets()
+        self.set_ready(False)
+        self.root.after_idle(self.window_shown)
+        self.start_database()
         
+    def start_database(self):
+        self.worker.submit(self.init_database, on_done=self.database_ready, on_error=self.show_db_error,
+                           key=(self, 'startup'), name="startup")
+    
     def init_database(self):
-        conn = sqlite3.connect('order_system.db')
-        c = conn.cursor()
-        
-        # Drop existing tables to ensure clean schema
-        c.execute("DROP TABLE IF EXISTS order_detail")
-        c.execute("DROP TABLE IF EXISTS order_header")
-        c.execute("DROP TABLE IF EXISTS products")
-        
-        # Create products table with correct column name
-        c.execute('''CREATE TABLE IF NOT EXISTS products
-                    (id INTEGER PRIMARY KEY,
-                     name TEXT NOT NULL,
-                     price REAL NOT NULL)''')
-        
-        # Create order_header table
-        c.execute('''CREATE TABLE IF NOT EXISTS order_header
-                    (order_id INTEGER PRIMARY KEY,
-                     order_number TEXT NOT NULL,
-                     customer_ref TEXT,
-                     order_date DATE,
-                     total_amount REAL)''')
-        
-        # Create order_detail table with correct foreign key reference
-        c.execute('''CREATE TABLE IF NOT EXISTS order_detail
-                    (detail_id INTEGER PRIMARY KEY,
-                     order_id INTEGER,
-                     product_id INTEGER,
-                     quantity INTEGER,
-                     price REAL,
-                     discount REAL,
-                     subtotal REAL,
-                     FOREIGN KEY (order_id) REFERENCES order_header (order_id),
-                     FOREIGN KEY (product_id) REFERENCES products (id))''')
-        
-        # Insert sample products if none exist
-        c.execute("SELECT COUNT(*) FROM products")
-        if c.fetchone()[0] == 0:
-            sample_products = [
-                (1, "BATTERY", 50000),
-                (2, "CHARGER", 100000),
-            ]
-            c.executemany("INSERT INTO products (id, name, price) VALUES (?,?,?)", sample_products)
-        
-        conn.commit()
-        conn.close()
-
+        # On a worker thread: migrate, replay journaled orders, load the catalog
+        self.db.migrate()
+        if self.capture is not None and not self.capture.running:
+            self.capture.start()
+        self.catalog.refresh()
     
-    def load_products(self):
-        conn = sqlite3.connect('order_system.db')
-        c = conn.cursor()
-        c.execute("SELECT * FROM products")
-        products = {row[0]: {"id": row[0], "name": row[1], "price": row[2]} for row in c.fetchall()}
-        conn.close()
-        return products
+    def window_shown(self):
+        self.startup_times["window"] = time.perf_counter() - self.created
+    
+    def database_ready(self, result):
+        self.startup_times["ready"] = time.perf_counter() - self.created
+        if metrics.enabled:
+            for name, elapsed in self.startup_times.items():
+                metrics.record("startup", name, elapsed)
+        self.set_ready(True)
+        self.update_suggestions()
+        callbacks, self.on_ready = self.on_ready, []
+        for callback in callbacks:
+            callback()
+    
+    def set_ready(self, ready):
+        # Entering orders needs the catalog
+        self.ready = ready
+        for button in (self.add_button, self.update_button, self.save_button):
+            button.state(['!disabled'] if ready else ['disabled'])
+        self.show_busy(self.worker.busy)
     
     def refresh_products(self):
-        self.products = self.load_products()
-        product_names = [p["name"] for p in self.products.values()]
-        self.product_dropdown['values'] = product_names
+        if not self.ready:
+            # Retry a startup that failed
+            self.start_database()
+            return
+        self.worker.submit(self.catalog.refresh, on_done=self.products_refreshed,
+                           on_error=self.show_db_error, key=(self, 'products'), name="load_products")
+    
+    def products_refreshed(self, changed):
+        if changed:
+            self.update_suggestions()
+    
+    def show_db_error(self, error):
+        if isinstance(error, ValidationError):
+            messagebox.showerror("Error", str(error))
+        else:
+            messagebox.showerror("Database Error", str(error))
     
     def create_widgets(self):
         # Menu Bar
@@ -336,6 +675,11 @@ class OrderProcessingSystem:
         menubar.add_cascade(label="Orders", menu=orders_menu)
         orders_menu.add_command(label="View Orders", command=self.open_view_orders)
         
+        # Tools Menu
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Tools", menu=tools_menu)
+        tools_menu.add_command(label="Diagnostics", command=self.open_diagnostics)
+        
         # Order Header Frame
         header_frame = ttk.LabelFrame(self.root, text="Order Information", padding=10)
         header_frame.pack(fill="x", padx=10, pady=5)
@@ -355,6 +699,9 @@ class OrderProcessingSystem:
         self.order_date = ttk.Entry(header_frame)
         self.order_date.insert(0, datetime.now().strftime('%Y-%m-%d'))
         self.order_date.grid(row=0, column=5, padx=5, pady=5)
+        # Lines are priced as of the order date
+        self.order_date.bind('<FocusOut>', self.reprice_draft)
+        self.order_date.bind('<Return>', self.reprice_draft)
         
         # Items Frame
         items_frame = ttk.LabelFrame(self.root, text="Order Items", padding=10)
@@ -376,6 +723,7 @@ class OrderProcessingSystem:
             self.tree.column(col, width=150)
         
         self.tree.pack(fill="both", expand=True, padx=5, pady=5)
+        self.tree.bind('<<TreeviewSelect>>', self.on_item_select)
         
         # Add Item Frame
         add_item_frame = ttk.Frame(items_frame)
@@ -384,9 +732,10 @@ class OrderProcessingSystem:
         # Product dropdown
         ttk.Label(add_item_frame, text="Product:").grid(row=0, column=0, padx=5, pady=5)
         self.product_var = tk.StringVar()
-        product_names = [p["name"] for p in self.products.values()]
-        self.product_dropdown = ttk.Combobox(add_item_frame, textvariable=self.product_var, values=product_names)
+        self.product_dropdown = ttk.Combobox(add_item_frame, textvariable=self.product_var,
+                                             values=self.catalog.search('', self.SUGGESTION_LIMIT))
         self.product_dropdown.grid(row=0, column=1, padx=5, pady=5)
+        self.product_dropdown.bind('<KeyRelease>', self.on_product_key)
         
         # Quantity entry
         ttk.Label(add_item_frame, text="Quantity:").grid(row=0, column=2, padx=5, pady=5)
@@ -408,6 +757,10 @@ class OrderProcessingSystem:
         self.add_button = ttk.Button(buttons_frame, text="Add Item", command=self.add_item)
         self.add_button.pack(side="left", padx=5)
         
+        # Update button, applies the quantity and discount to the selected line
+        self.update_button = ttk.Button(buttons_frame, text="Update Selected", command=self.update_item)
+        self.update_button.pack(side="left", padx=5)
+        
         # Remove button
         self.remove_button = ttk.Button(buttons_frame, text="Remove Selected", command=self.remove_item)
         self.remove_button.pack(side="left", padx=5)
@@ -426,67 +779,76 @@ class OrderProcessingSystem:
         
         self.total_label = ttk.Label(total_frame, text="Total: 0.00", font=('Arial', 12, 'bold'))
         self.total_label.pack(side="right", padx=10)
+        
+        # Busy indicator while background database work is pending
+        self.status_label = ttk.Label(total_frame, text="")
+        self.status_label.pack(side="left", padx=10)
+        self.worker.add_busy_listener(self.show_busy)
+    
+    def show_busy(self, busy):
+        if busy:
+            self.status_label.config(text="Working..." if self.ready else "Loading products...")
+        else:
+            self.status_label.config(text="" if self.ready else "Not connected")
+        self.root.config(cursor="watch" if busy else "")
+    
+    def on_product_key(self, event):
+        # Navigation keys move through the current suggestions
+        if event.keysym in ('Up', 'Down', 'Return', 'Escape', 'Tab'):
+            return
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(self.SEARCH_DELAY_MS, self.update_suggestions)
+    
+    def update_suggestions(self):
+        self.search_job = None
+        self.product_dropdown['values'] = self.catalog.search(self.product_var.get(), self.SUGGESTION_LIMIT)
+    
+    def open_window(self, name, factory):
+        # One window of each kind: a second click brings the first one back
+        if not self.ready:
+            self.on_ready.append(lambda: self.open_window(name, factory))
+            return
+        window = self.windows.get(name)
+        if window is not None and window.window.winfo_exists():
+            window.show()
+        else:
+            self.windows[name] = factory()
     
     def open_product_management(self):
-        ProductManagement()
+        self.open_window('products', lambda: ProductManagement(self.service, self.worker))
         
     def open_view_orders(self):
-        ViewOrders()
+        self.open_window('orders', lambda: ViewOrders(self.service, self.worker))
+    
+    def open_diagnostics(self):
+        self.open_window('diagnostics', Diagnostics)
     
     def add_item(self):
         try:
-            product_name = self.product_var.get()
-            qty = int(self.qty_var.get())
-            discount = float(self.discount_var.get())
-            
-            if not product_name:
-                messagebox.showerror("Error", "Please select a product")
-                return
+            # Validate, find the product and calculate the subtotal
+            # Priced as of the order date
+            item = self.service.build_item(self.product_var.get(), self.qty_var.get(), self.discount_var.get(),
+                                           self.order_date.get())
             
-            if qty <= 0:
-                messagebox.showerror("Error", "Quantity must be greater than 0")
-                return
-            
-            if discount < 0 or discount > 100:
-                messagebox.showerror("Error", "Discount must be between 0 and 100")
-                return
-            
-            # Find product by name
-            product = next((p for p in self.products.values() if p["name"] == product_name), None)
-            
-            # Calculate subtotal
-            price = product["price"]
-            subtotal = qty * price * (1 - discount/100)
-            
-            # Add to order items
-            self.order_items.append({
-                "product_id": product["id"],
-                "product_name": product["name"],
-                "quantity": qty,
-                "price": price,
-                "discount": discount,
-                "subtotal": subtotal
-            })
-            
-            # Add to treeview
-            self.tree.insert('', 'end', values=(
-                product["name"],
-                qty,
-                f"{price:,.2f}",
-                f"{discount:.2f}",
-                f"{subtotal:,.2f}"
-            ))
+            # Add to the draft; a repeat of an existing line only updates that row
+            iid, merged = self.draft.add(item)
+            if merged:
+                self.show_line(iid)
+            else:
+                self.tree.insert('', 'end', iid=iid, values=self.line_values(iid))
             
             # Update total
             self.update_total()
             
             # Clear entries
             self.product_var.set('')
+            self.update_suggestions()
             self.qty_var.set('1')
             self.discount_var.set('0')
             
-        except ValueError as e:
-            messagebox.showerror("Error", "Please enter valid numbers for quantity and discount")
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
     
     def remove_item(self):
         selected_item = self.tree.selection()
@@ -494,66 +856,129 @@ class OrderProcessingSystem:
             messagebox.showwarning("Warning", "Please select an item to remove")
             return
         
-        # Remove from treeview and order_items
-        for item in selected_item:
-            item_idx = self.tree.index(item)
-            self.tree.delete(item)
-            if 0 <= item_idx < len(self.order_items):
-                self.order_items.pop(item_idx)
+        # Rows and draft lines share iids
+        self.draft.remove(selected_item)
+        self.tree.delete(*selected_item)
         
         # Update total
         self.update_total()
     
+    def on_item_select(self, event):
+        # Load the selected line into the entries for editing
+        selected_item = self.tree.selection()
+        if len(selected_item) == 1:
+            item = self.draft[selected_item[0]]
+            self.qty_var.set(str(item["quantity"]))
+            self.discount_var.set(f"{item['discount']:g}")
+    
+    def update_item(self):
+        selected_item = self.tree.selection()
+        if len(selected_item) != 1:
+            messagebox.showwarning("Warning", "Please select one item to update")
+            return
+        
+        iid = selected_item[0]
+        try:
+            kept = self.draft.update(iid, self.qty_var.get(), self.discount_var.get())
+        except ValidationError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        if kept != iid:
+            # Merged into another line of the same product and discount
+            self.tree.delete(iid)
+            self.tree.selection_set(kept)
+        self.show_line(kept)
+        self.update_total()
+    
+    def line_values(self, iid):
+        item = self.draft[iid]
+        return (item["product_name"],
+                item["quantity"],
+                item["price"].format(),
+                f"{item['discount']:.2f}",
+                item["subtotal"].format())
+    
+    def reprice_draft(self, event=None):
+        # Re-price the lines at the order date; returns the iids that changed
+        day = price_day(self.order_date.get())
+        changed = self.draft.reprice(lambda item: self.catalog.price_on(item["product_id"], day))
+        for iid in changed:
+            self.show_line(iid)
+        if changed:
+            self.update_total()
+        return changed
+    
+    def show_line(self, iid):
+        self.tree.item(iid, values=self.line_values(iid))
+    
     def update_total(self):
-        total = sum(item["subtotal"] for item in self.order_items)
-        self.total_label.config(text=f"Total: {total:,.2f}")
+        self.total_label.config(text=f"Total: {self.draft.total.format()}")
     
     def save_order(self):
-        if not self.order_items:
+        if not self.draft:
             messagebox.showwarning("Warning", "Cannot save empty order")
             return
-            
-        if not self.order_number.get():
-            messagebox.showerror("Error", "Order number is required")
+        
+        if self.reprice_draft():
+            messagebox.showinfo("Prices Updated", "Prices were updated for the order date. "
+                                "Check the total and save again.")
             return
-            
-        try:
-            conn = sqlite3.connect('order_system.db')
-            c = conn.cursor()
-            
-            # Insert order header
-            total_amount = sum(item["subtotal"] for item in self.order_items)
-            c.execute('''INSERT INTO order_header 
-                        (order_number, customer_ref, order_date, total_amount)
-                        VALUES (?, ?, ?, ?)''',
-                     (self.order_number.get(),
-                      self.customer_ref.get(),
-                      self.order_date.get(),
-                      total_amount))
-            
-            order_id = c.lastrowid
-            
-            # Insert order details
-            for item in self.order_items:
-                c.execute('''INSERT INTO order_detail
-                            (order_id, product_id, quantity, price, discount, subtotal)
-                            VALUES (?, ?, ?, ?, ?, ?)''',
-                         (order_id,
-                          item["product_id"],
-                          item["quantity"],
-                          item["price"],
-                          item["discount"],
-                          item["subtotal"]))
-            
-            conn.commit()
-            messagebox.showinfo("Success", "Order saved successfully")
-            self.clear_order()
-            
-        except sqlite3.Error as e:
-            messagebox.showerror("Database Error", str(e))
-            conn.rollback()
-        finally:
-            conn.close()
+        
+        lines = self.draft.order_lines()
+        
+        # Validated and saved by the service in the background; the button
+        # stays disabled until it finishes. It is refused if the prices no
+        # longer come to the total shown.
+        self.save_button.state(['disabled'])
+        self.worker.submit(self.service.create_order,
+                           self.order_number.get(),
+                           self.customer_ref.get(),
+                           self.order_date.get(),
+                           lines,
+                           self.save_key,
+                           self.draft.total,
+                           on_done=self.order_saved, on_error=self.save_failed, name="save_order")
+    
+    def order_saved(self, order):
+        self.save_button.state(['!disabled'])
+        if order.get("queued"):
+            # Capture mode: journaled now, written to the database shortly
+            name = f"Order {order['order_number']}" if order["order_number"] else "Order"
+            messagebox.showinfo("Success", f"{name} captured; it will be saved in the background")
+        else:
+            messagebox.showinfo("Success", f"Order {order['order_number']} saved successfully")
+        self.clear_order()
+    
+    def capture_committed(self, outcomes):
+        # Committer thread: must not touch Tk
+        for outcome in outcomes:
+            if "error" in outcome:
+                self.capture_rejects.put(outcome)
+    
+    def check_capture_rejects(self):
+        rejected = []
+        while True:
+            try:
+                rejected.append(self.capture_rejects.get_nowait())
+            except queue.Empty:
+                break
+        if rejected:
+            lines = [f"{outcome['order_number'] or 'Order ' + outcome['key'][:8]}: {outcome['error']}"
+                     for outcome in rejected[:10]]
+            if len(rejected) > 10:
+                lines.append(f"... and {len(rejected) - 10} more")
+            messagebox.showerror("Captured Orders Not Saved",
+                                 "These captured orders could not be saved:\n\n" + "\n".join(lines)
+                                 + "\n\nThey are kept in the capture_rejects table.")
+        self.root.after(self.CAPTURE_POLL_MS, self.check_capture_rejects)
+    
+    def save_failed(self, error):
+        self.save_button.state(['!disabled'])
+        if isinstance(error, PriceChangedError):
+            # Show the prices the order would be saved at
+            self.reprice_draft()
+        self.show_db_error(error)
     
     def clear_order(self):
         self.order_number.delete(0, tk.END)
@@ -561,10 +986,36 @@ class OrderProcessingSystem:
         self.order_date.delete(0, tk.END)
         self.order_date.insert(0, datetime.now().strftime('%Y-%m-%d'))
         self.tree.delete(*self.tree.get_children())
-        self.order_items.clear()
+        self.draft.clear()
+        self.save_key = uuid.uuid4().hex
         self.update_total()
 
+def report_startup(app):
+    # --startup-report: print the startup times and quit
+    print(json.dumps({name: round(elapsed * 1000, 3) for name, elapsed in app.startup_times.items()}))
+    app.root.destroy()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Order Processing System")
+    parser.add_argument("db", nargs="?", help="database path (default: order_system.db)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print startup times as JSON once the catalog has loaded, then exit")
+    args = parser.parse_args()
+    
+    # Nothing touches the database before the window is up
+    db = get_database(args.db)
+    # Capture mode, when ORDER_SYSTEM_JOURNAL names a journal file; its
+    # journal is replayed by the background startup
+    capture = None
+    if os.environ.get("ORDER_SYSTEM_JOURNAL"):
+        capture = OrderCapture(db, os.environ["ORDER_SYSTEM_JOURNAL"])
     root = tk.Tk()
-    app = OrderProcessingSystem(root)
-    root.mainloop()
\ No newline at end of file
+    app = OrderProcessingSystem(root, db, capture)
+    if args.startup_report:
+        app.on_ready.append(lambda: root.after_idle(report_startup, app))
+    root.mainloop()
+    app.worker.shutdown()
+    if capture is not None:
+        capture.close()
+    db.close()
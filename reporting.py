@@ -0,0 +1,160 @@
+"""Sales reports served from the precomputed summary tables.
+
+    python reporting.py revenue --period month --from 2024-01-01 --to 2024-12-31
+    python reporting.py top-products --from 2024-01-01 --limit 10
+    python reporting.py discounts --period week
+    python reporting.py customers --limit 20
+    python reporting.py rebuild
+
+Dates are inclusive YYYY-MM-DD bounds; results print as JSON lines.
+"""
+import argparse
+import json
+import sys
+
+from database import Database, DEFAULT_DB_PATH
+from money import Money
+
+# Bucket expressions over the YYYY-MM-DD day column
+PERIODS = {
+    "day": "day",
+    # The Monday each week starts on, so a week spanning New Year stays whole
+    "week": "date(day, '-' || ((CAST(strftime('%w', day) AS INTEGER) + 6) % 7) || ' days')",
+    "month": "substr(day, 1, 7)",
+    "year": "substr(day, 1, 4)",
+}
+
+
+def _day_range(start, end, column="day"):
+    # Undated orders are stored under '' and only show up in unbounded reports
+    clauses = []
+    params = []
+    if start:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        clauses.append(f"{column} <= ?")
+        params.append(end)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class SalesReports:
+    def __init__(self, db):
+        self.db = db
+
+    def _query(self, sql, params=()):
+        with self.db.connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [d[0] for d in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor]
+        # Amounts come back as integer cents; report them as Money under the plain name
+        money_columns = [name for name in columns if name.endswith("_cents")]
+        for row in rows:
+            for name in money_columns:
+                row[name[:-len("_cents")]] = Money.from_cents(row.pop(name))
+        return rows
+
+    def revenue(self, period="day", start=None, end=None):
+        bucket = PERIODS[period]
+        where, params = _day_range(start, end)
+        return self._query(f"""
+            SELECT {bucket} AS period, SUM(orders) AS orders, SUM(lines) AS lines,
+                   SUM(quantity) AS quantity, SUM(revenue_cents) AS revenue_cents
+            FROM sales_daily{where}
+            GROUP BY 1 ORDER BY 1
+        """, params)
+
+    def discount_impact(self, period="month", start=None, end=None):
+        bucket = PERIODS[period]
+        where, params = _day_range(start, end)
+        return self._query(f"""
+            SELECT {bucket} AS period, SUM(gross_cents) AS gross_cents,
+                   SUM(discount_cents) AS discount_amount_cents, SUM(revenue_cents) AS revenue_cents,
+                   ROUND(100.0 * SUM(discount_cents) / NULLIF(SUM(gross_cents), 0), 2) AS discount_pct
+            FROM sales_daily{where}
+            GROUP BY 1 ORDER BY 1
+        """, params)
+
+    def top_products(self, start=None, end=None, limit=10, by="revenue"):
+        order_by = {"revenue": "revenue_cents", "quantity": "quantity"}.get(by)
+        if order_by is None:
+            raise ValueError(f"Cannot rank products by {by}")
+        where, params = _day_range(start, end, "s.day")
+        return self._query(f"""
+            SELECT s.product_id, p.name, SUM(s.quantity) AS quantity, SUM(s.revenue_cents) AS revenue_cents,
+                   SUM(s.discount_cents) AS discount_amount_cents
+            FROM sales_daily_product s
+            LEFT JOIN products p ON p.id = s.product_id
+            {where}
+            GROUP BY s.product_id
+            ORDER BY {order_by} DESC
+            LIMIT ?
+        """, params + [limit])
+
+    def product_daily(self, product_id, start=None, end=None):
+        where, params = _day_range(start, end)
+        where = where + (" AND" if where else " WHERE") + " product_id = ?"
+        return self._query(f"""
+            SELECT day, lines, quantity, gross_cents, discount_cents AS discount_amount_cents, revenue_cents
+            FROM sales_daily_product{where}
+            ORDER BY day
+        """, params + [product_id])
+
+    def customer_totals(self, limit=20, customer_ref=None):
+        if customer_ref is not None:
+            return self._query("SELECT * FROM sales_customer WHERE customer_ref = ?", (customer_ref,))
+        return self._query("SELECT * FROM sales_customer ORDER BY revenue_cents DESC LIMIT ?", (limit,))
+
+    def rebuild(self):
+        self.db.rebuild_sales_summaries()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sales reports")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    sub = parser.add_subparsers(dest="report", required=True)
+
+    for name in ("revenue", "discounts"):
+        p = sub.add_parser(name)
+        p.add_argument("--period", choices=sorted(PERIODS), default="day" if name == "revenue" else "month")
+        p.add_argument("--from", dest="start")
+        p.add_argument("--to", dest="end")
+
+    p = sub.add_parser("top-products")
+    p.add_argument("--from", dest="start")
+    p.add_argument("--to", dest="end")
+    p.add_argument("--limit", type=int, default=10)
+    p.add_argument("--by", choices=("revenue", "quantity"), default="revenue")
+
+    p = sub.add_parser("customers")
+    p.add_argument("--limit", type=int, default=20)
+    p.add_argument("--customer-ref")
+
+    sub.add_parser("rebuild")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        db.migrate()
+        reports = SalesReports(db)
+        if args.report == "rebuild":
+            reports.rebuild()
+            rows = []
+        elif args.report == "revenue":
+            rows = reports.revenue(args.period, args.start, args.end)
+        elif args.report == "discounts":
+            rows = reports.discount_impact(args.period, args.start, args.end)
+        elif args.report == "top-products":
+            rows = reports.top_products(args.start, args.end, args.limit, args.by)
+        else:
+            rows = reports.customer_totals(args.limit, args.customer_ref)
+    finally:
+        db.close()
+
+    for row in rows:
+        print(json.dumps(row, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
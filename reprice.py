@@ -0,0 +1,61 @@
+"""Bulk repricing from a CSV file, in one transaction.
+
+Each row names a product, by id or by name, and its new price:
+
+    product,price
+    BATTERY,525.00
+    17,99.95
+
+    python reprice.py prices.csv [--db order_system.db] [--effective-from 2025-01-01]
+
+The new prices apply from --effective-from (default today); orders dated
+earlier keep the prices in effect then. Nothing is written unless every row
+is valid.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from database import Database, DEFAULT_DB_PATH
+from order_service import OrderService, ValidationError
+
+
+def read_prices(f):
+    for record in csv.DictReader(f):
+        product = (record.get("product") or "").strip()
+        yield (int(product) if product.isdigit() else product), record.get("price")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprice many products at once")
+    parser.add_argument("path")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--effective-from", help="first day of the new prices, YYYY-MM-DD (default today)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        parser.error(f"no such file: {args.path}")
+
+    db = Database(args.db)
+    try:
+        db.migrate()
+        with open(args.path, newline="", encoding="utf-8") as f:
+            prices = list(read_prices(f))
+        started = time.perf_counter()
+        try:
+            count = OrderService(db).reprice_products(prices, args.effective_from)
+        except ValidationError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    finally:
+        db.close()
+
+    print(json.dumps({"repriced": count, "elapsed": round(time.perf_counter() - started, 3)}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
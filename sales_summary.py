@@ -0,0 +1,106 @@
+"""Maintenance of the precomputed sales summary tables.
+
+sales_daily, sales_daily_product and sales_customer are updated in the same
+transaction that writes the orders, so reports never scan order_detail.
+rebuild() recomputes them from scratch.
+"""
+from collections import defaultdict
+
+SUMMARY_TABLES = ("sales_daily", "sales_daily_product", "sales_customer")
+
+
+def apply_orders(conn, orders):
+    """Add (customer_ref, order_date, items) orders to the summaries."""
+    daily = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+    daily_product = defaultdict(lambda: [0, 0, 0, 0, 0])
+    customers = {}
+
+    for customer_ref, order_date, items in orders:
+        day = order_date or ""
+        day_totals = daily[day]
+        day_totals[0] += 1
+        order_revenue = 0
+        for item in items:
+            gross = item["price"].cents * item["quantity"]
+            subtotal = item["subtotal"].cents
+            day_totals[1] += 1
+            day_totals[2] += item["quantity"]
+            day_totals[3] += gross
+            day_totals[4] += gross - subtotal
+            day_totals[5] += subtotal
+            product_totals = daily_product[(day, item["product_id"])]
+            product_totals[0] += 1
+            product_totals[1] += item["quantity"]
+            product_totals[2] += gross
+            product_totals[3] += gross - subtotal
+            product_totals[4] += subtotal
+            order_revenue += subtotal
+
+        customer = customers.setdefault(customer_ref or "", [0, 0, day, day])
+        customer[0] += 1
+        customer[1] += order_revenue
+        customer[2] = min(customer[2], day)
+        customer[3] = max(customer[3], day)
+
+    conn.executemany('''INSERT INTO sales_daily
+                        (day, orders, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (day) DO UPDATE SET
+                            orders = orders + excluded.orders,
+                            lines = lines + excluded.lines,
+                            quantity = quantity + excluded.quantity,
+                            gross_cents = gross_cents + excluded.gross_cents,
+                            discount_cents = discount_cents + excluded.discount_cents,
+                            revenue_cents = revenue_cents + excluded.revenue_cents''',
+                     [(day, *totals) for day, totals in daily.items()])
+    conn.executemany('''INSERT INTO sales_daily_product
+                        (day, product_id, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (day, product_id) DO UPDATE SET
+                            lines = lines + excluded.lines,
+                            quantity = quantity + excluded.quantity,
+                            gross_cents = gross_cents + excluded.gross_cents,
+                            discount_cents = discount_cents + excluded.discount_cents,
+                            revenue_cents = revenue_cents + excluded.revenue_cents''',
+                     [(day, product_id, *totals) for (day, product_id), totals in daily_product.items()])
+    conn.executemany('''INSERT INTO sales_customer
+                        (customer_ref, orders, revenue_cents, first_order, last_order)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (customer_ref) DO UPDATE SET
+                            orders = orders + excluded.orders,
+                            revenue_cents = revenue_cents + excluded.revenue_cents,
+                            first_order = MIN(first_order, excluded.first_order),
+                            last_order = MAX(last_order, excluded.last_order)''',
+                     [(ref, *totals) for ref, totals in customers.items()])
+
+
+def rebuild(conn):
+    """Recompute every summary table from order_header and order_detail."""
+    for table in SUMMARY_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+
+    conn.execute('''INSERT INTO sales_daily_product
+                    (day, product_id, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                    SELECT COALESCE(oh.order_date, ''), od.product_id, COUNT(*), SUM(od.quantity),
+                           SUM(od.quantity * od.price_cents), SUM(od.quantity * od.price_cents - od.subtotal_cents),
+                           SUM(od.subtotal_cents)
+                    FROM order_detail od
+                    JOIN order_header oh ON od.order_id = oh.order_id
+                    GROUP BY 1, 2''')
+    conn.execute('''INSERT INTO sales_daily
+                    (day, orders, lines, quantity, gross_cents, discount_cents, revenue_cents)
+                    SELECT d.day, COALESCE(o.orders, 0), d.lines, d.quantity, d.gross_cents,
+                           d.discount_cents, d.revenue_cents
+                    FROM (SELECT day, SUM(lines) AS lines, SUM(quantity) AS quantity, SUM(gross_cents) AS gross_cents,
+                                 SUM(discount_cents) AS discount_cents, SUM(revenue_cents) AS revenue_cents
+                          FROM sales_daily_product GROUP BY day) d
+                    LEFT JOIN (SELECT COALESCE(order_date, '') AS day, COUNT(*) AS orders
+                               FROM order_header GROUP BY 1) o ON o.day = d.day''')
+    conn.execute('''INSERT INTO sales_customer
+                    (customer_ref, orders, revenue_cents, first_order, last_order)
+                    SELECT COALESCE(oh.customer_ref, ''), COUNT(*), SUM(COALESCE(t.revenue_cents, 0)),
+                           MIN(COALESCE(oh.order_date, '')), MAX(COALESCE(oh.order_date, ''))
+                    FROM order_header oh
+                    JOIN (SELECT order_id, SUM(subtotal_cents) AS revenue_cents FROM order_detail GROUP BY order_id) t
+                      ON t.order_id = oh.order_id
+                    GROUP BY 1''')
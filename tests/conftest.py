@@ -0,0 +1,27 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules live at the top of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    # A scratch copy of the committed database, never the file itself
+    path = str(tmp_path / "order_system.db")
+    shutil.copy(os.path.join(ROOT, "order_system.db"), path)
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    db = Database(db_path)
+    db.migrate()
+    yield db
+    db.close()
@@ -0,0 +1,86 @@
+import csv
+import sqlite3
+
+import pytest
+
+import archive
+import export
+from money import Money
+from order_service import DuplicateOrderError, OrderService
+
+
+def orders(db, numbers_and_dates):
+    product_id, _, price_cents = db.fetch_products()[0]
+    line = {"product_id": product_id, "quantity": 1, "price": Money(price_cents), "discount": 0,
+            "subtotal": Money(price_cents)}
+    return [(number, "ARCH", order_date, [line]) for number, order_date in numbers_and_dates]
+
+
+@pytest.fixture
+def archived(db):
+    db.insert_orders(orders(db, [(f"OLD-{n}", f"{2020 + n % 2}-0{n % 9 + 1}-15") for n in range(20)]
+                            + [("NEW-1", "2024-06-01"), ("UNDATED-1", None)]))
+    moved, clashes = archive.archive_orders(db, "2022-01-01")
+    return db, moved, clashes
+
+
+def count(db, where, params=()):
+    with db.connection() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM order_header WHERE {where}", params).fetchone()[0]
+
+
+def test_old_orders_move_to_yearly_archives(archived):
+    db, moved, clashes = archived
+    assert moved == {"2020": 10, "2021": 10} and clashes == {}
+    assert sorted(archive.archive_files(db.path)) == ["2020", "2021"]
+    assert count(db, "order_number LIKE 'OLD-%'") == 0
+    assert count(db, "order_number IN ('NEW-1', 'UNDATED-1')") == 2
+
+    found = archive.find_order(db, "OLD-3")
+    assert found["archive"] == "2021" and len(found["lines"]) == 1
+    assert archive.find_order(db, "NEW-1")["archive"] is None
+
+    with archive.archived_view(db, "2021-01-01", "2021-12-31") as conn:
+        assert conn.execute("SELECT COUNT(*) FROM all_order_header "
+                            "WHERE order_number LIKE 'OLD-%'").fetchone()[0] == 10
+    # Running again has nothing left to move
+    assert archive.archive_orders(db, "2022-01-01") == ({}, {})
+
+
+def test_archived_numbers_are_not_reused(archived):
+    db, _, _ = archived
+    assert db.order_number_archived("OLD-4")
+    assert db.insert_orders(orders(db, [("OLD-4", "2024-01-01")])) == [0]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.place_order("C", "2024-01-01", orders(db, [("x", None)])[0][3], order_number="OLD-4")
+    service = OrderService(db)
+    with pytest.raises(DuplicateOrderError):
+        service.create_order("OLD-4", "C", "2024-01-01", [{"product": db.fetch_products()[0][1], "quantity": 1}])
+
+
+def test_clash_with_an_unregistered_archive_is_reported(archived):
+    db, _, _ = archived
+    # As if the 2020 archive had been written before its numbers were recorded
+    with db.transaction() as conn:
+        conn.execute("DELETE FROM archived_order_numbers WHERE period = '2020'")
+    db.insert_orders(orders(db, [("OLD-0", "2020-05-05"), ("NEW-2", "2024-07-01")]))
+
+    moved, clashes = archive.archive_orders(db, "2022-01-01")
+    assert moved == {"2020": 0} and clashes == {"2020": ["OLD-0"]}
+    assert count(db, "order_number = 'OLD-0'") == 1
+    assert db.order_number_archived("OLD-0")
+    assert archive.main(["--db", db.path, "run", "--before", "2022-01-01"]) == 1
+
+
+def test_export_includes_archives_only_when_asked(archived, tmp_path):
+    db, _, _ = archived
+    path = str(tmp_path / "2020.csv")
+    assert export.export_orders(db, path, start="2020-01-01", end="2020-12-31")["rows"] == 0
+    stats = export.export_orders(db, path, start="2020-01-01", end="2020-12-31", include_archives=True)
+    assert stats["rows"] == 10
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["order_date"] for row in rows] == sorted(row["order_date"] for row in rows)
+    assert {row["customer_ref"] for row in rows} == {"ARCH"}
+    in_main = export.export_orders(db, path)["rows"]
+    assert export.export_orders(db, path, include_archives=True)["rows"] == in_main + 20
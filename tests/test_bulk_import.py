@@ -0,0 +1,74 @@
+import json
+
+import bulk_import
+
+
+def product_names(db):
+    return [name for _, name, _ in db.fetch_products()[:2]]
+
+
+def read_rejects(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_bad_items_are_rejected_not_fatal(db, tmp_path):
+    first, second = product_names(db)
+    orders = [
+        {"order_number": "IMP-1", "customer_ref": "C", "order_date": "2024-03-01",
+         "items": [{"product": first, "quantity": 2}, {"product": second, "quantity": 1, "discount": 5}]},
+        {"order_number": "IMP-2", "items": ["oops"]},
+        {"order_number": "IMP-3", "items": 5},
+        {"order_number": "IMP-4", "items": []},
+        {"order_number": "IMP-5", "customer_ref": {"id": 1}, "items": [{"product": first, "quantity": 1}]},
+        {"order_number": 6, "order_date": "2024-03-02", "items": [{"product": first, "quantity": 1}]},
+    ]
+    path = tmp_path / "orders.jsonl"
+    path.write_text("\n".join(json.dumps(order) for order in orders) + "\nnot json\n", encoding="utf-8")
+    errors = str(tmp_path / "rejects.jsonl")
+
+    stats = bulk_import.import_file(db, str(path), errors_path=errors)
+
+    assert (stats.imported_orders, stats.imported_rows, stats.rejected_rows) == (2, 3, 5)
+    assert [reject["line"] for reject in read_rejects(errors)] == [2, 3, 4, 5, 7]
+    assert [reject["error"] for reject in read_rejects(errors)][:4] == [
+        '"items" must be a list of objects', '"items" must be a list of objects', "Order has no items",
+        "Customer reference must be text"]
+    assert db.fetch_order("IMP-1") is not None
+    assert db.fetch_order("6") is not None
+    assert db.fetch_order("IMP-4") is None
+
+
+def test_order_with_a_bad_line_is_rejected_whole(db, tmp_path):
+    first, second = product_names(db)
+    path = tmp_path / "orders.csv"
+    path.write_text("order_number,customer_ref,order_date,product,quantity,discount\n"
+                    f"CSV-1,C,2024-03-01,{first},1,0\n"
+                    f"CSV-2,C,2024-03-01,{first},1,0\n"
+                    "CSV-2,C,2024-03-01,No such product,1,0\n"
+                    f"CSV-2,C,2024-03-01,{second},0,0\n"
+                    f"CSV-3,C,2024-03-01,{second},3,10\n", encoding="utf-8")
+    errors = str(tmp_path / "rejects.jsonl")
+
+    stats = bulk_import.import_file(db, str(path), errors_path=errors)
+
+    assert (stats.imported_orders, stats.imported_rows, stats.rejected_rows) == (2, 2, 3)
+    rejects = read_rejects(errors)
+    assert [reject["line"] for reject in rejects] == [3, 4, 5]
+    assert rejects[0]["error"] == "Order CSV-2 rejected: 2 of its lines failed"
+    assert db.fetch_order("CSV-2") is None
+
+
+def test_duplicate_numbers_are_rejected(db, tmp_path):
+    first, _ = product_names(db)
+    path = tmp_path / "orders.csv"
+    rows = "".join(f"DUP-{n % 2},C,2024-03-01,{first},1,0\nSPACER-{n},C,2024-03-01,{first},1,0\n"
+                   for n in range(3))
+    path.write_text("order_number,customer_ref,order_date,product,quantity,discount\n" + rows,
+                    encoding="utf-8")
+    errors = str(tmp_path / "rejects.jsonl")
+
+    stats = bulk_import.import_file(db, str(path), chunk_size=2, errors_path=errors)
+
+    assert (stats.imported_orders, stats.rejected_rows) == (5, 1)
+    assert read_rejects(errors)[0]["error"] == "Duplicate order number: DUP-0"
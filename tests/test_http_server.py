@@ -0,0 +1,69 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from http_server import OrderHTTPServer
+from order_service import OrderService
+
+
+@pytest.fixture
+def server(db):
+    server = OrderHTTPServer(("127.0.0.1", 0), OrderService(db), quiet=True)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    req = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}{path}", data=data,
+                                 method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+@pytest.fixture
+def product(db):
+    return db.fetch_products()[0][1]
+
+
+def test_post_order_and_replay(server, product):
+    body = {"customer_ref": "C", "order_date": "2024-05-01", "items": [{"product": product, "quantity": 2}]}
+    status, order = request(server, "POST", "/orders", body, {"Idempotency-Key": "http-1"})
+    assert status == 201 and order["created"]
+    status, again = request(server, "POST", "/orders", body, {"Idempotency-Key": "http-1"})
+    assert status == 200 and again["order_number"] == order["order_number"]
+    status, fetched = request(server, "GET", f"/orders/{order['order_number']}")
+    assert status == 200 and fetched["order_date"] == "2024-05-01"
+
+
+@pytest.mark.parametrize("header", [
+    {"order_number": ["a"]},
+    {"customer_ref": {"name": "C"}},
+    {"order_date": 5},
+    {"order_date": "05/01/2024"},
+])
+def test_bad_order_headers_are_client_errors(server, product, header):
+    body = dict({"customer_ref": "C", "order_date": "2024-05-01",
+                 "items": [{"product": product, "quantity": 1}]}, **header)
+    status, payload = request(server, "POST", "/orders", body)
+    assert status == 400, payload
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("POST", "/orders", {"items": "oops"}),
+    ("POST", "/orders", {"items": [{"product": 7, "quantity": 1}]}),
+    ("GET", "/orders?limit=0", None),
+    ("GET", "/orders?limit=-1", None),
+])
+def test_bad_requests_are_client_errors(server, method, path, body):
+    status, payload = request(server, method, path, body)
+    assert status == 400, payload
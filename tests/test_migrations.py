@@ -0,0 +1,17 @@
+import sqlite3
+
+import migrations
+
+
+def test_migrate_committed_database(db_path):
+    conn = sqlite3.connect(db_path)
+    before = conn.execute("SELECT COUNT(*) FROM order_header").fetchone()[0]
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM order_header").fetchone()[0] == before
+    # Totals are the exact sum of their lines, in cents
+    assert conn.execute("""SELECT COUNT(*) FROM order_header oh
+                           WHERE total_cents != (SELECT SUM(subtotal_cents) FROM order_detail
+                                                 WHERE order_id = oh.order_id)""").fetchone()[0] == 0
+    assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    conn.close()
@@ -0,0 +1,27 @@
+import pytest
+
+from money import Money
+
+
+def test_money_parse_rounds_half_up():
+    assert Money.parse("1.005") == Money(101)
+    assert Money.parse("1,234.50") == Money(123450)
+    assert Money.parse(2) == Money(200)
+    assert Money.parse("-0.005") == Money(-1)
+
+
+@pytest.mark.parametrize("value", ["", "abc", "nan", "inf", None])
+def test_money_parse_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        Money.parse(value)
+
+
+def test_money_discount_and_format():
+    assert Money(999).apply_discount(10) == Money(899)
+    assert Money(5).apply_discount(50) == Money(3)
+    assert Money(123456789).format() == "1,234,567.89"
+    assert str(Money(-5)) == "-0.05"
+    assert sum([Money(1), Money(2)]) == Money(3)
+    assert Money(250) * 3 == Money(750)
+    with pytest.raises(TypeError):
+        Money(1.5)
@@ -0,0 +1,46 @@
+import pytest
+
+from money import Money
+from order_draft import OrderDraft
+from order_rules import ValidationError
+
+
+def item(product_id, quantity, discount=0, price=1000):
+    return {"product_id": product_id, "product_name": f"P{product_id}", "quantity": quantity,
+            "price": Money(price), "discount": discount,
+            "subtotal": (Money(price) * quantity).apply_discount(discount)}
+
+
+def test_draft_merges_repeated_lines():
+    draft = OrderDraft()
+    first, merged = draft.add(item(1, 2))
+    assert not merged
+    again, merged = draft.add(item(1, 3))
+    assert (again, merged) == (first, True)
+    other, _ = draft.add(item(1, 1, discount=10))
+    assert other != first
+    assert draft[first]["quantity"] == 5
+    assert draft.total == Money(5000 + 900)
+
+
+def test_draft_update_merges_and_keeps_total():
+    draft = OrderDraft()
+    a, _ = draft.add(item(1, 2))
+    b, _ = draft.add(item(1, 1, discount=10))
+    kept = draft.update(b, "4", "0")
+    assert kept == a and b not in draft
+    assert draft[a]["quantity"] == 6
+    assert draft.total == Money(6000)
+    with pytest.raises(ValidationError):
+        draft.update(a, "0", "0")
+
+
+def test_draft_remove_and_reprice():
+    draft = OrderDraft()
+    a, _ = draft.add(item(1, 2))
+    b, _ = draft.add(item(2, 1))
+    assert draft.reprice(lambda line: Money(1500) if line["product_id"] == 1 else line["price"]) == [a]
+    assert draft.total == Money(3000 + 1000)
+    draft.remove([b, "missing"])
+    assert draft.total == Money(3000)
+    assert draft.order_lines() == [{"product": "P1", "quantity": 2, "discount": 0}]
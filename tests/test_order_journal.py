@@ -0,0 +1,97 @@
+import os
+import sqlite3
+
+import pytest
+
+from order_journal import OrderCapture, OrderJournal, _encode
+from order_service import OrderService
+
+
+@pytest.fixture
+def service(db):
+    service = OrderService(db)
+    service.catalog.refresh()
+    return service
+
+
+def entry(service, key, order_number=None):
+    name = service.db.fetch_products()[0][1]
+    item = service.build_item(name, 2, 0, "2024-04-01")
+    return {"key": key, "order_number": order_number, "customer_ref": "JRNL", "order_date": "2024-04-01",
+            "items": [{"product_id": item["product_id"], "product_name": item["product_name"],
+                       "quantity": 2, "price": item["price"].cents, "discount": 0,
+                       "subtotal": item["subtotal"].cents}]}
+
+
+def test_journal_keeps_entries_up_to_a_damaged_line(tmp_path):
+    path = str(tmp_path / "orders.journal")
+    with open(path, "wb") as f:
+        f.write(_encode({"n": 1}) + _encode({"n": 2}))
+        good = f.tell()
+        f.write(_encode({"n": 3}).replace(b'"n"', b'"m"') + _encode({"n": 4}) + _encode({"n": 5})[:-3])
+    journal = OrderJournal(path)
+    assert journal.read() == [{"n": 1}, {"n": 2}]
+    assert os.path.getsize(path) == good
+    journal.append({"n": 6})
+    assert journal.read() == [{"n": 1}, {"n": 2}, {"n": 6}]
+    journal.close()
+
+
+def test_start_replays_the_journal_once(service, tmp_path):
+    path = str(tmp_path / "orders.journal")
+    journal = OrderJournal(path)
+    for n in range(3):
+        journal.append(entry(service, f"replay-{n}"))
+    # The same order journaled twice, as after a crash mid-commit
+    journal.append(entry(service, "replay-0"))
+    journal.append(entry(service, "replay-taken", "JRNL-1"))
+    journal.append(entry(service, "replay-clash", "JRNL-1"))
+    journal.close()
+    with open(path, "ab") as f:
+        f.write(_encode(entry(service, "torn"))[:-10])
+
+    capture = OrderCapture(service.db, path)
+    try:
+        assert capture.start() == 6
+    finally:
+        capture.close()
+    assert os.path.getsize(path) == 0
+
+    for n in range(3):
+        assert service.capture_status(f"replay-{n}")["status"] == "committed"
+    assert service.capture_status("replay-taken")["order_number"] == "JRNL-1"
+    assert service.capture_status("replay-clash")["status"] == "rejected"
+    with service.db.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM order_header WHERE customer_ref = 'JRNL'").fetchone()[0] == 4
+
+
+def test_rejected_captures_are_kept(service, tmp_path):
+    outcomes = []
+    capture = OrderCapture(service.db, str(tmp_path / "orders.journal"), on_commit=outcomes.extend)
+    capture.start()
+    service.capture = capture
+    name = service.db.fetch_products()[0][1]
+    lines = [{"product": name, "quantity": 1}]
+    # Hold the write lock so nothing commits before both orders are in
+    writer = sqlite3.connect(service.db.path)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        # Both pass the check against orders on file; the second fails at commit
+        first = service.create_order("CAP-1", "C", "2024-04-02", lines, "cap-first")
+        second = service.create_order("CAP-1", "C", "2024-04-02", lines, "cap-second")
+        blank = service.create_order("", "C", "2024-04-02", lines)
+        assert first["queued"] and service.capture_status("cap-first")["status"] == "pending"
+        writer.rollback()
+        assert capture.flush(10)
+    finally:
+        writer.close()
+        capture.close()
+
+    assert service.capture_status("cap-first")["status"] == "committed"
+    rejected = service.capture_status(second["idempotency_key"])
+    assert rejected["status"] == "rejected" and rejected["order_number"] == "CAP-1"
+    assert [reject["idempotency_key"] for reject in service.capture_rejects()] == ["cap-second"]
+    assert service.capture_status(blank["idempotency_key"])["order_number"].isdigit()
+    assert capture.stats()["committed"] == 2 and capture.stats()["rejected"] == 1
+    assert sorted("error" in outcome for outcome in outcomes) == [False, False, True]
+    assert os.path.getsize(capture.journal.path) == 0
@@ -0,0 +1,41 @@
+import benchmark
+from money import Money
+
+
+def line(db):
+    product_id, _, price_cents = db.fetch_products()[0]
+    return {"product_id": product_id, "quantity": 1, "price": Money(price_cents), "discount": 0,
+            "subtotal": Money(price_cents)}
+
+
+def counter(db):
+    with db.connection() as conn:
+        return conn.execute("SELECT value FROM sequences WHERE name = 'order_number'").fetchone()[0]
+
+
+def test_bulk_insert_moves_the_counter_past_numeric_numbers(db):
+    start = counter(db)
+    numbers = [str(start + n) for n in range(1, 2001)] + ["ABC-1", "9" * 30]
+    assert db.insert_orders([(number, "BACKFILL", "2024-01-01", [line(db)]) for number in numbers]) == []
+    assert counter(db) == start + 2000
+
+    _, number, _ = db.place_order("C", "2024-01-02", [line(db)])
+    assert number == str(start + 2001)
+
+
+def test_typed_number_moves_the_counter(db):
+    start = counter(db)
+    db.place_order("C", "2024-01-02", [line(db)], order_number=str(start + 50))
+    db.place_order("C", "2024-01-02", [line(db)], order_number=str(start + 10))
+    assert counter(db) == start + 50
+    _, number, _ = db.place_order("C", "2024-01-02", [line(db)])
+    assert number == str(start + 51)
+
+
+def test_concurrent_writers_get_unique_gapless_numbers(db_path, db):
+    # Four processes saving at once, each replaying some of its idempotency keys
+    result = benchmark.bench_concurrent_writers(db_path, 4, 25, 1)
+    assert result["stored"] == 100
+    assert result["duplicates"] == 0
+    assert result["gaps"] == 0
+    assert result["replays_ok"]
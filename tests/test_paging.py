@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+from money import Money
+
+
+@pytest.fixture
+def paged(db):
+    product_id, _, price_cents = db.fetch_products()[0]
+    line = {"product_id": product_id, "quantity": 1, "price": Money(price_cents), "discount": 0,
+            "subtotal": Money(price_cents)}
+    rng = random.Random(3)
+    # Plenty of shared dates, and some undated orders
+    db.insert_orders([(f"PAGE-{n}", "C", rng.choice([None, "2024-01-01", "2024-01-02", "2024-02-10"]), [line])
+                      for n in range(230)])
+    with db.connection() as conn:
+        rows = conn.execute(f"{db._ORDER_COLUMNS} ORDER BY order_date IS NULL, order_date DESC, "
+                            "order_id DESC").fetchall()
+    return db, rows
+
+
+def test_keyset_paging_forward(paged):
+    db, expected = paged
+    seen = []
+    after = None
+    while True:
+        page = db.fetch_orders_page(after, 7)
+        seen += page
+        if len(page) < 7:
+            break
+        after = (page[-1][3], page[-1][0])
+    assert seen == expected
+
+
+def test_keyset_paging_backward(paged):
+    db, expected = paged
+    seen = []
+    before = (expected[-1][3], expected[-1][0])
+    while True:
+        page = db.fetch_orders_page_before(before, 9)
+        seen = page + seen
+        if len(page) < 9:
+            break
+        before = (page[0][3], page[0][0])
+    assert seen == expected[:-1]
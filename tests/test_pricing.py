@@ -0,0 +1,70 @@
+from datetime import date
+
+import pytest
+
+from money import Money
+from order_service import OrderService, PriceChangedError, ValidationError
+
+
+@pytest.fixture
+def service(db):
+    service = OrderService(db)
+    product = service.add_product("Pricing Widget", "10.00")
+    service.update_product(product.id, price="12.50", effective_from="2090-01-01")
+    return service
+
+
+def test_lines_are_priced_on_the_order_date(service):
+    assert service.build_item("Pricing Widget", 2, 0, "2089-12-31")["price"] == Money(1000)
+    assert service.build_item("Pricing Widget", 2, 0, "2090-01-01")["subtotal"] == Money(2500)
+    assert service.build_item("Pricing Widget", 1, 0, None)["price"] == Money(1000)
+    assert service.build_item("Pricing Widget", 1, 0, "")["price"] == Money(1000)
+
+
+@pytest.mark.parametrize("order_date", ["garbage", "05/01/2024", "2024-13-01", 5])
+def test_bad_order_dates_are_rejected(service, order_date):
+    with pytest.raises(ValidationError, match="YYYY-MM-DD"):
+        service.build_item("Pricing Widget", 1, 0, order_date)
+    with pytest.raises(ValidationError, match="YYYY-MM-DD"):
+        service.create_order("", "C", order_date, [{"product": "Pricing Widget", "quantity": 1}])
+
+
+def test_saved_order_keeps_its_date_price(service):
+    order = service.create_order("", "C", "2090-06-01 ", [{"product": "Pricing Widget", "quantity": 2}])
+    assert order["order_date"] == "2090-06-01"
+    assert service.get_order(order["order_number"])["total_amount"] == Money(2500)
+    assert service.get_order_details(order["order_number"])[0]["price"] == Money(1250)
+
+
+def test_changed_prices_refuse_the_save(service):
+    lines = [{"product": "Pricing Widget", "quantity": 1}]
+    with pytest.raises(PriceChangedError):
+        service.create_order("", "C", "2090-06-01", lines, expected_total=Money(1000))
+
+
+def test_reprice_products_by_id_and_name(service, db):
+    widget = service.catalog.find("Pricing Widget")
+    other_id, other_name, _ = db.fetch_products()[0]
+    assert service.reprice_products([(widget.id, "11.00"), (other_name, "3.00")], "2080-01-01") == 2
+    assert service.catalog.price_on(widget.id, "2080-01-01") == Money(1100)
+    assert service.catalog.price_on(widget.id, "2090-01-01") == Money(1250)
+    assert service.catalog.price_on(other_id, "2080-06-01") == Money(300)
+    assert service.current_price(widget) == Money(1000)
+    assert [entry["effective_from"] for entry in service.price_history(widget.id)][-2:] == ["2080-01-01",
+                                                                                             "2090-01-01"]
+
+
+@pytest.mark.parametrize("prices, effective_from", [
+    ([("No such product", "1.00")], None),
+    ([(["Pricing Widget"], "1.00")], None),
+    ([("Pricing Widget", "-1")], None),
+    ([("Pricing Widget", "1.00")], "01/02/2030"),
+    ([], None),
+])
+def test_reprice_products_checks_everything_first(service, prices, effective_from):
+    widget = service.catalog.find("Pricing Widget")
+    before = service.price_history(widget.id)
+    with pytest.raises(ValidationError):
+        service.reprice_products(prices, effective_from)
+    assert service.price_history(widget.id) == before
+    assert service.catalog.price_on(widget.id, date.today().isoformat()) == Money(1000)
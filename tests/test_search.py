@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from money import Money
+from order_service import OrderService, ValidationError
+
+
+@pytest.fixture
+def service(db):
+    products = [(db.add_product(name, Money(cents)), name, cents)
+                for name, cents in [("Blue Widget", 499), ("Red Widget", 1250), ("Gadget 100%", 2000),
+                                    ("Sprocket", 75)]]
+    rng = random.Random(5)
+    orders = []
+    for n in range(300):
+        lines = []
+        for product_id, _, price_cents in rng.sample(products, rng.randint(1, 3)):
+            quantity = rng.randint(1, 5)
+            lines.append({"product_id": product_id, "quantity": quantity, "price": Money(price_cents),
+                          "discount": 0, "subtotal": Money(price_cents) * quantity})
+        orders.append((f"SRCH-{n:04d}", rng.choice(["ACME 50%", "Acme_West", "Globex", None]),
+                       rng.choice([None, "2023-12-31", "2024-01-15", "2024-02-01"]), lines))
+    db.insert_orders(orders)
+    return OrderService(db)
+
+
+def everything(db):
+    # Every order with its product names, for checking filters by hand
+    with db.connection() as conn:
+        rows = conn.execute(f"{db._ORDER_COLUMNS} ORDER BY order_date IS NULL, order_date DESC, "
+                            "order_id DESC").fetchall()
+        names = {}
+        for order_id, name in conn.execute("SELECT od.order_id, p.name FROM order_detail od "
+                                           "JOIN products p ON p.id = od.product_id"):
+            names.setdefault(order_id, set()).add(name)
+    return [(row, names.get(row[0], set())) for row in rows]
+
+
+def search_all(service, filters):
+    found = []
+    after = None
+    while True:
+        page = service.list_orders(after=after, limit=50, filters=filters)
+        found += [order["order_id"] for order in page]
+        if len(page) < 50:
+            return found
+        after = (page[-1]["order_date"], page[-1]["order_id"])
+
+
+def matches(row, names, text="", date_from="", date_to="", min_total="", max_total="", product=""):
+    order_id, number, customer, order_date, total = row
+    if text and text.lower() not in number.lower() and text.lower() not in (customer or "").lower():
+        return False
+    if date_from and (order_date is None or order_date < date_from):
+        return False
+    if date_to and (order_date is None or order_date > date_to):
+        return False
+    if min_total and total < Money.parse(min_total).cents:
+        return False
+    if max_total and total > Money.parse(max_total).cents:
+        return False
+    return not product or any(product.lower() in name.lower() for name in names)
+
+
+SEARCHES = [
+    {"text": "SRCH-01"},
+    {"text": "acme"},
+    {"text": "50%"},
+    {"text": "_w"},
+    {"text": "SR"},
+    {"date_from": "2024-01-01", "date_to": "2024-01-31"},
+    {"min_total": "20", "max_total": "80.50"},
+    {"text": "srch", "date_from": "2024-01-15", "min_total": "10"},
+]
+
+
+@pytest.mark.parametrize("search", SEARCHES)
+@pytest.mark.parametrize("candidates", [5000, 3])
+def test_filters_match_a_scan(service, db, search, candidates):
+    # A candidate limit of 3 forces the paths that test every row instead
+    db.SEARCH_CANDIDATES = candidates
+    filters = service.order_filters(**search)
+    expected = [row[0] for row, names in everything(db) if matches(row, names, **search)]
+    assert expected
+    assert search_all(service, filters) == expected
+
+
+@pytest.mark.parametrize("candidates", [5000, 3])
+def test_product_filter(service, db, candidates):
+    db.SEARCH_CANDIDATES = candidates
+    for fragment in ("widget", "0%", "Sprocket"):
+        expected = [row[0] for row, names in everything(db) if matches(row, names, product=fragment)]
+        assert expected
+        assert search_all(service, service.order_filters(product=fragment)) == expected
+    assert service.list_orders(filters=service.order_filters(product="no product is called this")) == []
+
+
+@pytest.mark.parametrize("search", [{"date_from": "15/01/2024"}, {"min_total": "lots"}])
+def test_bad_filters_are_rejected(service, search):
+    with pytest.raises(ValidationError):
+        service.order_filters(**search)
+
+
+def test_blank_filters_are_unset(service):
+    assert service.order_filters(" ", "", None, "", None, "  ") == {}
@@ -0,0 +1,37 @@
+"""Cold-start budgets, each measured in a fresh interpreter."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import COLD_START_SCRIPT
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds
+IMPORT_BUDGET = 1000
+DATABASE_BUDGET = 2000
+WINDOW_BUDGET = 1000
+READY_BUDGET = 3000
+
+
+def test_headless_startup_budget(db_path):
+    # What the app imports, then what its background startup does; in seconds
+    out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT, db_path], cwd=ROOT,
+                         capture_output=True, text=True, check=True, timeout=60).stdout
+    timings = json.loads(out)
+    assert timings["import"] * 1000 < IMPORT_BUDGET
+    assert timings["database"] * 1000 < DATABASE_BUDGET
+
+
+def test_window_startup_budget(db_path):
+    run = subprocess.run([sys.executable, "order_system.py", db_path, "--startup-report"], cwd=ROOT,
+                         capture_output=True, text=True, timeout=60)
+    if run.returncode and "display" in run.stderr:
+        pytest.skip("Tk cannot open a display here")
+    assert run.returncode == 0, run.stderr
+    timings = json.loads(run.stdout)
+    assert timings["window"] < WINDOW_BUDGET
+    assert timings["ready"] < READY_BUDGET
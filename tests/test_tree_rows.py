@@ -0,0 +1,75 @@
+import random
+
+from tree_rows import TreeRows
+
+
+class FakeTree:
+    """Just enough of a ttk.Treeview, and its Tcl procs, for TreeRows."""
+
+    def __init__(self):
+        self.tk = self
+        self.rows = {}
+        self.children = []
+        self.calls = 0
+
+    def __str__(self):
+        return ".tree"
+
+    def eval(self, script):
+        pass
+
+    def call(self, *args):
+        if args[:2] == ("namespace", "exists"):
+            return 0
+        self.calls += 1
+        if args[0] == "::tree_rows::insert":
+            index, flat = args[2], args[3]
+            for iid, values in zip(flat[::2], flat[1::2]):
+                assert iid not in self.rows
+                self.rows[iid] = values
+                if index == "end":
+                    self.children.append(iid)
+                else:
+                    self.children.insert(index, iid)
+                    index += 1
+        else:
+            for iid, values in zip(args[2][::2], args[2][1::2]):
+                self.rows[iid] = values
+
+    def delete(self, *iids):
+        self.calls += 1
+        for iid in iids:
+            del self.rows[iid]
+            self.children.remove(iid)
+
+    def set_children(self, parent, *iids):
+        self.calls += 1
+        assert sorted(iids) == sorted(self.children)
+        self.children = list(iids)
+
+
+def test_tree_rows_sync_matches_rows():
+    rng = random.Random(7)
+    tree = FakeTree()
+    rows = TreeRows(tree)
+    for _ in range(200):
+        wanted = [(str(i), (i, rng.randint(0, 3))) for i in rng.sample(range(60), rng.randint(0, 40))]
+        rows.sync(wanted)
+        assert tree.children == [iid for iid, _ in wanted] == rows.order
+        assert {iid: tree.rows[iid] for iid in tree.children} == dict(wanted)
+
+    tree.calls = 0
+    rows.sync(wanted)
+    assert tree.calls == 0
+
+
+def test_tree_rows_insert_at_index_and_clear():
+    tree = FakeTree()
+    rows = TreeRows(tree)
+    rows.insert([("a", (1,)), ("d", (4,))])
+    rows.insert([("b", (2,)), ("c", (3,))], index=1)
+    assert tree.children == rows.order == ["a", "b", "c", "d"]
+    rows.delete(["b", "zz"])
+    assert tree.children == ["a", "c", "d"]
+    rows.clear()
+    assert tree.children == [] and len(rows) == 0
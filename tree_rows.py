@@ -0,0 +1,96 @@
+"""Keeps a ttk.Treeview in step with a list of rows without rebuilding it.
+
+Rows are (iid, values) pairs: iid is a string made from the record's
+primary key and values a tuple of display strings or numbers. sync()
+compares them with what was last drawn and only deletes, updates, inserts
+or reorders what changed; each of those is a single Tcl call however many
+rows it covers, so redrawing an unchanged list costs one dict comparison.
+"""
+
+# Loop over a flat {iid values iid values ...} list inside Tcl instead of
+# crossing from Python once per row
+_TCL_PROCS = """
+namespace eval ::tree_rows {
+    proc insert {tree index rows} {
+        foreach {iid values} $rows {
+            $tree insert {} $index -id $iid -values $values
+            if {$index ne "end"} { incr index }
+        }
+    }
+    proc update {tree rows} {
+        foreach {iid values} $rows {
+            $tree item $iid -values $values
+        }
+    }
+}
+"""
+
+
+class TreeRows:
+    def __init__(self, tree):
+        self.tree = tree
+        self.values = {}    # iid -> values tuple as last drawn
+        self.order = []     # iids top to bottom
+        if not int(tree.tk.call("namespace", "exists", "::tree_rows")):
+            tree.tk.eval(_TCL_PROCS)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, iid):
+        return iid in self.values
+
+    def _flat(self, rows):
+        flat = []
+        for iid, values in rows:
+            self.values[iid] = values
+            flat.append(iid)
+            flat.append(values)
+        return tuple(flat)
+
+    def insert(self, rows, index='end'):
+        """Add new rows at index ('end' or a position); returns their iids."""
+        if not rows:
+            return []
+        self.tree.tk.call("::tree_rows::insert", str(self.tree), index, self._flat(rows))
+        iids = [iid for iid, _ in rows]
+        if index == 'end':
+            self.order.extend(iids)
+        else:
+            self.order[index:index] = iids
+        return iids
+
+    def delete(self, iids):
+        iids = [iid for iid in iids if iid in self.values]
+        if not iids:
+            return
+        self.tree.delete(*iids)
+        for iid in iids:
+            del self.values[iid]
+        gone = set(iids)
+        self.order = [iid for iid in self.order if iid not in gone]
+
+    def clear(self):
+        self.delete(list(self.order))
+
+    def sync(self, rows):
+        """Make the tree show exactly rows, in order, touching only what changed."""
+        wanted = dict(rows)
+
+        removed = [iid for iid in self.order if iid not in wanted]
+        if removed:
+            self.delete(removed)
+
+        changed = [(iid, values) for iid, values in rows
+                   if iid in self.values and self.values[iid] != values]
+        if changed:
+            self.tree.tk.call("::tree_rows::update", str(self.tree), self._flat(changed))
+
+        added = [(iid, values) for iid, values in rows if iid not in self.values]
+        if added:
+            self.insert(added)
+
+        order = [iid for iid, _ in rows]
+        if order != self.order:
+            self.tree.set_children('', *order)
+            self.order = order
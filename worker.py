@@ -0,0 +1,133 @@
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics, row_count
+
+
+class Job:
+    __slots__ = ("key", "on_done", "on_error", "owner", "cancelled", "name")
+
+    def __init__(self, key, on_done, on_error, owner, name):
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.owner = owner
+        self.cancelled = False
+        self.name = name
+
+    def cancel(self):
+        # A running job still finishes, but its callbacks are dropped
+        self.cancelled = True
+
+
+class DbWorker:
+    """Runs database work on background threads and reports back on the Tk thread.
+
+    Worker threads never touch Tk. Results go into a queue that the Tk thread
+    drains from a root.after() poll while any job is pending. Submitting a job
+    with the same key as an unfinished one cancels the older job.
+    """
+
+    POLL_MS = 20
+
+    def __init__(self, widget, max_workers=2):
+        self.widget = widget
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="db-worker")
+        self.results = queue.SimpleQueue()
+        self.latest = {}
+        self.pending = 0
+        self.polling = False
+        self.busy_listeners = []
+
+    @property
+    def busy(self):
+        return self.pending > 0
+
+    def add_busy_listener(self, callback):
+        self.busy_listeners.append(callback)
+
+    def submit(self, func, *args, on_done=None, on_error=None, key=None, owner=None, name=None):
+        """Run func(*args) in the background.
+
+        on_done(result) or on_error(exception) is then called on the Tk thread,
+        unless the job was cancelled or owner (a widget) has been destroyed.
+        name labels the job in the metrics (default: func's qualified name).
+        """
+        job = Job(key, on_done, on_error, owner, name or getattr(func, "__qualname__", repr(func)))
+        if key is not None:
+            previous = self.latest.get(key)
+            if previous is not None:
+                previous.cancel()
+            self.latest[key] = job
+
+        self.pending += 1
+        if self.pending == 1:
+            self._notify_busy(True)
+        self.executor.submit(self._run, job, func, args)
+        if not self.polling:
+            self.polling = True
+            self.widget.after(self.POLL_MS, self._poll)
+        return job
+
+    def cancel(self, key):
+        job = self.latest.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def shutdown(self):
+        for job in self.latest.values():
+            job.cancel()
+        self.executor.shutdown(wait=True)
+
+    def _run(self, job, func, args):
+        # Worker thread
+        if job.cancelled:
+            self.results.put((job, None, None))
+            return
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.results.put((job, None, e))
+            return
+        if metrics.enabled:
+            metrics.record("db", job.name, time.perf_counter() - started, row_count(result))
+        self.results.put((job, result, None))
+
+    def _poll(self):
+        # Tk thread
+        while True:
+            try:
+                job, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending -= 1
+            if job.key is not None and self.latest.get(job.key) is job:
+                del self.latest[job.key]
+            if job.cancelled or (job.owner is not None and not job.owner.winfo_exists()):
+                continue
+            if error is not None:
+                if job.on_error is not None:
+                    job.on_error(error)
+                else:
+                    self.widget.report_callback_exception(type(error), error, error.__traceback__)
+            elif job.on_done is not None:
+                if metrics.enabled:
+                    # Time spent on the Tk thread applying the result
+                    started = time.perf_counter()
+                    job.on_done(result)
+                    metrics.record("ui", job.name, time.perf_counter() - started, row_count(result))
+                else:
+                    job.on_done(result)
+
+        if self.pending:
+            self.widget.after(self.POLL_MS, self._poll)
+        else:
+            self.polling = False
+            self._notify_busy(False)
+
+    def _notify_busy(self, busy):
+        for callback in self.busy_listeners:
+            callback(busy)
+